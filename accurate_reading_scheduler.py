@@ -0,0 +1,82 @@
+import numpy as np
+
+
+class ModuleReadingState:
+    def __init__(self, interval: float) -> None:
+        self.interval: float = interval  # seconds
+        self.last_request_time: float = 0.0
+        self.next_request_time: float | None = None
+        self.last_voltages: np.ndarray | None = None
+        self.last_complete_time: float | None = None
+
+        self.round_trips: int = 0
+        self.last_round_trip: float = 0.0
+        self.max_round_trip: float = 0.0
+        self.total_round_trip: float = 0.0
+
+    def record_round_trip(self, round_trip: float) -> None:
+        self.round_trips += 1
+        self.last_round_trip = round_trip
+        self.total_round_trip += round_trip
+        self.max_round_trip = max(self.max_round_trip, round_trip)
+
+    def mean_round_trip(self) -> float:
+        return self.total_round_trip / self.round_trips if self.round_trips > 0 else 0.0
+
+    def as_dict(self) -> dict[str, float]:
+        return {'interval': self.interval, 'round_trips': self.round_trips, 'last_round_trip': self.last_round_trip,
+                'max_round_trip': self.max_round_trip, 'mean_round_trip': self.mean_round_trip()}
+
+
+class AccurateReadingScheduler:
+    # Spreads the accurate-reading requests of one round over a window instead of asking every module in the same
+    # instant. The minimum time between two requests of a module follows how fast its accurate readings change,
+    # while balancing it is always the shortest.
+    VOLTAGE_CHANGE_PER_REQUEST: float = 0.002  # V
+
+    def __init__(self, module_ids: list[int], min_interval: float, max_interval: float,
+                 stagger_window: float) -> None:
+        assert 0 < min_interval <= max_interval
+        self.min_interval: float = min_interval  # seconds
+        self.max_interval: float = max_interval  # seconds
+        self.stagger_window: float = stagger_window  # seconds
+        self.modules: dict[int, ModuleReadingState] = {module_id: ModuleReadingState(max_interval)
+                                                       for module_id in module_ids}
+
+    def wants_request(self, module_id: int, now: float, balancing: bool) -> bool:
+        state = self.modules[module_id]
+        interval = self.min_interval if balancing else state.interval
+        return state.next_request_time is None and now - state.last_request_time > interval
+
+    def stagger(self, module_ids: list[int], now: float) -> None:
+        if not module_ids:
+            return
+        spacing = self.stagger_window / len(module_ids)
+        for i, module_id in enumerate(module_ids):
+            self.modules[module_id].next_request_time = now + i * spacing
+
+    def next_request_time(self) -> float | None:
+        times = [state.next_request_time for state in self.modules.values() if state.next_request_time is not None]
+        return min(times) if times else None
+
+    def pop_due(self, now: float) -> list[int]:
+        due = []
+        for module_id, state in self.modules.items():
+            if state.next_request_time is not None and state.next_request_time <= now:
+                state.next_request_time = None
+                state.last_request_time = now
+                due.append(module_id)
+        return due
+
+    def on_readings_complete(self, module_id: int, voltages: np.ndarray, now: float) -> None:
+        state = self.modules[module_id]
+        state.record_round_trip(now - state.last_request_time)
+        if state.last_voltages is not None and now > state.last_complete_time:
+            rate = float(np.max(np.abs(voltages - state.last_voltages))) / (now - state.last_complete_time)  # V/s
+            interval = self.VOLTAGE_CHANGE_PER_REQUEST / rate if rate > 0 else self.max_interval
+            state.interval = min(max(interval, self.min_interval), self.max_interval)
+        state.last_voltages = np.array(voltages, dtype=np.float64)
+        state.last_complete_time = now
+
+    def statistics_dict(self) -> dict[int, dict[str, float]]:
+        return {module_id: state.as_dict() for module_id, state in self.modules.items()}
@@ -0,0 +1,5 @@
+from callback_registry import CallbackRegistry
+
+
+class AccurateReadingsEvent(CallbackRegistry):
+    __events__ = ('on_accurate_readings_complete',)
@@ -0,0 +1,108 @@
+import math
+
+
+class AggregateTree:
+    # Segment tree keeping sum, min and max (with the flat index of the extreme) over a fixed number of leaves
+    def __init__(self, number_of_leaves: int) -> None:
+        self.number_of_leaves: int = number_of_leaves
+        self._size: int = 1
+        while self._size < number_of_leaves:
+            self._size *= 2
+        self._sum: list[float] = [0.0] * (2 * self._size)
+        self._min: list[float] = [math.inf] * (2 * self._size)
+        self._max: list[float] = [-math.inf] * (2 * self._size)
+        self._min_index: list[int] = [-1] * (2 * self._size)
+        self._max_index: list[int] = [-1] * (2 * self._size)
+
+    def _combine(self, position: int) -> None:
+        left = 2 * position
+        right = left + 1
+        self._sum[position] = self._sum[left] + self._sum[right]
+        if self._min[right] < self._min[left]:
+            self._min[position] = self._min[right]
+            self._min_index[position] = self._min_index[right]
+        else:
+            self._min[position] = self._min[left]
+            self._min_index[position] = self._min_index[left]
+        if self._max[right] > self._max[left]:
+            self._max[position] = self._max[right]
+            self._max_index[position] = self._max_index[right]
+        else:
+            self._max[position] = self._max[left]
+            self._max_index[position] = self._max_index[left]
+
+    def set_leaf(self, leaf: int, total: float, minimum: float, min_index: int, maximum: float, max_index: int) -> None:
+        position = leaf + self._size
+        self._sum[position] = total
+        self._min[position] = minimum
+        self._min_index[position] = min_index
+        self._max[position] = maximum
+        self._max_index[position] = max_index
+        position //= 2
+        while position > 0:
+            self._combine(position)
+            position //= 2
+
+    def set_leaves(self, values: list[float], first_index: int) -> None:
+        for leaf, value in enumerate(values):
+            position = leaf + self._size
+            self._sum[position] = value
+            self._min[position] = value
+            self._max[position] = value
+            self._min_index[position] = first_index + leaf
+            self._max_index[position] = first_index + leaf
+        for position in range(self._size - 1, 0, -1):
+            self._combine(position)
+
+    def sum(self) -> float:
+        return self._sum[1]
+
+    def min(self) -> float:
+        return self._min[1]
+
+    def max(self) -> float:
+        return self._max[1]
+
+    def min_index(self) -> int:
+        return self._min_index[1]
+
+    def max_index(self) -> int:
+        return self._max_index[1]
+
+
+class HierarchicalAggregate:
+    # Per-group trees over their leaves plus one tree over the group roots, every update costs O(log n)
+    def __init__(self, number_of_groups: int, leaves_per_group: int) -> None:
+        self.leaves_per_group: int = leaves_per_group
+        self.groups: list[AggregateTree] = [AggregateTree(leaves_per_group) for _ in range(number_of_groups)]
+        self.total: AggregateTree = AggregateTree(number_of_groups)
+        self._initialized: list[bool] = [False] * (number_of_groups * leaves_per_group)
+        self._group_initialized: list[int] = [0] * number_of_groups
+        self._number_initialized: int = 0
+
+    def update(self, index: int, value: float) -> None:
+        group_id, leaf = divmod(index, self.leaves_per_group)
+        if not self._initialized[index]:
+            self._initialized[index] = True
+            self._group_initialized[group_id] += 1
+            self._number_initialized += 1
+        group = self.groups[group_id]
+        group.set_leaf(leaf, value, value, index, value, index)
+        self.total.set_leaf(group_id, group.sum(), group.min(), group.min_index(), group.max(), group.max_index())
+
+    def update_group(self, group_id: int, values: list[float]) -> None:
+        assert len(values) == self.leaves_per_group
+        first_index = group_id * self.leaves_per_group
+        if self._group_initialized[group_id] != self.leaves_per_group:
+            self._number_initialized += self.leaves_per_group - self._group_initialized[group_id]
+            self._group_initialized[group_id] = self.leaves_per_group
+            self._initialized[first_index:first_index + self.leaves_per_group] = [True] * self.leaves_per_group
+        group = self.groups[group_id]
+        group.set_leaves(values, first_index)
+        self.total.set_leaf(group_id, group.sum(), group.min(), group.min_index(), group.max(), group.max_index())
+
+    def group_complete(self, group_id: int) -> bool:
+        return self._group_initialized[group_id] == self.leaves_per_group
+
+    def complete(self) -> bool:
+        return self._number_initialized == len(self._initialized)
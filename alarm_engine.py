@@ -0,0 +1,113 @@
+from collections import deque
+from enum import IntEnum
+from typing import Callable, TextIO
+
+
+class AlarmLevel(IntEnum):
+    NORMAL = 0
+    WARNING = 1
+    CRITICAL = 2
+    IMPLAUSIBLE = 3
+
+
+class LogSink:
+    # Collects log lines without locking or I/O, flush() writes them out from a task on its own lane.
+    # When nobody flushes, the oldest lines are dropped.
+    def __init__(self, max_lines: int = 1000, stream: TextIO | None = None) -> None:
+        self._lines: deque[str] = deque(maxlen=max_lines)
+        self.stream: TextIO | None = stream  # stdout when None
+        self.dropped: int = 0
+
+    def log(self, line: str) -> None:
+        if len(self._lines) == self._lines.maxlen:
+            self.dropped += 1
+        self._lines.append(line)
+
+    def flush(self) -> int:
+        lines = []
+        while True:
+            try:
+                lines.append(self._lines.popleft())
+            except IndexError:
+                break
+        if lines:
+            print('\n'.join(lines), file=self.stream, flush=True)
+        return len(lines)
+
+
+class AlarmEngine:
+    # Edge-triggered alarm state per watched measurement. A sample at the current level only resets the debounce
+    # counter, a different level has to be seen debounce samples in a row before it is entered. Dropping to a lower
+    # level additionally waits hold_off seconds after the last transition. Only transitions reach the log sink.
+    DEFAULT_DEBOUNCE: int = 3  # samples
+    DEFAULT_HOLD_OFF: float = 30.0  # seconds
+
+    def __init__(self, sink: LogSink, debounce: int = DEFAULT_DEBOUNCE, hold_off: float = DEFAULT_HOLD_OFF) -> None:
+        assert debounce >= 1
+        self.sink: LogSink = sink
+        self.debounce: int = debounce
+        self.hold_off: float = hold_off
+
+        # One slot per source, parallel lists keep the per-sample work to a few index operations
+        self.levels: list[int] = []
+        self._candidates: list[int] = []
+        self._counts: list[int] = []
+        self._since: list[float] = []
+        self._describe: list[Callable[[], str]] = []
+
+        self.transitions: dict[str, int] = {'enter': 0, 'escalate': 0, 'deescalate': 0, 'clear': 0}
+
+    def watch(self, measurement, describe: Callable[[], str]) -> int:
+        slot = len(self.levels)
+        self.levels.append(AlarmLevel.NORMAL)
+        self._candidates.append(AlarmLevel.NORMAL)
+        self._counts.append(0)
+        self._since.append(float('-inf'))
+        self._describe.append(describe)
+        measurement.alarm_engine = self
+        measurement.alarm_slot = slot
+        return slot
+
+    def observe(self, slot: int, level: int, now: float) -> None:
+        if level == self.levels[slot]:
+            self._counts[slot] = 0
+            return
+        if level == self._candidates[slot]:
+            self._counts[slot] += 1
+        else:
+            self._candidates[slot] = level
+            self._counts[slot] = 1
+        if self._counts[slot] < self.debounce:
+            return
+        previous = self.levels[slot]
+        if level < previous and now - self._since[slot] < self.hold_off:
+            return
+        self.levels[slot] = level
+        self._counts[slot] = 0
+        self._since[slot] = now
+        self._transition(slot, previous, level)
+
+    def _transition(self, slot: int, previous: int, level: int) -> None:
+        if previous == AlarmLevel.NORMAL:
+            kind = 'enter'
+        elif level == AlarmLevel.NORMAL:
+            kind = 'clear'
+        elif level > previous:
+            kind = 'escalate'
+        else:
+            kind = 'deescalate'
+        self.transitions[kind] += 1
+        if kind == 'clear':
+            self.sink.log(f'[CLEARED {AlarmLevel(previous).name}] {self._describe[slot]()}')
+        else:
+            self.sink.log(f'[{AlarmLevel(level).name}] {self._describe[slot]()}')
+
+    def active(self) -> dict[str, int]:
+        counts = {level.name: 0 for level in AlarmLevel if level != AlarmLevel.NORMAL}
+        for level in self.levels:
+            if level != AlarmLevel.NORMAL:
+                counts[AlarmLevel(level).name] += 1
+        return counts
+
+    def statistics_dict(self) -> dict[str, dict[str, int]]:
+        return {'active': self.active(), 'transitions': dict(self.transitions), 'log_dropped': self.sink.dropped}
@@ -0,0 +1,135 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
+import paho.mqtt.client as mqtt
+
+from periodic_scheduler import PeriodicTask
+from slave_communicator import SlaveCommunicator
+
+
+class AsyncRuntime:
+    # Drives the MQTT client, message handling and the periodic tasks from a single asyncio event loop. Only the
+    # EXECUTOR_LANES get a dedicated thread each: the heartbeat and the safety checks must keep their period while
+    # the loop is busy, and they only read published snapshots and deadline queues. Every other lane, the log lane
+    # included, runs on the loop with the balancer and ingest state it reads.
+    EXECUTOR_LANES: tuple[str, ...] = ('heartbeat', 'safety')
+    MQTT_MISC_INTERVAL: float = 1.0  # seconds
+    MQTT_RECONNECT_DELAY: float = 5.0  # seconds
+
+    def __init__(self, slave_communicator: SlaveCommunicator) -> None:
+        self._slave_communicator: SlaveCommunicator = slave_communicator
+        self.tasks: dict[str, PeriodicTask] = {}
+        self._running_tasks: dict[str, asyncio.Task] = {}
+        self._executors: dict[str, ThreadPoolExecutor] = {}
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._loop_thread_id: int | None = None
+        self._publish_pending: asyncio.Event | None = None
+
+    def add_task(self, name: str, action: Callable[[], None], period: float, initial_delay: float = 0.0,
+                 lane: str = PeriodicTask.MAIN_LANE) -> None:
+        self.tasks[name] = PeriodicTask(name, action, period, initial_delay, lane)
+        if lane in self.EXECUTOR_LANES and lane not in self._executors:
+            self._executors[lane] = ThreadPoolExecutor(max_workers=1, thread_name_prefix=lane)
+
+    def cancel(self, name: str) -> None:
+        running_task = self._running_tasks.get(name)
+        if running_task is not None:
+            running_task.cancel()
+
+    def stop(self) -> None:
+        for running_task in self._running_tasks.values():
+            running_task.cancel()
+
+    def statistics_dict(self) -> dict[str, dict]:
+        return {name: task.statistics.as_dict() for name, task in self.tasks.items()}
+
+    async def run(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._publish_pending = asyncio.Event()
+        self._attach_mqtt_client()
+        self._slave_communicator.connect()
+
+        self._running_tasks['mqtt'] = asyncio.create_task(self._mqtt_misc_loop(), name='mqtt')
+        self._running_tasks['publish'] = asyncio.create_task(self._publish_loop(), name='publish')
+        now = self._loop.time()
+        for task in self.tasks.values():
+            task.start(now)
+            self._running_tasks[task.name] = asyncio.create_task(self._run_periodic(task), name=task.name)
+        try:
+            await asyncio.gather(*self._running_tasks.values(), return_exceptions=True)
+        finally:
+            self.stop()
+            for executor in self._executors.values():
+                executor.shutdown(wait=True)
+
+    async def _run_periodic(self, task: PeriodicTask) -> None:
+        executor = self._executors.get(task.lane)
+        while True:
+            await asyncio.sleep(max(0.0, task.next_deadline - self._loop.time()))
+            start = self._loop.time()
+            if executor is None:
+                task.run()
+            else:
+                await self._loop.run_in_executor(executor, task.run)
+            end = self._loop.time()
+            task.statistics.record_run(end - start, start - task.next_deadline)
+            task.schedule_next(end)
+
+    def _call_in_loop(self, callback: Callable[..., Any], *args: Any) -> None:
+        # paho calls back from whichever thread publishes, the lane executors included
+        if threading.get_ident() == self._loop_thread_id:
+            callback(*args)
+        else:
+            self._loop.call_soon_threadsafe(callback, *args)
+
+    def _attach_mqtt_client(self) -> None:
+        client = self._slave_communicator.mqtt_client
+        client.on_socket_open = self._on_socket_open
+        client.on_socket_close = self._on_socket_close
+        client.on_socket_register_write = self._on_socket_register_write
+        client.on_socket_unregister_write = self._on_socket_unregister_write
+        self._slave_communicator.publish_scheduler.on_pending = self._on_publish_pending
+
+    def _on_socket_open(self, client: mqtt.Client, userdata: Any, sock) -> None:
+        self._call_in_loop(self._loop.add_reader, sock, self._on_socket_readable)
+
+    def _on_socket_close(self, client: mqtt.Client, userdata: Any, sock) -> None:
+        self._call_in_loop(self._loop.remove_reader, sock)
+
+    def _on_socket_register_write(self, client: mqtt.Client, userdata: Any, sock) -> None:
+        self._call_in_loop(self._loop.add_writer, sock, client.loop_write)
+
+    def _on_socket_unregister_write(self, client: mqtt.Client, userdata: Any, sock) -> None:
+        self._call_in_loop(self._loop.remove_writer, sock)
+
+    def _on_socket_readable(self) -> None:
+        self._slave_communicator.mqtt_client.loop_read()
+        self._slave_communicator.ingest_queue.process_pending()
+
+    def _on_publish_pending(self) -> None:
+        self._call_in_loop(self._publish_pending.set)
+
+    async def _mqtt_misc_loop(self) -> None:
+        client = self._slave_communicator.mqtt_client
+        while True:
+            if client.loop_misc() == mqtt.MQTT_ERR_SUCCESS:
+                await asyncio.sleep(self.MQTT_MISC_INTERVAL)
+                continue
+            await asyncio.sleep(self.MQTT_RECONNECT_DELAY)
+            try:
+                client.reconnect()
+            except OSError as e:
+                print('mqtt reconnect failed', e, flush=True)
+
+    async def _publish_loop(self) -> None:
+        publish_scheduler = self._slave_communicator.publish_scheduler
+        while True:
+            self._publish_pending.clear()
+            wait = publish_scheduler.process_pending()
+            try:
+                await asyncio.wait_for(self._publish_pending.wait(), timeout=wait)
+            except asyncio.TimeoutError:
+                pass
@@ -0,0 +1,60 @@
+import numpy as np
+
+from battery_cell import BatteryCell
+from soc_curve import SocCurve
+
+
+class BalancePlan:
+    def __init__(self, cells: list[BatteryCell], start_voltages: np.ndarray, planned_voltages: np.ndarray,
+                 balance_times: np.ndarray, target_voltage: float) -> None:
+        self.cells: list[BatteryCell] = cells
+        self.start_voltages: np.ndarray = start_voltages
+        self.planned_voltages: np.ndarray = planned_voltages
+        self.balance_times: np.ndarray = balance_times  # seconds
+        self.target_voltage: float = target_voltage
+
+    def __len__(self) -> int:
+        return len(self.cells)
+
+    def report(self, achieved_voltages: np.ndarray, cell_diff: float) -> dict[str, float]:
+        # Compares the planned voltage drop of every bled cell with the drop seen in the following accurate readings
+        planned_delta = self.start_voltages - self.planned_voltages
+        achieved_delta = self.start_voltages - achieved_voltages
+        error = achieved_delta - planned_delta
+        return {'cells': len(self.cells), 'target_voltage': self.target_voltage,
+                'max_balance_time': float(np.max(self.balance_times, initial=0.0)),
+                'planned_delta': float(np.mean(planned_delta)) if len(self) > 0 else 0.0,
+                'achieved_delta': float(np.mean(achieved_delta)) if len(self) > 0 else 0.0,
+                'max_error': float(np.max(np.abs(error), initial=0.0)), 'cell_diff': cell_diff}
+
+
+class ProportionalBalancePlanner:
+    # Sizes the balance time of every cell from its excess charge over the target, so one round should be enough to
+    # reach the target instead of bleeding every high cell for the same time.
+    DEFAULT_CELL_CAPACITY: float = 10.0  # Ah
+    DEFAULT_BLEED_CURRENT: float = 0.1  # A
+    DEFAULT_MAX_BALANCE_TIME: float = 600.0  # seconds
+    MIN_BALANCE_TIME: float = 1.0  # seconds
+
+    def __init__(self, cell_capacity: float = DEFAULT_CELL_CAPACITY, bleed_current: float = DEFAULT_BLEED_CURRENT,
+                 max_balance_time: float = DEFAULT_MAX_BALANCE_TIME) -> None:
+        assert cell_capacity > 0 and bleed_current > 0 and max_balance_time > 0
+        self.cell_capacity: float = cell_capacity
+        self.bleed_current: float = bleed_current
+        self.max_balance_time: float = max_balance_time
+
+    def plan(self, cells: list[BatteryCell], accurate_voltages: np.ndarray, target_voltage: float) -> BalancePlan:
+        accurate_voltages = np.asarray(accurate_voltages, dtype=np.float64)
+        target_soc = SocCurve.voltage_to_soc_many(np.array([target_voltage]))[0]
+        excess_soc = np.maximum(SocCurve.voltage_to_soc_many(accurate_voltages) - target_soc, 0.0)
+        excess_charge = excess_soc * self.cell_capacity * 3600.0  # As
+        balance_times = np.minimum(excess_charge / self.bleed_current, self.max_balance_time)
+
+        selected = np.flatnonzero(balance_times >= self.MIN_BALANCE_TIME)
+        balance_times = np.round(balance_times[selected])
+        start_voltages = accurate_voltages[selected]
+        planned_socs = (SocCurve.voltage_to_soc_many(start_voltages)
+                        - balance_times * self.bleed_current / (self.cell_capacity * 3600.0))
+        planned_voltages = SocCurve.soc_to_voltage_many(np.clip(planned_socs, 0.0, 1.0))
+        return BalancePlan([cells[i] for i in selected], start_voltages, planned_voltages, balance_times,
+                           target_voltage)
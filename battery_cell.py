@@ -1,7 +1,7 @@
-import time
-from events import Events
+from callback_registry import CallbackRegistry
 
 
+from cell_state_store import CellStateStore
 from soc_curve import SocCurve
 from measurement import Measurement
 from measurement import MeasurementEvent
@@ -9,6 +9,9 @@ from measurement import MeasurementLimits
 
 
 class BatteryCell:
+    __slots__ = ('store', 'index', 'voltage', 'accurate_voltage', 'id', 'module_id', '_communication_event',
+                 '_balance_event')
+
     LOWER_VOLTAGE_LIMIT_IMPLAUSIBLE: float = 0  # V
     UPPER_VOLTAGE_LIMIT_IMPLAUSIBLE: float = 10  # V
     LOWER_VOLTAGE_LIMIT_CRITICAL: float = 3.0  # V
@@ -27,17 +30,63 @@ class BatteryCell:
     DEFAULT_RELAX_TIME: float = 1.0  # Seconds
     INTERNAL_IMPEDANCE: float = 0.000975  # Ohm, for 2P cells
 
-    def __init__(self, cell_id: int, module_id: int) -> None:
-        self.voltage: Measurement = Measurement(self, self.limits)
-        self.accurate_voltage: Measurement = Measurement(self, self.limits)
-        self.balance_pin_state: bool or None = False
+    soc_curve: SocCurve = SocCurve()  # stateless, shared by all cells
+
+    def __init__(self, cell_id: int, module_id: int, store: CellStateStore | None = None, index: int = 0) -> None:
+        if store is None:
+            store = CellStateStore(1, 1)
+            index = 0
+        self.store: CellStateStore = store
+        self.index: int = index
+        self.voltage: Measurement = Measurement(self, self.limits, columns=store.voltage, index=index,
+                                                clock=store.clock)
+        self.accurate_voltage: Measurement = Measurement(self, self.limits, columns=store.accurate_voltage,
+                                                         index=index, clock=store.clock)
+        self.balance_pin_state = False
         self.id: int = cell_id
         self.module_id: int = module_id
-        self.communication_event: Events = Events(events=('send_balance_request',))
-        self.soc_curve: SocCurve = SocCurve()
-        self.last_discharge_time: float = 0
+        # Created on first access, cells without handlers never allocate them
+        self._communication_event: CallbackRegistry | None = None
+        self._balance_event: CallbackRegistry | None = None
+        self.last_discharge_time = 0
         self.relax_time = self.DEFAULT_RELAX_TIME
 
+    @property
+    def communication_event(self) -> CallbackRegistry:
+        if self._communication_event is None:
+            self._communication_event = CallbackRegistry(events=('send_balance_request',))
+        return self._communication_event
+
+    @property
+    def balance_event(self) -> CallbackRegistry:
+        if self._balance_event is None:
+            self._balance_event = CallbackRegistry(events=('on_balance_stopped',))
+        return self._balance_event
+
+    @property
+    def balance_pin_state(self) -> bool:
+        return bool(self.store.balance_pin_state[self.index])
+
+    @balance_pin_state.setter
+    def balance_pin_state(self, value: bool) -> None:
+        self.store.balance_pin_state[self.index] = value
+
+    @property
+    def last_discharge_time(self) -> float:
+        return float(self.store.last_discharge_time[self.index])
+
+    @last_discharge_time.setter
+    def last_discharge_time(self, value: float) -> None:
+        self.store.last_discharge_time[self.index] = value
+
+    @property
+    def relax_time(self) -> float:
+        return float(self.store.relax_time[self.index])
+
+    @relax_time.setter
+    def relax_time(self, value: float) -> None:
+        self.store.relax_time[self.index] = value
+
     def __str__(self):
         return f'Module{self.module_id} Cell{self.id}: {self.voltage.value:.2f}V Balance:{self.balance_pin_state}'
 
@@ -51,7 +100,7 @@ class BatteryCell:
         return self.soc_curve.voltage_to_soc(self.voltage.value)
 
     def is_relaxing(self) -> bool:
-        now: float = time.time()
+        now: float = self.store.clock()
         return (now - self.last_discharge_time) < self.relax_time
 
     def start_balance_discharge(self, balance_time: float) -> None:
@@ -63,7 +112,9 @@ class BatteryCell:
     def on_balance_discharged_stopped(self) -> None:
         if self.balance_pin_state:
             self.balance_pin_state = False
-            self.last_discharge_time = time.time()
+            self.last_discharge_time = self.store.clock()
+            if self._balance_event is not None:
+                self._balance_event.on_balance_stopped(self)
 
     def is_balance_discharging(self) -> bool:
         return self.balance_pin_state
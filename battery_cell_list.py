@@ -1,51 +1,146 @@
-import time
+from typing import Callable, Iterable
+
+import numpy as np
 
 from battery_cell import BatteryCell
+from cell_state_store import CellStateStore
+from pack_snapshot import PackSnapshot
+from virtual_clock import wall_clock
 
 
 class BatteryCellList(list[BatteryCell]):
+    def __init__(self, cells: Iterable[BatteryCell] = (), store: CellStateStore | None = None,
+                 indices: np.ndarray | None = None, snapshot: PackSnapshot | None = None) -> None:
+        super().__init__(cells)
+        self._store: CellStateStore | None = store
+        self._indices: np.ndarray | None = indices
+        # Measurements are read from this snapshot when set, otherwise from each store's latest one
+        self._snapshot: PackSnapshot | None = snapshot
+
+    @property
+    def snapshot(self) -> PackSnapshot | None:
+        return self._snapshot
+
+    def sort(self, *args, **kwargs) -> None:
+        super().sort(*args, **kwargs)
+        self._indices = None
+
+    def _view(self) -> tuple[CellStateStore, np.ndarray] | None:
+        if self._indices is None or len(self._indices) != len(self):
+            if len(set(id(cell.store) for cell in self.__iter__())) > 1:
+                return None
+            self._store = self[0].store if len(self) > 0 else CellStateStore(0, 0)
+            self._indices = np.fromiter((cell.index for cell in self.__iter__()), dtype=np.intp, count=len(self))
+        return self._store, self._indices
+
+    def _now(self) -> float:
+        return self[0].store.clock() if len(self) > 0 else wall_clock()
+
+    def _column(self, column: Callable[[CellStateStore], np.ndarray]) -> np.ndarray:
+        view = self._view()
+        if view is None:
+            return np.array([column(cell.store)[cell.index] for cell in self.__iter__()])
+        store, indices = view
+        return column(store)[indices]
+
+    def _input_column(self, column: Callable[[PackSnapshot], np.ndarray],
+                      snapshot: PackSnapshot | None = None) -> np.ndarray:
+        # From the given snapshot, else the list's own, else each store's latest one
+        if snapshot is None:
+            snapshot = self.snapshot
+        if snapshot is not None:
+            return self._column(lambda store: column(snapshot))
+        return self._column(lambda store: column(store.snapshot))
+
+    @staticmethod
+    def _initialized(values: np.ndarray) -> np.ndarray:
+        if np.isnan(values).any():
+            raise TypeError('cell voltage not initialized')
+        return values
+
+    def _voltages(self, snapshot: PackSnapshot | None = None) -> np.ndarray:
+        return self._initialized(self._input_column(lambda s: s.voltage.value, snapshot))
+
+    def _accurate_voltages(self, snapshot: PackSnapshot | None = None) -> np.ndarray:
+        return self._initialized(self._input_column(lambda s: s.accurate_voltage.value, snapshot))
+
+    def _select(self, mask: np.ndarray) -> list[BatteryCell]:
+        return [self[i] for i in np.flatnonzero(mask)]
+
     def in_relax_time(self) -> bool:
-        return any(cell.is_relaxing() for cell in self.__iter__())
+        last_discharge_time = self._column(lambda store: store.last_discharge_time)
+        relax_time = self._column(lambda store: store.relax_time)
+        return bool(np.any((self._now() - last_discharge_time) < relax_time))
+
+    def relax_end_time(self) -> float:
+        if len(self) == 0:
+            return 0.0
+        last_discharge_time = self._column(lambda store: store.last_discharge_time)
+        relax_time = self._column(lambda store: store.relax_time)
+        return float(np.max(last_discharge_time + relax_time))
 
     def set_relax_time(self, seconds: float):
-        for cell in self.__iter__():
-            cell.relax_time = seconds
+        view = self._view()
+        if view is None:
+            for cell in self.__iter__():
+                cell.relax_time = seconds
+        else:
+            store, indices = view
+            store.relax_time[indices] = seconds
 
     def currently_balancing(self) -> bool:
-        return any(cell.is_balance_discharging() for cell in self.__iter__())
+        return bool(np.any(self._column(lambda store: store.balance_pin_state)))
 
-    def highest_voltage(self) -> float:
-        return max(cell.voltage.value for cell in self.__iter__())
+    def highest_voltage(self, snapshot: PackSnapshot | None = None) -> float:
+        return float(np.max(self._voltages(snapshot)))
 
-    def highest_accurate_voltage(self) -> float:
-        return max(cell.accurate_voltage.value for cell in self.__iter__())
+    def highest_accurate_voltage(self, snapshot: PackSnapshot | None = None) -> float:
+        return float(np.max(self._accurate_voltages(snapshot)))
 
-    def lowest_voltage(self) -> float:
-        return min(cell.voltage.value for cell in self.__iter__())
+    def lowest_voltage(self, snapshot: PackSnapshot | None = None) -> float:
+        return float(np.min(self._voltages(snapshot)))
 
-    def lowest_accurate_voltage(self) -> float:
-        return min(cell.accurate_voltage.value for cell in self.__iter__())
+    def lowest_accurate_voltage(self, snapshot: PackSnapshot | None = None) -> float:
+        return float(np.min(self._accurate_voltages(snapshot)))
 
-    def with_voltage_above(self, value: float) -> list[BatteryCell]:
-        return [cell for cell in self.__iter__() if cell.voltage.value > value]
+    def with_voltage_above(self, value: float, snapshot: PackSnapshot | None = None) -> list[BatteryCell]:
+        return self._select(self._voltages(snapshot) > value)
 
-    def with_accurate_voltage_above(self, value: float) -> list[BatteryCell]:
-        return [cell for cell in self.__iter__() if cell.accurate_voltage.value > value]
+    def with_accurate_voltage_above(self, value: float, snapshot: PackSnapshot | None = None) -> list[BatteryCell]:
+        return self._select(self._accurate_voltages(snapshot) > value)
 
     def highest_soc(self) -> float:
-        return max(cell.soc() for cell in self.__iter__())
+        # voltage_to_soc is monotonic, so the extreme cell voltage gives the extreme soc
+        return self[0].soc_curve.voltage_to_soc(self.highest_voltage())
 
     def lowest_soc(self) -> float:
-        return min(cell.soc() for cell in self.__iter__())
+        return self[0].soc_curve.voltage_to_soc(self.lowest_voltage())
 
     def max_diff(self) -> float:
-        return self.highest_voltage() - self.lowest_voltage()
+        voltages = self._voltages()
+        return float(np.max(voltages) - np.min(voltages))
+
+    def _voltage_older_than(self, seconds: float) -> np.ndarray:
+        timestamps = self._input_column(lambda s: s.voltage.timestamp)
+        return np.isnan(timestamps) | (self._now() - timestamps > seconds)
 
     def has_voltage_older_than(self, seconds: float) -> bool:
-        return any(not cell.voltage.initialized() or cell.voltage.age_seconds() > seconds for cell in self.__iter__())
+        return bool(np.any(self._voltage_older_than(seconds)))
 
     def with_voltage_older_than(self, seconds: float) -> list[BatteryCell]:
-        return [cell for cell in self.__iter__() if not cell.voltage.initialized() or cell.voltage.age_seconds() > seconds]
+        return self._select(self._voltage_older_than(seconds))
+
+    def has_accurate_readings_older_than(self, seconds: float, snapshot: PackSnapshot | None = None) -> bool:
+        voltage_timestamps = self._input_column(lambda s: s.voltage.timestamp, snapshot)
+        accurate_timestamps = self._input_column(lambda s: s.accurate_voltage.timestamp, snapshot)
+        older = np.isnan(voltage_timestamps) | ~(self._now() - accurate_timestamps <= seconds)
+        return bool(np.any(older))
+
+
+class ReadOnlyBatteryCellList(BatteryCellList):
+    # Cached view shared between callers, every list mutator raises
+    def _read_only(self, *args, **kwargs):
+        raise TypeError('ReadOnlyBatteryCellList does not support modification')
 
-    def has_accurate_readings_older_than(self, seconds: float) -> bool:
-        return any(not cell.voltage.initialized() or cell.accurate_voltage.age_seconds() > seconds for cell in self.__iter__())
+    append = extend = insert = remove = pop = clear = sort = reverse = _read_only
+    __setitem__ = __delitem__ = __iadd__ = __imul__ = _read_only
@@ -1,57 +1,74 @@
-import time
-
+from alarm_engine import AlarmEngine
+from alarm_engine import LogSink
 from battery_cell import BatteryCell
-from battery_cell_list import BatteryCellList
 # from heartbeat_event import HeartbeatEvent
 from battery_module import BatteryModule
 from battery_system import BatterySystem
 from battery_system_balancer import BatterySystemBalancer
+from measurement import Measurement
 from slave_communicator import SlaveCommunicator
 
 
 class BatteryManager:
     ESP_TIMEOUT_WARNING_SECONDS: int = 60
     ESP_TIMEOUT_CRITICAL_SECONDS: int = 120 * 60
+    ESP_TIMEOUT_STARTUP_SECONDS: int = 20  # cells that never reported are critical this long after startup
 
-    def __init__(self, battery_system: BatterySystem, slave_communicator: SlaveCommunicator) -> None:
+    def __init__(self, battery_system: BatterySystem, slave_communicator: SlaveCommunicator,
+                 config: dict | None = None) -> None:
         self.battery_system: BatterySystem = battery_system
         self.slave_communicator: SlaveCommunicator = slave_communicator
-        self.balancer = BatterySystemBalancer(battery_system, slave_communicator)
+        self.balancer = BatterySystemBalancer(battery_system, slave_communicator, config)
+        self.log_sink: LogSink = battery_system.log_sink
+        self.alarms = AlarmEngine(self.log_sink)
 
         # Register battery system event handlers
-        self.battery_system.voltage.event.on_critical += self.on_critical_battery_system_voltage
-        self.battery_system.voltage.event.on_warning += self.on_battery_system_voltage_warning
-        self.battery_system.voltage.event.on_implausible += self.on_implausible_battery_system_voltage
-
-        self.battery_system.current.event.on_critical += self.on_critical_battery_system_current
-        self.battery_system.current.event.on_warning += self.on_battery_system_current_warning
-        self.battery_system.current.event.on_implausible += self.on_implausible_battery_system_current
+        system = self.battery_system
+        system.voltage.event.on_critical += self.on_critical_battery_system_voltage
+        system.voltage.event.on_implausible += self.on_implausible_battery_system_voltage
+        self.alarms.watch(system.voltage, lambda: f'battery system voltage: {system.voltage.value}V')
+
+        system.current.event.on_critical += self.on_critical_battery_system_current
+        system.current.event.on_implausible += self.on_implausible_battery_system_current
+        self.alarms.watch(system.current, lambda: f'battery system current: {system.current.value}A')
+
+        # Re-armed on every cell voltage update, fire when a cell got no update for the timeout
+        deadline_tracker = self.battery_system.deadline_tracker
+        self.cell_voltage_warning_deadline = deadline_tracker.add_queue(self.ESP_TIMEOUT_WARNING_SECONDS,
+                                                                        self.on_cell_voltage_timeout_warning)
+        self.cell_voltage_critical_deadline = deadline_tracker.add_queue(self.ESP_TIMEOUT_CRITICAL_SECONDS,
+                                                                         self.on_critical_cell_voltage_timeout)
+        startup_time = deadline_tracker.clock()
 
         # Register battery module event handlers
         for module in self.battery_system.battery_modules:
             module.heartbeat_event.on_heartbeat_missed += self.on_heartbeat_missed
             module.heartbeat_event.on_heartbeat += self.on_heartbeat
 
-            module.module_temp1.event.on_critical += self.on_critical_module_temperature
-            module.module_temp1.event.on_warning += self.on_module_temperature_warning
-            module.module_temp1.event.on_implausible += self.on_implausible_module_temperature
-
-            module.module_temp2.event.on_critical += self.on_critical_module_temperature
-            module.module_temp2.event.on_warning += self.on_module_temperature_warning
-            module.module_temp2.event.on_implausible += self.on_implausible_module_temperature
+            for module_temp in (module.module_temp1, module.module_temp2):
+                module_temp.event.on_critical += self.on_critical_module_temperature
+                module_temp.event.on_implausible += self.on_implausible_module_temperature
+                self.alarms.watch(module_temp, lambda m=module, t=module_temp:
+                                  f'module temperature on module {m.id}: {t.value}°C')
 
             module.chip_temp.event.on_critical += self.on_critical_chip_temperature
-            module.chip_temp.event.on_warning += self.on_chip_temperature_warning
             module.chip_temp.event.on_implausible += self.on_implausible_chip_temperature
+            self.alarms.watch(module.chip_temp,
+                              lambda m=module: f'chip temperature on module {m.id}: {m.chip_temp.value}°C')
 
             module.voltage.event.on_critical += self.on_critical_module_voltage
-            module.voltage.event.on_warning += self.on_module_voltage_warning
             module.voltage.event.on_implausible += self.on_implausible_module_voltage
+            self.alarms.watch(module.voltage, lambda m=module: f'module voltage on module {m.id}: {m.voltage.value}V')
 
             for cell in module.cells:
                 cell.voltage.event.on_critical += self.on_critical_cell_voltage
-                cell.voltage.event.on_warning += self.on_cell_voltage_warning
                 cell.voltage.event.on_implausible += self.on_implausible_cell_voltage
+                self.alarms.watch(cell.voltage, lambda c=cell: f'cell voltage on module {c.module_id}, cell {c.id}: '
+                                                               f'{c.voltage.value}V')
+
+                cell.voltage.deadlines += (self.cell_voltage_warning_deadline, self.cell_voltage_critical_deadline)
+                self.cell_voltage_critical_deadline.arm_initial(
+                    cell.voltage, startup_time + self.ESP_TIMEOUT_STARTUP_SECONDS)
 
         self.allow_charge: bool = True
         self.allow_discharge: bool = True
@@ -60,10 +77,10 @@ class BatteryManager:
         self.balancer.balance()
 
     def set_limits(self):
-        min_temp: float = self.battery_system.lowest_module_temp()
-        cells: BatteryCellList = self.battery_system.cells()
-        lowest_voltage: float = cells.lowest_voltage()
-        highest_voltage: float = cells.highest_voltage()
+        snapshot = self.battery_system.cell_store.snapshot
+        min_temp: float = snapshot.lowest_module_temp()
+        lowest_voltage: float = snapshot.lowest_cell_voltage()
+        highest_voltage: float = snapshot.highest_cell_voltage()
         if lowest_voltage <= BatteryCell.soc_to_voltage(0.15):
             self.allow_discharge = False
             self.slave_communicator.send_discharge_limit(self.allow_discharge)
@@ -77,124 +94,83 @@ class BatteryManager:
             self.allow_charge = True
             self.slave_communicator.send_charge_limit(self.allow_charge)
 
-    def check_cell_voltage_times(self):
-        timeout_cells = self.battery_system.cells().with_voltage_older_than(self.ESP_TIMEOUT_CRITICAL_SECONDS)
-        if len(timeout_cells) > 0:
-            message = f'[CRITICAL] following cells got no update: {time.time()}\n'
-            message += '\n'.join([f'Module{cell.module_id} Cell{cell.id}: {cell.voltage.timestamp}' for cell in timeout_cells])
-            print(message, flush=True)
-            self.trigger_safety_disconnect(message)
-            return
-
-        timeout_cells = self.battery_system.cells().with_voltage_older_than(self.ESP_TIMEOUT_WARNING_SECONDS)
-        if len(timeout_cells) > 0:
-            message = f'[WARNING] following cells got no update: {time.time()}\n'
-            message += '\n'.join([f'Module{cell.module_id} Cell{cell.id}: {cell.voltage.timestamp}' for cell in timeout_cells])
-            print(message, flush=True)
-
     def trigger_safety_disconnect(self, reason: str) -> None:
+        self.log_sink.log(reason)
         self.slave_communicator.open_battery_relays(reason)
 
-    # Event handling for critical events
+    # Critical and implausible samples only count towards a safety disconnect here, the alarm engine logs transitions
+
     def on_critical_battery_system_voltage(self, system: BatterySystem) -> None:
-        message = f'[CRITICAL] battery system voltage: {system.voltage.value}V'
-        print(message, flush=True)
         if system.voltage.critical_counter > 4:
-            self.trigger_safety_disconnect(message)
+            self.trigger_safety_disconnect(f'[CRITICAL] battery system voltage: {system.voltage.value}V')
 
     def on_critical_battery_system_current(self, system: BatterySystem) -> None:
-        message = f'[CRITICAL] battery system current: {system.current.value}A'
-        print(message, flush=True)
         if system.current.critical_counter > 4:
-            self.trigger_safety_disconnect(message)
+            self.trigger_safety_disconnect(f'[CRITICAL] battery system current: {system.current.value}A')
 
     def on_critical_module_temperature(self, module: BatteryModule) -> None:
-        message = f'[CRITICAL] module temperature on module {module.id}: {module.module_temp1.value}°C, {module.module_temp2.value}°C'
-        print(message, flush=True)
         if module.module_temp1.critical_counter > 4 or module.module_temp2.critical_counter > 4:
-            self.trigger_safety_disconnect(message)
+            self.trigger_safety_disconnect(f'[CRITICAL] module temperature on module {module.id}: '
+                                           f'{module.module_temp1.value}°C, {module.module_temp2.value}°C')
 
     def on_critical_chip_temperature(self, module: BatteryModule) -> None:
-        message = f'[CRITICAL] chip temperature on module {module.id}: {module.chip_temp.value}°C'
-        print(message, flush=True)
         if module.chip_temp.critical_counter > 4:
-            self.trigger_safety_disconnect(message)
+            self.trigger_safety_disconnect(
+                f'[CRITICAL] chip temperature on module {module.id}: {module.chip_temp.value}°C')
 
     def on_critical_module_voltage(self, module: BatteryModule) -> None:
-        message = f'[CRITICAL] module voltage on module {module.id}: {module.voltage.value}V'
-        print(message, flush=True)
         if module.voltage.critical_counter > 4:
-            self.trigger_safety_disconnect(message)
+            self.trigger_safety_disconnect(f'[CRITICAL] module voltage on module {module.id}: {module.voltage.value}V')
 
     def on_critical_cell_voltage(self, cell: BatteryCell) -> None:
-        message = f'[CRITICAL] cell voltage on module {cell.module_id}, cell {cell.id}: {cell.voltage.value}V'
-        print(message, flush=True)
         if cell.voltage.critical_counter > 4:
-            self.trigger_safety_disconnect(message)
-
-    # Event handling for warning events
-
-    def on_battery_system_voltage_warning(self, system: BatterySystem) -> None:
-        print(f'[WARNING] battery system voltage: {system.voltage.value}V')
-
-    def on_battery_system_current_warning(self, system: BatterySystem) -> None:
-        print(f'[WARNING] battery system current: {system.current.value}A')
-
-    def on_module_temperature_warning(self, module: BatteryModule) -> None:
-        print(f'[WARNING] module temperature on module {module.id}: {module.module_temp1.value}°C, {module.module_temp2.value}°C')
-
-    def on_chip_temperature_warning(self, module: BatteryModule) -> None:
-        print(f'[WARNING] chip temperature on module {module.id}: {module.chip_temp.value}°C')
-
-    def on_module_voltage_warning(self, module: BatteryModule) -> None:
-        print(f'[WARNING] module voltage on module {module.id}: {module.voltage.value}V')
+            self.trigger_safety_disconnect(
+                f'[CRITICAL] cell voltage on module {cell.module_id}, cell {cell.id}: {cell.voltage.value}V')
 
-    def on_cell_voltage_warning(self, cell: BatteryCell) -> None:
-        print(f'[WARNING] cell voltage on module {cell.module_id}, cell {cell.id}: {cell.voltage.value}V')
+    def on_critical_cell_voltage_timeout(self, voltages: list[Measurement]) -> None:
+        message = f'[CRITICAL] following cells got no update: {self.battery_system.clock()}\n'
+        message += '\n'.join([f'Module{voltage.owner.module_id} Cell{voltage.owner.id}: {voltage.timestamp}'
+                              for voltage in voltages])
+        self.trigger_safety_disconnect(message)
 
-    # Event handling for implausible values
-    # notify user of implausible state and shut off the system
+    def on_cell_voltage_timeout_warning(self, voltages: list[Measurement]) -> None:
+        message = f'[WARNING] following cells got no update: {self.battery_system.clock()}\n'
+        message += '\n'.join([f'Module{voltage.owner.module_id} Cell{voltage.owner.id}: {voltage.timestamp}'
+                              for voltage in voltages])
+        self.log_sink.log(message)
 
     def on_implausible_battery_system_voltage(self, system: BatterySystem) -> None:
-        message = f'[IMPLAUSIBLE] battery system voltage: {system.voltage.value}V'
-        print(message, flush=True)
         if system.voltage.implausible_counter > 20:
-            self.trigger_safety_disconnect(message)
+            self.trigger_safety_disconnect(f'[IMPLAUSIBLE] battery system voltage: {system.voltage.value}V')
 
     def on_implausible_battery_system_current(self, system: BatterySystem) -> None:
-        message = f'[IMPLAUSIBLE] battery system current: {system.current.value}A'
-        print(message, flush=True)
         if system.current.implausible_counter > 20:
-            self.trigger_safety_disconnect(message)
+            self.trigger_safety_disconnect(f'[IMPLAUSIBLE] battery system current: {system.current.value}A')
 
     def on_implausible_module_temperature(self, module: BatteryModule) -> None:
-        message = f'[IMPLAUSIBLE] module temperature on module {module.id}: {module.module_temp1.value}°C, {module.module_temp2.value}°C'
-        print(message, flush=True)
         if module.module_temp1.implausible_counter > 20 or module.module_temp2.implausible_counter > 20:
-            self.trigger_safety_disconnect(message)
+            self.trigger_safety_disconnect(f'[IMPLAUSIBLE] module temperature on module {module.id}: '
+                                           f'{module.module_temp1.value}°C, {module.module_temp2.value}°C')
 
     def on_implausible_chip_temperature(self, module: BatteryModule) -> None:
-        message = f'[IMPLAUSIBLE] chip temperature on module {module.id}: {module.chip_temp.value}°C'
-        print(message, flush=True)
         if module.chip_temp.implausible_counter > 20:
-            self.trigger_safety_disconnect(message)
+            self.trigger_safety_disconnect(
+                f'[IMPLAUSIBLE] chip temperature on module {module.id}: {module.chip_temp.value}°C')
 
     def on_implausible_module_voltage(self, module: BatteryModule) -> None:
-        message = f'[IMPLAUSIBLE] module voltage on module {module.id}: {module.voltage.value}V'
-        print(message, flush=True)
         if module.voltage.implausible_counter > 20:
-            self.trigger_safety_disconnect(message)
+            self.trigger_safety_disconnect(
+                f'[IMPLAUSIBLE] module voltage on module {module.id}: {module.voltage.value}V')
 
     def on_implausible_cell_voltage(self, cell: BatteryCell) -> None:
-        message = f'[IMPLAUSIBLE] cell voltage on module {cell.module_id}, cell {cell.id}: {cell.voltage.value}V'
-        print(message, flush=True)
         if cell.voltage.implausible_counter > 20:
-            self.trigger_safety_disconnect(message)
+            self.trigger_safety_disconnect(
+                f'[IMPLAUSIBLE] cell voltage on module {cell.module_id}, cell {cell.id}: {cell.voltage.value}V')
 
     # Other event handlers
 
     def on_heartbeat_missed(self, module: BatteryModule) -> None:
-        print(f'Heartbeat missed on module: {module.id})')
+        self.log_sink.log(f'Heartbeat missed on module: {module.id})')
 
     def on_heartbeat(self, module: BatteryModule) -> None:
         # print(f'Got heartbeat on module: {module.id}')
@@ -1,10 +1,17 @@
-import time
+from functools import partial
 from typing import List
 
+import numpy as np
+
+from accurate_readings_event import AccurateReadingsEvent
+from aggregate_tree import AggregateTree
 from battery_cell import BatteryCell
+from cell_state_store import CellStateStore
+from deadline_tracker import DeadlineQueue
 from heartbeat_event import HeartbeatEvent
 from measurement import MeasurementLimits
 from measurement import Measurement
+from soc_curve import SocCurve
 
 
 class BatteryModule:
@@ -43,7 +50,7 @@ class BatteryModule:
 
     ESP_TIMEOUT: float = 20.000  # Seconds
 
-    def __init__(self, module_id: int, number_of_serial_cells: int) -> None:
+    def __init__(self, module_id: int, number_of_serial_cells: int, store: CellStateStore | None = None) -> None:
         self.voltage_limits = MeasurementLimits()
         self.voltage_limits.implausible_lower = self.LOWER_VOLTAGE_LIMIT_IMPLAUSIBLE
         self.voltage_limits.implausible_upper = self.UPPER_VOLTAGE_LIMIT_IMPLAUSIBLE
@@ -51,10 +58,24 @@ class BatteryModule:
         self.voltage_limits.critical_upper = number_of_serial_cells * BatteryCell.UPPER_VOLTAGE_LIMIT_CRITICAL
         self.voltage_limits.warning_lower = number_of_serial_cells * BatteryCell.LOWER_VOLTAGE_LIMIT_WARNING
         self.voltage_limits.warning_upper = number_of_serial_cells * BatteryCell.UPPER_VOLTAGE_LIMIT_WARNING
-        self.voltage: Measurement = Measurement(self, self.voltage_limits)
-        self.module_temp1: Measurement = Measurement(self, self.module_temp_limits)
-        self.module_temp2: Measurement = Measurement(self, self.module_temp_limits)
-        self.chip_temp: Measurement = Measurement(self, self.chip_temp_limits)
+
+        if store is None:
+            store = CellStateStore(1, number_of_serial_cells)
+            module_row = 0
+        else:
+            module_row = module_id
+        self.store: CellStateStore = store
+        self.cell_indices: np.ndarray = store.module_indices([module_row])
+        self.cell_voltage_aggregate: AggregateTree = store.voltage.aggregate.groups[module_row]
+        self._module_row: int = module_row
+
+        temp_index = module_row * CellStateStore.TEMPS_PER_MODULE
+        self.voltage: Measurement = Measurement(self, self.voltage_limits, clock=store.clock)
+        self.module_temp1: Measurement = Measurement(self, self.module_temp_limits,
+                                                     columns=store.module_temp, index=temp_index, clock=store.clock)
+        self.module_temp2: Measurement = Measurement(self, self.module_temp_limits,
+                                                     columns=store.module_temp, index=temp_index + 1, clock=store.clock)
+        self.chip_temp: Measurement = Measurement(self, self.chip_temp_limits, clock=store.clock)
 
         # Uninitialized
 
@@ -62,16 +83,20 @@ class BatteryModule:
         self.last_esp_uptime_in_own_time: float or None = None
 
         self.id = module_id
-        self.keep_monitoring_heartbeats: bool = True
         self.last_accurate_reading_request_time: float = 0
+        self.accurate_readings_pending: bool = False
 
         # Events
         self.heartbeat_event = HeartbeatEvent()
+        self.heartbeat_deadline: DeadlineQueue | None = None
+        self.accurate_readings_event = AccurateReadingsEvent()
 
         self.cells: List[BatteryCell] = []
         for i in range(0, number_of_serial_cells):
-            new_cell = BatteryCell(i, self.id)
+            new_cell = BatteryCell(i, self.id, store, store.flat_index(module_row, i))
             self.cells.append(new_cell)
+        self._cell_voltages: list[Measurement] = [cell.voltage for cell in self.cells]
+        self._cell_accurate_voltages: list[Measurement] = [cell.accurate_voltage for cell in self.cells]
 
     def __str__(self):
         cell_numbers_string = ''
@@ -85,19 +110,6 @@ class BatteryModule:
         return f'Module {self.id}: {self.voltage.value:.2f}V ' \
                f'{self.module_temp1.value}°C {self.module_temp2.value}°C Cells:\n{cells_string}'
 
-    def check_heartbeat(self):
-        if self.last_esp_uptime_in_own_time is None:
-            print(f'ESP-Module {self.id} last uptime not initialized!')
-            return
-        own_time: float = time.time()
-        if own_time - self.last_esp_uptime_in_own_time > self.ESP_TIMEOUT:
-            self.heartbeat_event.on_heartbeat_missed(self)
-
-    def heartbeat_monitor_thread(self):
-        while self.keep_monitoring_heartbeats:
-            self.check_heartbeat()
-            time.sleep(1000)
-
     def temp(self) -> float:
         return (self.module_temp1.value + self.module_temp2.value) / 2.0
 
@@ -108,18 +120,66 @@ class BatteryModule:
         return max(self.module_temp1.value, self.module_temp2.value)
 
     def load_adjusted_soc(self, current: float) -> float:
-        return sum(cell.load_adjusted_soc(current) for cell in self.cells) / len(self.cells)
+        voltages = self.store.voltage.value[self.cell_indices] + BatteryCell.INTERNAL_IMPEDANCE * current
+        return sum(SocCurve.voltage_to_soc_many(voltages).tolist()) / len(self.cells)
 
     def soc(self) -> float:
-        return sum(cell.soc() for cell in self.cells) / len(self.cells)
+        return sum(SocCurve.voltage_to_soc_many(self.store.voltage.value[self.cell_indices]).tolist()) / len(self.cells)
+
+    def update_cell_voltages(self, voltages: list[float], accurate: bool = False) -> None:
+        assert len(voltages) == len(self.cells)
+        if accurate:
+            Measurement.update_group(self._cell_accurate_voltages, voltages, self.store.accurate_voltage,
+                                     self._module_row)
+            self._check_accurate_readings_complete()
+        else:
+            Measurement.update_group(self._cell_voltages, voltages, self.store.voltage, self._module_row)
+
+    def update_module_temps(self, temp1: float, temp2: float) -> None:
+        with self.store.batch():
+            self.module_temp1.update(temp1)
+            self.module_temp2.update(temp2)
+
+    def set_balance_pin_states(self, cell_ids: list[int], state: bool) -> None:
+        self.store.balance_pin_state[self.cell_indices[cell_ids]] = state
+
+    def update_accurate_cell_voltage(self, cell: BatteryCell, voltage: float) -> None:
+        cell.accurate_voltage.update(voltage)
+        self._check_accurate_readings_complete()
+
+    def accurate_readings_requested(self) -> None:
+        self.last_accurate_reading_request_time = self.store.clock()
+        self.accurate_readings_pending = True
+
+    def _check_accurate_readings_complete(self) -> None:
+        # Fires once per request, as soon as every cell delivered an accurate reading newer than the request
+        if not self.accurate_readings_pending:
+            return
+        timestamps = self.store.accurate_voltage.timestamp[self.cell_indices]
+        if np.all(timestamps >= self.last_accurate_reading_request_time):
+            self.accurate_readings_pending = False
+            # Handlers read the published snapshot, which only has these readings once the ingest batch ends
+            self.store.after_publish(partial(self.accurate_readings_event.on_accurate_readings_complete, self))
 
     def update_esp_uptime(self, esp_uptime: int) -> None:
         self.last_esp_uptime = esp_uptime
-        self.last_esp_uptime_in_own_time = time.time()
+        self.last_esp_uptime_in_own_time = self.store.clock()
+        if self.heartbeat_deadline is not None:
+            self.heartbeat_deadline.arm(self, self.last_esp_uptime_in_own_time)
         self.heartbeat_event.on_heartbeat(self)
 
+    def _check_cell_voltages_initialized(self) -> None:
+        if not self.store.voltage.aggregate.group_complete(self._module_row):
+            raise TypeError(f'cell voltages of module {self.id} not initialized')
+
     def min_voltage_cell(self) -> BatteryCell:
-        return min(self.cells, key=lambda x: x.voltage)
+        self._check_cell_voltages_initialized()
+        return self.cells[self.cell_voltage_aggregate.min_index() - self.cell_indices[0]]
 
     def max_voltage_cell(self) -> BatteryCell:
-        return max(self.cells, key=lambda x: x.voltage)
+        self._check_cell_voltages_initialized()
+        return self.cells[self.cell_voltage_aggregate.max_index() - self.cell_indices[0]]
+
+    def cell_voltage_sum(self) -> float:
+        self._check_cell_voltages_initialized()
+        return self.cell_voltage_aggregate.sum()
@@ -1,11 +1,21 @@
 import time
-from typing import List
+from typing import Callable, List
 
+import numpy as np
+
+from aggregate_tree import AggregateTree
+from alarm_engine import LogSink
 from battery_cell import BatteryCell
-from battery_cell_list import BatteryCellList
+from battery_cell_list import ReadOnlyBatteryCellList
 from battery_module import BatteryModule
+from cell_state_store import CellStateStore
+from deadline_tracker import DeadlineQueue
+from deadline_tracker import DeadlineTracker
 from measurement import MeasurementLimits
 from measurement import Measurement
+from rolling_window import RollingWindow
+from soc_curve import SocCurve
+from virtual_clock import wall_clock
 
 
 class BatterySystem:
@@ -28,9 +38,12 @@ class BatterySystem:
     current_limits.warning_upper = UPPER_CURRENT_LIMIT_WARNING
 
     SLIDING_WINDOW_TIME: float = 180.0  # seconds
+    SLIDING_WINDOW_MAX_SAMPLES: int = 1024
 
-    def __init__(self, number_of_modules: int, number_of_serial_cells: int) -> None:
+    def __init__(self, number_of_modules: int, number_of_serial_cells: int,
+                 deadline_tracker: DeadlineTracker | None = None, clock: Callable[[], float] = wall_clock) -> None:
         assert 1 <= number_of_modules <= 16
+        self.clock: Callable[[], float] = clock
 
         cells_total = number_of_modules * number_of_serial_cells
         self.voltage_limits = MeasurementLimits()
@@ -41,15 +54,37 @@ class BatterySystem:
         self.voltage_limits.warning_lower = cells_total * BatteryCell.LOWER_VOLTAGE_LIMIT_WARNING
         self.voltage_limits.warning_upper = cells_total * BatteryCell.UPPER_VOLTAGE_LIMIT_WARNING
 
-        self.voltage: Measurement = Measurement(self, self.voltage_limits)
-        self.current: Measurement = Measurement(self, self.current_limits, 0)
+        self.voltage: Measurement = Measurement(self, self.voltage_limits, clock=clock)
+        self.current: Measurement = Measurement(self, self.current_limits, 0, clock=clock)
+
+        self.log_sink: LogSink = LogSink()  # flushed by BatteryManager's flush_log task
+
+        if deadline_tracker is None:
+            deadline_tracker = DeadlineTracker(clock)
+        self.deadline_tracker: DeadlineTracker = deadline_tracker
+        self.heartbeat_deadline: DeadlineQueue = self.deadline_tracker.add_queue(BatteryModule.ESP_TIMEOUT,
+                                                                                 self.on_heartbeats_expired)
+        startup_time = self.deadline_tracker.clock()
 
+        self.cell_store: CellStateStore = CellStateStore(number_of_modules, number_of_serial_cells, clock)
         self.battery_modules: List[BatteryModule] = []
         for module_id in range(0, number_of_modules):
-            module = BatteryModule(module_id, number_of_serial_cells)
+            module = BatteryModule(module_id, number_of_serial_cells, self.cell_store)
+            module.heartbeat_deadline = self.heartbeat_deadline
+            self.heartbeat_deadline.arm_initial(module, startup_time + BatteryModule.ESP_TIMEOUT)
             self.battery_modules.append(module)
-
-        self.sliding_window_soc_values = []
+        # Fixed for the lifetime of the system, cells() hands out this one view instead of rebuilding it
+        self.cell_index: tuple[BatteryCell, ...] = tuple(cell for module in self.battery_modules
+                                                         for cell in module.cells)
+        self.cell_indices: np.ndarray = np.arange(len(self.cell_store))
+        self.cell_indices.setflags(write=False)
+        self._cells: ReadOnlyBatteryCellList = ReadOnlyBatteryCellList(self.cell_index, self.cell_store,
+                                                                       self.cell_indices)
+
+        # Wall time can step (NTP), the window keeps a monotonic clock unless a virtual or test clock is injected
+        window_clock = time.monotonic if clock is wall_clock else clock
+        self.sliding_window_soc_values = RollingWindow(self.SLIDING_WINDOW_TIME, self.SLIDING_WINDOW_MAX_SAMPLES,
+                                                       window_clock)
 
     def __str__(self):
         modules_string = ''
@@ -76,42 +111,79 @@ class BatterySystem:
         except TypeError:
             return f'System: {self.voltage.value}V {self.current.value}A Modules:\n{modules_string}'
 
-    def check_heartbeats(self):
-        for battery_module in self.battery_modules:
-            battery_module.check_heartbeat()
+    def check_deadlines(self) -> None:
+        # Fires the timeout callbacks of every source that went stale since the last call
+        self.deadline_tracker.poll()
+
+    def on_heartbeats_expired(self, modules: list[BatteryModule]) -> None:
+        for module in modules:
+            if module.last_esp_uptime_in_own_time is None:
+                self.log_sink.log(f'ESP-Module {module.id} last uptime not initialized!')
+            else:
+                module.heartbeat_event.on_heartbeat_missed(module)
+
+    def _cell_voltage_aggregate(self) -> AggregateTree:
+        aggregate = self.cell_store.voltage.aggregate
+        if not aggregate.complete():
+            raise TypeError('cell voltage not initialized')
+        return aggregate.total
+
+    def _module_temp_aggregate(self) -> AggregateTree:
+        aggregate = self.cell_store.module_temp.aggregate
+        if not aggregate.complete():
+            raise TypeError('module temperature not initialized')
+        return aggregate.total
+
+    def _cell_voltages(self) -> np.ndarray:
+        voltages = self.cell_store.voltage.value
+        if np.isnan(voltages).any():
+            raise TypeError('cell voltage not initialized')
+        return voltages
 
     def load_adjusted_calculated_voltage(self) -> float:
-        return sum(cell.load_adjusted_voltage(self.current.value) for cell in self.cells())
+        return self.calculated_voltage() + len(self.cell_store) * BatteryCell.INTERNAL_IMPEDANCE * self.current.value
 
     def calculated_voltage(self) -> float:
-        return sum(cell.voltage.value for cell in self.cells())
+        return self._cell_voltage_aggregate().sum()
+
+    def lowest_cell_voltage(self) -> float:
+        return self._cell_voltage_aggregate().min()
+
+    def highest_cell_voltage(self) -> float:
+        return self._cell_voltage_aggregate().max()
+
+    def max_cell_diff(self) -> float:
+        aggregate = self._cell_voltage_aggregate()
+        return aggregate.max() - aggregate.min()
 
     def temp(self) -> float:
-        return sum(battery_modules.temp() for battery_modules in self.battery_modules) / len(self.battery_modules)
+        return self._module_temp_aggregate().sum() / len(self.cell_store.module_temp.value)
 
     def sliding_window_soc(self) -> float:
-        self.sliding_window_soc_values.append((time.time(), self.load_adjusted_soc()))
-        while self.sliding_window_soc_values[0][0] + self.SLIDING_WINDOW_TIME < time.time():
-            self.sliding_window_soc_values.pop(0)
-        return sum(soc_value[1] for soc_value in self.sliding_window_soc_values) / len(self.sliding_window_soc_values)
+        self.sliding_window_soc_values.add(self.load_adjusted_soc())
+        return self.sliding_window_soc_values.mean()
+
+    def _mean_module_soc(self, cell_voltages: np.ndarray) -> float:
+        cell_socs = SocCurve.voltage_to_soc_many(cell_voltages).reshape(len(self.battery_modules), -1)
+        module_socs = [sum(module_cell_socs) / len(module_cell_socs) for module_cell_socs in cell_socs.tolist()]
+        return sum(module_socs) / len(module_socs)
 
     def load_adjusted_soc(self) -> float:
-        return sum(module.load_adjusted_soc(self.current.value) for module in self.battery_modules) \
-            / len(self.battery_modules)
+        voltages = self.cell_store.voltage.value + BatteryCell.INTERNAL_IMPEDANCE * self.current.value
+        return self._mean_module_soc(voltages)
 
     def soc(self) -> float:
-        return sum(module.soc() for module in self.battery_modules) / len(self.battery_modules)
+        return self._mean_module_soc(self.cell_store.voltage.value)
 
-    def cells(self) -> BatteryCellList:
-        return BatteryCellList([cell for module in self.battery_modules for cell in module.cells])
+    def cells(self) -> ReadOnlyBatteryCellList:
+        return self._cells
 
     def lowest_module_temp(self) -> float:
-        return min(battery_modules.min_temp() for battery_modules in self.battery_modules)
+        return self._module_temp_aggregate().min()
 
     def highest_module_temp(self) -> float:
-        return max(battery_modules.max_temp() for battery_modules in self.battery_modules)
+        return self._module_temp_aggregate().max()
 
     def highest_voltage_cells(self, number) -> List[BatteryCell]:
-        cell_list = self.cells()
-        cell_list.sort(key=lambda x: x.voltage.value, reverse=True)
-        return cell_list[0:number]
+        order = np.argsort(-self._cell_voltages(), kind='stable')[0:number]
+        return [self.cell_index[i] for i in order]
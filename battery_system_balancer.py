@@ -1,10 +1,21 @@
-import time
+import asyncio
+import threading
+import traceback
+from typing import Callable
+
+from accurate_reading_scheduler import AccurateReadingScheduler
+from balance_planner import BalancePlan
+from balance_planner import ProportionalBalancePlanner
 
 from battery_cell import BatteryCell
 from battery_cell_list import BatteryCellList
+from battery_cell_list import ReadOnlyBatteryCellList
 from battery_module import BatteryModule
 from battery_system import BatterySystem
+from pack_snapshot import PackSnapshot
 from slave_communicator import SlaveCommunicator
+from virtual_clock import VirtualTimer
+from virtual_clock import call_later
 
 
 class BatterySystemBalancer:
@@ -17,19 +28,65 @@ class BatterySystemBalancer:
     ACCURATE_READINGS_MAX_AGE: float = 20.0  # seconds
     ACCURATE_READINGS_REQUEST_WAIT_TIME: float = 10.0  # seconds
     ACCURATE_READINGS_REQUEST_WAIT_TIME_IDLE: float = 120.0  # seconds
+    ACCURATE_READINGS_STAGGER_WINDOW: float = 5.0  # seconds
+    ACCURATE_READINGS_TICK: float = 0.5  # seconds, period of send_due_accurate_reading_requests
+
+    MODE_TIERED: str = 'tiered'
+    MODE_PROPORTIONAL: str = 'proportional'
+    PROPORTIONAL_RELAX_TIME: float = 20.0  # seconds
+
+    # Chip temperature from which a module bleeds fewer cells at once, down to none at UPPER_CHIP_TEMP_LIMIT_WARNING
+    THERMAL_THROTTLE_START_TEMP: float = 45.0  # °C
 
-    def __init__(self, battery_system: BatterySystem, slave_communicator: SlaveCommunicator):
+    FALLBACK_POLL_INTERVAL: float = 30.0  # seconds, balance() runs on events, polling only catches lost messages
+
+    def __init__(self, battery_system: BatterySystem, slave_communicator: SlaveCommunicator,
+                 config: dict | None = None):
+        if config is None:
+            config = {}
         self.battery_system = battery_system
         self.slave_communicator = slave_communicator
+        self.clock: Callable[[], float] = battery_system.clock
 
         self.enabled: bool = True
-        self.ignore_slaves: set[int] = set()
+        self.ignore_slaves: frozenset[int] = frozenset()
         self.idle: bool = False
+        # Filtered by ignore_slaves, rebuilt only after set_ignore_slaves
+        self._modules: tuple[BatteryModule, ...] | None = None
+        self._cells: ReadOnlyBatteryCellList | None = None
 
         self.min_cell_diff_for_balancing: float = self.DEFAULT_MIN_CELL_DIFF_FOR_BALANCING
         self.max_cell_diff_for_balancing: float = self.DEFAULT_MAX_CELL_DIFF_FOR_BALANCING
         self.balance_discharge_time: float = self.DEFAULT_BALANCE_DISCHARGE_TIME
 
+        self.mode: str = config.get('balancing_mode', self.MODE_TIERED)
+        assert self.mode in (self.MODE_TIERED, self.MODE_PROPORTIONAL)
+        self.planner = ProportionalBalancePlanner(
+            config.get('balancing_cell_capacity', ProportionalBalancePlanner.DEFAULT_CELL_CAPACITY),
+            config.get('balancing_bleed_current', ProportionalBalancePlanner.DEFAULT_BLEED_CURRENT),
+            config.get('balancing_max_balance_time', ProportionalBalancePlanner.DEFAULT_MAX_BALANCE_TIME))
+        self.last_plan: BalancePlan | None = None
+        self.last_cycle_report: dict[str, float] | None = None
+        self.rounds_since_idle: int = 0
+
+        self.module_balance_limits: dict[int, int] = {}
+        self._balance_cell_seconds: dict[int, float] = {module.id: 0.0 for module in battery_system.battery_modules}
+        self._running_discharges: dict[BatteryCell, tuple[float, float]] = {}  # start time, balance time
+        self._duty_cycle_start: float = self.clock()
+
+        # balance() runs from the polling task, the message processing thread and the relax timer
+        self._lock = threading.RLock()
+        self._awaiting_accurate_readings: set[int] = set()
+        self.reading_scheduler = AccurateReadingScheduler(
+            [module.id for module in battery_system.battery_modules], self.ACCURATE_READINGS_REQUEST_WAIT_TIME,
+            self.ACCURATE_READINGS_REQUEST_WAIT_TIME_IDLE, self.ACCURATE_READINGS_STAGGER_WINDOW)
+        self._relax_timer: threading.Timer | asyncio.TimerHandle | VirtualTimer | None = None
+
+        for module in self.battery_system.battery_modules:
+            module.accurate_readings_event.on_accurate_readings_complete += self.on_accurate_readings_complete
+            for cell in module.cells:
+                cell.balance_event.on_balance_stopped += self.on_balance_stopped
+
         self.slave_communicator.events.on_connect += self.publish_config
         self.slave_communicator.events.on_balancing_enabled_set += self.set_enabled
         self.slave_communicator.events.on_balancing_ignore_slaves_set += self.set_ignore_slaves
@@ -43,60 +100,119 @@ class BatterySystemBalancer:
         self.slave_communicator.send_balancing_enabled_state(self.enabled)
 
     def set_ignore_slaves(self, ignore_slaves: set[int]):
-        self.ignore_slaves = ignore_slaves
+        with self._lock:
+            self.ignore_slaves = frozenset(ignore_slaves)
+            self._modules = None
+            self._cells = None
         self.slave_communicator.send_balancing_ignore_slaves_state(self.ignore_slaves)
 
-    def modules(self) -> list[BatteryModule]:
-        return [module for module in self.battery_system.battery_modules if module.id not in self.ignore_slaves]
+    def modules(self) -> tuple[BatteryModule, ...]:
+        modules = self._modules
+        if modules is None:
+            modules = tuple(module for module in self.battery_system.battery_modules
+                            if module.id not in self.ignore_slaves)
+            self._modules = modules
+        return modules
 
-    def cells(self) -> BatteryCellList:
-        return BatteryCellList([cell for module in self.modules() for cell in module.cells])
+    def cells(self) -> ReadOnlyBatteryCellList:
+        cells = self._cells
+        if cells is None:
+            modules = self.modules()
+            store = self.battery_system.cell_store
+            cells = ReadOnlyBatteryCellList([cell for module in modules for cell in module.cells], store,
+                                            store.module_indices(module.id for module in modules))
+            self._cells = cells
+        return cells
 
     def request_accurate_readings(self):
-        if self.idle:
-            request_wait_time: float = self.ACCURATE_READINGS_REQUEST_WAIT_TIME_IDLE
-        else:
-            request_wait_time: float = self.ACCURATE_READINGS_REQUEST_WAIT_TIME
-        for module in self.battery_system.battery_modules:
-            if module.id in self.ignore_slaves:
+        # Requests are spread over ACCURATE_READINGS_STAGGER_WINDOW, send_due_accurate_reading_requests sends them
+        now = self.clock()
+        with self._lock:
+            module_ids = [module.id for module in self.modules()
+                          if self.reading_scheduler.wants_request(module.id, now, balancing=not self.idle)]
+            self._awaiting_accurate_readings.update(module_ids)
+            self.reading_scheduler.stagger(module_ids, now)
+        self.send_due_accurate_reading_requests()
+
+    def send_due_accurate_reading_requests(self) -> None:
+        with self._lock:
+            module_ids = self.reading_scheduler.pop_due(self.clock())
+        for module_id in module_ids:
+            if module_id in self.ignore_slaves:
                 continue
-            if time.time() - module.last_accurate_reading_request_time > request_wait_time:
-                module.last_accurate_reading_request_time = time.time()
-                self.slave_communicator.send_accurate_reading_request(module.id)
+            self.battery_system.battery_modules[module_id].accurate_readings_requested()
+            self.slave_communicator.send_accurate_reading_request(module_id)
 
-    def balance(self) -> None:
-        if not self.enabled:
-            return
+    def on_accurate_readings_complete(self, module: BatteryModule) -> None:
+        with self._lock:
+            self.reading_scheduler.on_readings_complete(
+                module.id, self.battery_system.cell_store.snapshot.accurate_voltage.value[module.cell_indices],
+                self.clock())
+            if module.id not in self._awaiting_accurate_readings:
+                return
+            self._awaiting_accurate_readings.discard(module.id)
+            if self._awaiting_accurate_readings - self.ignore_slaves:
+                return
+        self._balance_on_event()
 
-        modules = self.modules()
-        max_chip_temp = max(module.chip_temp.value for module in modules)
-        if max_chip_temp >= BatteryModule.UPPER_CHIP_TEMP_LIMIT_WARNING:
+    def on_balance_stopped(self, cell: BatteryCell) -> None:
+        with self._lock:
+            discharge = self._running_discharges.pop(cell, None)
+            if discharge is not None:
+                start_time, balance_time = discharge
+                self._balance_cell_seconds[cell.module_id] += min(cell.last_discharge_time - start_time, balance_time)
+        possible_cells = self.cells()
+        if possible_cells.currently_balancing():
             return
+        # Readings taken before the cells relaxed are useless, so wait for the relax time of the last cell
+        delay = possible_cells.relax_end_time() - self.clock()
+        with self._lock:
+            if self._relax_timer is not None:
+                self._relax_timer.cancel()
+            self._relax_timer = call_later(self.clock, delay, self._balance_on_event)
 
-        possible_cells: BatteryCellList = self.cells()
+    def _balance_on_event(self) -> None:
+        try:
+            self.balance()
+        except Exception as e:
+            print('balance Exception', e, traceback.format_exc(), flush=True)
+
+    def balance(self) -> None:
+        with self._lock:
+            # One snapshot for the whole round, so it never mixes readings of two ingest batches
+            self._balance(self.cells(), self.battery_system.cell_store.snapshot)
+
+    def _balance(self, possible_cells: BatteryCellList, snapshot: PackSnapshot) -> None:
+        if not self.enabled:
+            return
 
         if possible_cells.in_relax_time() or possible_cells.currently_balancing():
             return
 
-        if possible_cells.has_accurate_readings_older_than(seconds=self.ACCURATE_READINGS_MAX_AGE):
+        if possible_cells.has_accurate_readings_older_than(seconds=self.ACCURATE_READINGS_MAX_AGE, snapshot=snapshot):
             self.request_accurate_readings()
             return
 
         try:
-            highest_voltage = possible_cells.highest_accurate_voltage()
+            highest_voltage = possible_cells.highest_accurate_voltage(snapshot)
         except TypeError:
             print(f'TypeError: some voltages not set! {self.battery_system}')
             return
-        lowest_voltage = possible_cells.lowest_accurate_voltage()
+        lowest_voltage = possible_cells.lowest_accurate_voltage(snapshot)
         self.slave_communicator.send_balancer_cell_min_max(lowest_voltage, highest_voltage)
 
         cell_diff: float = highest_voltage - lowest_voltage
 
         self.slave_communicator.send_balancer_cell_diff(cell_diff)
 
+        self._report_last_plan(cell_diff, snapshot)
+
         self.idle = False
 
         if cell_diff < self.min_cell_diff_for_balancing:
+            if self.rounds_since_idle > 0:
+                print(f'balanced to cell_diff: {cell_diff:.3f} V in {self.rounds_since_idle} rounds', flush=True)
+            self.rounds_since_idle = 0
             self.idle = True
             return
 
@@ -106,6 +222,11 @@ class BatterySystemBalancer:
             self.idle = True
             return
 
+        self.rounds_since_idle += 1
+        if self.mode == self.MODE_PROPORTIONAL:
+            self._balance_proportional(possible_cells, snapshot, lowest_voltage)
+            return
+
         if cell_diff > 0.010:
             possible_cells.set_relax_time(seconds=5.0)
             self.balance_discharge_time = 120.0  # seconds
@@ -120,9 +241,85 @@ class BatterySystemBalancer:
             min_cell_diff: float = max(self.min_cell_diff_for_balancing, 0.001)
 
         required_voltage: float = max(lowest_voltage + min_cell_diff, BatteryCell.soc_to_voltage(0.15))
-        cells_to_discharge: list[BatteryCell] = possible_cells.with_accurate_voltage_above(required_voltage)
+        cells_to_discharge: list[BatteryCell] = self._throttle(
+            possible_cells.with_accurate_voltage_above(required_voltage, snapshot), snapshot)
 
-        for cell in cells_to_discharge:
-            cell.start_balance_discharge(self.balance_discharge_time)
+        self._start_balance_discharges(cells_to_discharge, [self.balance_discharge_time] * len(cells_to_discharge))
 
         # Cells are now discharging until the BMS slave resets the balance pins
+
+    def _balance_proportional(self, possible_cells: BatteryCellList, snapshot: PackSnapshot,
+                              lowest_voltage: float) -> None:
+        candidates = possible_cells.with_accurate_voltage_above(
+            max(lowest_voltage + self.min_cell_diff_for_balancing, BatteryCell.soc_to_voltage(0.15)), snapshot)
+        candidates = self._throttle(candidates, snapshot)
+        accurate_voltages = snapshot.accurate_voltage.value[[cell.index for cell in candidates]]
+        plan = self.planner.plan(candidates, accurate_voltages, lowest_voltage)
+        possible_cells.set_relax_time(seconds=self.PROPORTIONAL_RELAX_TIME)
+        self._start_balance_discharges(plan.cells, plan.balance_times.tolist())
+        self.last_plan = plan
+
+    def module_balance_limit(self, module: BatteryModule) -> int:
+        # Number of cells the module may bleed at once, scaled down with its chip temperature headroom
+        if module.chip_temp.value is None:
+            return 0
+        headroom = ((BatteryModule.UPPER_CHIP_TEMP_LIMIT_WARNING - module.chip_temp.value)
+                    / (BatteryModule.UPPER_CHIP_TEMP_LIMIT_WARNING - self.THERMAL_THROTTLE_START_TEMP))
+        return int(len(module.cells) * min(max(headroom, 0.0), 1.0))
+
+    def _throttle(self, cells: list[BatteryCell], snapshot: PackSnapshot) -> list[BatteryCell]:
+        # Keeps the highest cells of every module up to its limit, cool modules keep balancing at full rate
+        self.module_balance_limits = {module.id: self.module_balance_limit(module) for module in self.modules()}
+        selected: set[int] = set()
+        module_counts: dict[int, int] = {}
+        accurate_voltages = snapshot.accurate_voltage.value
+        for cell in sorted(cells, key=lambda c: accurate_voltages[c.index], reverse=True):
+            count = module_counts.get(cell.module_id, 0)
+            if count < self.module_balance_limits.get(cell.module_id, 0):
+                module_counts[cell.module_id] = count + 1
+                selected.add(id(cell))
+        return [cell for cell in cells if id(cell) in selected]
+
+    def _start_balance_discharges(self, cells: list[BatteryCell], balance_times: list[float]) -> None:
+        # Collects the decisions so every module gets a single request
+        module_balance_times: dict[int, dict[int, float]] = {}
+        now = self.clock()
+        for cell, balance_time in zip(cells, balance_times):
+            module_balance_times.setdefault(cell.module_id, {})[cell.id] = balance_time
+            self._running_discharges[cell] = (now, balance_time)
+        for module_id, cell_balance_times in module_balance_times.items():
+            self.slave_communicator.send_module_balance_request(module_id, cell_balance_times)
+            self.battery_system.battery_modules[module_id].set_balance_pin_states(list(cell_balance_times), True)
+
+    def duty_cycles(self) -> dict[int, float]:
+        # Share of the module's cell time spent bleeding since startup
+        now = self.clock()
+        with self._lock:
+            cell_seconds = dict(self._balance_cell_seconds)
+            for cell, (start_time, balance_time) in self._running_discharges.items():
+                cell_seconds[cell.module_id] += min(now - start_time, balance_time)
+        elapsed = max(now - self._duty_cycle_start, 1e-9)
+        return {module.id: cell_seconds[module.id] / (elapsed * len(module.cells))
+                for module in self.battery_system.battery_modules}
+
+    def balancing_statistics_dict(self) -> dict[int, dict[str, float]]:
+        with self._lock:
+            duty_cycles = self.duty_cycles()
+            limits = dict(self.module_balance_limits)
+        return {module.id: {'chip_temp': module.chip_temp.value, 'limit': limits.get(module.id),
+                            'duty_cycle': duty_cycles[module.id]} for module in self.battery_system.battery_modules}
+
+    def accurate_reading_statistics_dict(self) -> dict[int, dict[str, float]]:
+        with self._lock:
+            return self.reading_scheduler.statistics_dict()
+
+    def _report_last_plan(self, cell_diff: float, snapshot: PackSnapshot) -> None:
+        # Runs on the first fresh accurate readings after a proportional round
+        plan = self.last_plan
+        if plan is None:
+            return
+        self.last_plan = None
+        achieved_voltages = snapshot.accurate_voltage.value[[cell.index for cell in plan.cells]]
+        self.last_cycle_report = plan.report(achieved_voltages, cell_diff)
+        self.last_cycle_report['round'] = self.rounds_since_idle
+        print('balance cycle report', self.last_cycle_report, flush=True)
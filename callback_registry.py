@@ -0,0 +1,59 @@
+from typing import Callable, Iterator
+
+
+class CallbackSlot:
+    # Handlers are kept as a tuple that is rebuilt on (un)registration, so firing never copies or allocates
+    __slots__ = ('__name__', 'targets')
+
+    def __init__(self, name: str) -> None:
+        self.__name__: str = name
+        self.targets: tuple[Callable, ...] = ()
+
+    def __repr__(self) -> str:
+        return f"event '{self.__name__}'"
+
+    def __call__(self, *args, **kwargs) -> None:
+        for target in self.targets:
+            target(*args, **kwargs)
+
+    def __iadd__(self, target: Callable) -> 'CallbackSlot':
+        self.targets = self.targets + (target,)
+        return self
+
+    def __isub__(self, target: Callable) -> 'CallbackSlot':
+        self.targets = tuple(t for t in self.targets if t != target)
+        return self
+
+    def __bool__(self) -> bool:
+        # Lets hot paths skip building arguments when nobody listens
+        return len(self.targets) > 0
+
+    def __len__(self) -> int:
+        return len(self.targets)
+
+    def __iter__(self) -> Iterator[Callable]:
+        return iter(self.targets)
+
+    def __getitem__(self, key: int) -> Callable:
+        return self.targets[key]
+
+
+class CallbackRegistry:
+    # Drop-in for events.Events with += / -= registration. Every declared event gets its slot at construction,
+    # so firing is a plain attribute lookup and undeclared names raise AttributeError.
+    __events__: tuple[str, ...] = ()
+
+    def __init__(self, events: tuple[str, ...] | None = None) -> None:
+        if events is not None:
+            self.__events__ = events
+        for name in self.__events__:
+            setattr(self, name, CallbackSlot(name))
+
+    def __getitem__(self, name: str) -> CallbackSlot:
+        return getattr(self, name)
+
+    def __iter__(self) -> Iterator[CallbackSlot]:
+        return (getattr(self, name) for name in self.__events__)
+
+    def __len__(self) -> int:
+        return len(self.__events__)
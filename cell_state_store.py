@@ -0,0 +1,135 @@
+import itertools
+import threading
+from contextlib import contextmanager
+from typing import Callable, Iterator
+
+import numpy as np
+
+from aggregate_tree import HierarchicalAggregate
+from pack_snapshot import ColumnSnapshot
+from pack_snapshot import PackSnapshot
+from virtual_clock import wall_clock
+
+
+class MeasurementColumns:
+    def __init__(self, size: int, aggregate: HierarchicalAggregate | None = None) -> None:
+        self.aggregate: HierarchicalAggregate | None = aggregate
+        self.value: np.ndarray = np.full(size, np.nan)
+        self.timestamp: np.ndarray = np.full(size, np.nan)
+        self.implausible_counter: np.ndarray = np.zeros(size, dtype=np.int64)
+        self.critical_counter: np.ndarray = np.zeros(size, dtype=np.int64)
+        self.warning_counter: np.ndarray = np.zeros(size, dtype=np.int64)
+        self.on_written: Callable[[], None] | None = None
+
+    def write(self, index: int, measurement) -> None:
+        self.value[index] = measurement.value
+        self.timestamp[index] = measurement.timestamp
+        self.implausible_counter[index] = measurement.implausible_counter
+        self.critical_counter[index] = measurement.critical_counter
+        self.warning_counter[index] = measurement.warning_counter
+        if self.aggregate is not None:
+            self.aggregate.update(index, measurement.value)
+        if self.on_written is not None:
+            self.on_written()
+
+    def write_group(self, group_id: int, measurements: list) -> None:
+        # Writes one whole module in a single pass, measurements must be the module's measurements in order
+        first = group_id * len(measurements)
+        group = slice(first, first + len(measurements))
+        values = [measurement.value for measurement in measurements]
+        self.value[group] = values
+        self.timestamp[group] = [measurement.timestamp for measurement in measurements]
+        self.implausible_counter[group] = [measurement.implausible_counter for measurement in measurements]
+        self.critical_counter[group] = [measurement.critical_counter for measurement in measurements]
+        self.warning_counter[group] = [measurement.warning_counter for measurement in measurements]
+        if self.aggregate is not None:
+            self.aggregate.update_group(group_id, values)
+        if self.on_written is not None:
+            self.on_written()
+
+
+class CellStateStore:
+    # Pack-wide cell state as flat arrays, cell (m, c) lives at index m * number_of_serial_cells + c
+    TEMPS_PER_MODULE: int = 2
+
+    def __init__(self, number_of_modules: int, number_of_serial_cells: int,
+                 clock: Callable[[], float] = wall_clock) -> None:
+        self.clock: Callable[[], float] = clock  # shared by every cell and module on this store
+        self.number_of_modules: int = number_of_modules
+        self.number_of_serial_cells: int = number_of_serial_cells
+        size = number_of_modules * number_of_serial_cells
+
+        self.voltage: MeasurementColumns = MeasurementColumns(
+            size, HierarchicalAggregate(number_of_modules, number_of_serial_cells))
+        self.accurate_voltage: MeasurementColumns = MeasurementColumns(size)
+        self.balance_pin_state: np.ndarray = np.zeros(size, dtype=bool)
+        self.last_discharge_time: np.ndarray = np.zeros(size)
+        self.relax_time: np.ndarray = np.zeros(size)
+
+        self.module_temp: MeasurementColumns = MeasurementColumns(
+            number_of_modules * self.TEMPS_PER_MODULE, HierarchicalAggregate(number_of_modules, self.TEMPS_PER_MODULE))
+
+        # Only the ingest side writes the measurement columns, control code reads the published snapshot. A batch
+        # publishes when it ends, a write outside any batch only marks the store dirty and the next read publishes.
+        self._versions = itertools.count()
+        self._batch_depth: int = 0
+        self._dirty: bool = False
+        self._publish_lock = threading.Lock()  # orders a publishing read against a batch starting on another thread
+        self._after_publish: list[Callable[[], None]] = []
+        self._snapshot: PackSnapshot = self.publish()
+        for columns in (self.voltage, self.accurate_voltage, self.module_temp):
+            columns.on_written = self._on_written
+
+    def __len__(self) -> int:
+        return self.number_of_modules * self.number_of_serial_cells
+
+    def flat_index(self, module_row: int, cell_id: int) -> int:
+        return module_row * self.number_of_serial_cells + cell_id
+
+    def module_indices(self, module_rows) -> np.ndarray:
+        rows = np.asarray(list(module_rows), dtype=np.intp)
+        return (rows[:, None] * self.number_of_serial_cells + np.arange(self.number_of_serial_cells)).ravel()
+
+    def _on_written(self) -> None:
+        self._dirty = True
+
+    @property
+    def snapshot(self) -> PackSnapshot:
+        # Inside a batch this stays the snapshot from before it, the lock is only taken after unbatched writes
+        if self._dirty and self._batch_depth == 0:
+            with self._publish_lock:
+                if self._dirty and self._batch_depth == 0:
+                    self.publish()
+        return self._snapshot
+
+    @contextmanager
+    def batch(self) -> Iterator[None]:
+        # Publishes once for all writes inside, nested batches publish when the outermost one ends
+        with self._publish_lock:
+            self._batch_depth += 1
+        try:
+            yield
+        finally:
+            with self._publish_lock:
+                self._batch_depth -= 1
+                ended = self._batch_depth == 0
+                if ended and self._dirty:
+                    self.publish()
+            if ended:
+                callbacks, self._after_publish = self._after_publish, []
+                for callback in callbacks:
+                    callback()
+
+    def after_publish(self, callback: Callable[[], None]) -> None:
+        # Runs the callback once the current batch is published, so it reads a snapshot with the batch's writes
+        if self._batch_depth == 0:
+            callback()
+        else:
+            self._after_publish.append(callback)
+
+    def publish(self) -> PackSnapshot:
+        snapshot = PackSnapshot(next(self._versions), self.clock(), ColumnSnapshot.of(self.voltage),
+                                ColumnSnapshot.of(self.accurate_voltage), ColumnSnapshot.of(self.module_temp))
+        self._dirty = False
+        self._snapshot = snapshot  # a single reference swap, readers get either the old or the new snapshot
+        return snapshot
@@ -0,0 +1,42 @@
+import numpy as np
+
+
+class CellVoltageFrame:
+    # Binary frames are little endian: optional header (uint16 sequence, uint32 uptime in ms),
+    # then one uint16 per cell in units of 100 µV
+    BINARY_HEADER = np.dtype([('sequence', '<u2'), ('uptime', '<u4')])
+    BINARY_CELL_VOLTAGE = np.dtype('<u2')
+    BINARY_VOLTAGE_RESOLUTION: float = 0.0001  # V
+    SEQUENCE_MODULO: int = 1 << 16
+
+    def __init__(self, voltages: np.ndarray, sequence: int | None = None, uptime: int | None = None) -> None:
+        self.voltages: np.ndarray = voltages
+        self.sequence: int | None = sequence
+        self.uptime: int | None = uptime
+
+    @classmethod
+    def from_csv(cls, payload: bytes, number_of_cells: int) -> 'CellVoltageFrame':
+        # "v1,...,vn" or "sequence,uptime,v1,...,vn"
+        values = payload.split(b',')
+        if len(values) == number_of_cells:
+            return cls(np.array(values, dtype=np.float64))
+        if len(values) == number_of_cells + 2:
+            return cls(np.array(values[2:], dtype=np.float64), int(values[0]), int(values[1]))
+        raise ValueError(f'expected {number_of_cells} cell voltages, got {len(values)} values')
+
+    @classmethod
+    def from_binary(cls, payload: bytes, number_of_cells: int) -> 'CellVoltageFrame':
+        cells_size = number_of_cells * cls.BINARY_CELL_VOLTAGE.itemsize
+        if len(payload) == cells_size:
+            raw = np.frombuffer(payload, dtype=cls.BINARY_CELL_VOLTAGE)
+            return cls(raw * cls.BINARY_VOLTAGE_RESOLUTION)
+        if len(payload) == cls.BINARY_HEADER.itemsize + cells_size:
+            header = np.frombuffer(payload, dtype=cls.BINARY_HEADER, count=1)[0]
+            raw = np.frombuffer(payload, dtype=cls.BINARY_CELL_VOLTAGE, offset=cls.BINARY_HEADER.itemsize)
+            return cls(raw * cls.BINARY_VOLTAGE_RESOLUTION, int(header['sequence']), int(header['uptime']))
+        raise ValueError(f'expected {number_of_cells} cell voltages, got {len(payload)} bytes')
+
+    def is_newer_than(self, sequence: int | None) -> bool:
+        if self.sequence is None or sequence is None:
+            return True
+        return 0 < (self.sequence - sequence) % self.SEQUENCE_MODULO < self.SEQUENCE_MODULO // 2
@@ -0,0 +1,71 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Hashable
+
+
+class DeadlineQueue:
+    # Sources sharing one timeout go stale in the order they were last armed, so re-arming moves the source to the
+    # back and expiry only ever looks at the front. A source fires once per staleness and stays quiet until re-armed.
+    def __init__(self, timeout: float, on_expired: Callable[[list], None]) -> None:
+        self.timeout: float = timeout  # seconds
+        self._on_expired: Callable[[list], None] = on_expired
+        self._lock = threading.Lock()
+        self._deadlines: OrderedDict[Hashable, float] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._deadlines)
+
+    def arm(self, key: Hashable, now: float) -> None:
+        with self._lock:
+            self._deadlines[key] = now + self.timeout
+            self._deadlines.move_to_end(key)
+
+    def arm_initial(self, key: Hashable, deadline: float) -> None:
+        # Deadline for a source that never reported, it must not be later than now + timeout to keep the order
+        with self._lock:
+            if key not in self._deadlines:
+                self._deadlines[key] = deadline
+
+    def disarm(self, key: Hashable) -> None:
+        with self._lock:
+            self._deadlines.pop(key, None)
+
+    def next_deadline(self) -> float | None:
+        with self._lock:
+            for deadline in self._deadlines.values():
+                return deadline
+        return None
+
+    def expire(self, now: float) -> int:
+        expired = []
+        with self._lock:
+            while self._deadlines:
+                key, deadline = next(iter(self._deadlines.items()))
+                if deadline > now:
+                    break
+                del self._deadlines[key]
+                expired.append(key)
+        if expired:
+            self._on_expired(expired)
+        return len(expired)
+
+
+class DeadlineTracker:
+    def __init__(self, clock: Callable[[], float] = time.time) -> None:
+        self.clock: Callable[[], float] = clock
+        self.queues: list[DeadlineQueue] = []
+
+    def add_queue(self, timeout: float, on_expired: Callable[[list], None]) -> DeadlineQueue:
+        queue = DeadlineQueue(timeout, on_expired)
+        self.queues.append(queue)
+        return queue
+
+    def next_deadline(self) -> float | None:
+        deadlines = [deadline for deadline in (queue.next_deadline() for queue in self.queues) if deadline is not None]
+        return min(deadlines) if deadlines else None
+
+    def poll(self, now: float | None = None) -> int:
+        if now is None:
+            now = self.clock()
+        return sum(queue.expire(now) for queue in self.queues)
@@ -1,5 +1,5 @@
-from events import Events
+from callback_registry import CallbackRegistry
 
 
-class HeartbeatEvent(Events):
+class HeartbeatEvent(CallbackRegistry):
     __events__ = ('on_heartbeat', 'on_heartbeat_missed')
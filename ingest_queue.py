@@ -0,0 +1,149 @@
+import threading
+import time
+from collections import deque
+from contextlib import AbstractContextManager
+from contextlib import nullcontext
+from typing import Callable
+
+
+class IngestStatistics:
+    def __init__(self) -> None:
+        self.depth: int = 0
+        self.max_depth: int = 0
+        self.received: int = 0
+        self.coalesced: int = 0
+        self.dropped: int = 0
+        self.batches: int = 0
+        self.applied: int = 0
+        self.max_batch_size: int = 0
+        self.max_latency: float = 0.0
+        self.total_latency: float = 0.0
+
+    def record_batch(self, batch_size: int) -> None:
+        self.batches += 1
+        self.max_batch_size = max(self.max_batch_size, batch_size)
+
+    def record_applied(self, latency: float) -> None:
+        self.applied += 1
+        self.total_latency += latency
+        self.max_latency = max(self.max_latency, latency)
+
+    def mean_batch_size(self) -> float:
+        return self.applied / self.batches if self.batches > 0 else 0.0
+
+    def mean_latency(self) -> float:
+        return self.total_latency / self.applied if self.applied > 0 else 0.0
+
+    def as_dict(self) -> dict[str, float]:
+        return {'depth': self.depth, 'max_depth': self.max_depth, 'received': self.received,
+                'coalesced': self.coalesced, 'dropped': self.dropped, 'batches': self.batches,
+                'max_batch_size': self.max_batch_size, 'mean_batch_size': self.mean_batch_size(),
+                'max_latency': self.max_latency, 'mean_latency': self.mean_latency()}
+
+
+class IngestQueue:
+    # Hands raw messages from the paho network thread over to a processing worker. Telemetry is applied in arrival
+    # order. Only when max_size telemetry messages are waiting, a new payload replaces the queued one of its topic or,
+    # for a topic not queued, pushes out the oldest telemetry message. Control messages are never coalesced or dropped
+    # and are applied before telemetry. Every drained batch is applied inside batch_context, which lets the consumer
+    # publish the batch's writes at once.
+    def __init__(self, process: Callable[[str, bytes], None], max_size: int, max_batch: int,
+                 clock: Callable[[], float] = time.monotonic,
+                 batch_context: Callable[[], AbstractContextManager] = nullcontext) -> None:
+        assert max_size > 0 and max_batch > 0
+        self._process: Callable[[str, bytes], None] = process
+        self._batch_context: Callable[[], AbstractContextManager] = batch_context
+        self.max_size: int = max_size
+        self.max_batch: int = max_batch
+        self._clock: Callable[[], float] = clock
+
+        self._condition = threading.Condition()
+        self._control: deque[tuple[str, bytes, float]] = deque()
+        self._telemetry: deque[list] = deque()  # [topic, payload, enqueue time], the payload may be replaced
+        self._latest: dict[str, list] = {}  # newest queued telemetry entry per topic
+        self._running: bool = False
+        self._thread: threading.Thread | None = None
+
+        self.statistics: IngestStatistics = IngestStatistics()
+
+    def put(self, topic: str, payload: bytes, control: bool = False) -> None:
+        with self._condition:
+            statistics = self.statistics
+            statistics.received += 1
+            if control:
+                self._control.append((topic, payload, self._clock()))
+            elif len(self._telemetry) < self.max_size:
+                self._append_telemetry(topic, payload)
+            elif topic in self._latest:
+                # Keep the queue position and enqueue time, only the newest payload gets applied
+                self._latest[topic][1] = payload
+                statistics.coalesced += 1
+            else:
+                self._pop_telemetry()
+                statistics.dropped += 1
+                self._append_telemetry(topic, payload)
+            statistics.depth = len(self._control) + len(self._telemetry)
+            statistics.max_depth = max(statistics.max_depth, statistics.depth)
+            self._condition.notify()
+
+    def _append_telemetry(self, topic: str, payload: bytes) -> None:
+        entry = [topic, payload, self._clock()]
+        self._telemetry.append(entry)
+        self._latest[topic] = entry
+
+    def _pop_telemetry(self) -> tuple[str, bytes, float]:
+        entry = self._telemetry.popleft()
+        topic, payload, enqueue_time = entry
+        if self._latest.get(topic) is entry:
+            del self._latest[topic]
+        return topic, payload, enqueue_time
+
+    def _take_batch(self) -> list[tuple[str, bytes, float]]:
+        batch: list[tuple[str, bytes, float]] = []
+        while self._control and len(batch) < self.max_batch:
+            batch.append(self._control.popleft())
+        while self._telemetry and len(batch) < self.max_batch:
+            batch.append(self._pop_telemetry())
+        self.statistics.depth = len(self._control) + len(self._telemetry)
+        return batch
+
+    def _apply(self, batch: list[tuple[str, bytes, float]]) -> None:
+        self.statistics.record_batch(len(batch))
+        with self._batch_context():
+            for topic, payload, enqueue_time in batch:
+                self._process(topic, payload)
+                self.statistics.record_applied(self._clock() - enqueue_time)
+
+    def process_pending(self) -> int:
+        # Applies everything queued so far from the calling thread, returns the number of messages applied
+        applied = 0
+        while True:
+            with self._condition:
+                batch = self._take_batch()
+            if not batch:
+                return applied
+            self._apply(batch)
+            applied += len(batch)
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                while self._running and not self._control and not self._telemetry:
+                    self._condition.wait()
+                if not self._running:
+                    return
+                batch = self._take_batch()
+            self._apply(batch)
+
+    def start(self) -> None:
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name='mqtt-ingest', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        with self._condition:
+            self._running = False
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
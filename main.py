@@ -1,55 +1,59 @@
-import sched
+import asyncio
+import json
 
+from async_runtime import AsyncRuntime
 from battery_manager import BatteryManager
 from battery_system import BatterySystem
+from battery_system_balancer import BatterySystemBalancer
+from periodic_scheduler import PeriodicScheduler
 from slave_communicator import SlaveCommunicator
 from utils import get_config
 
 
-def heartbeat_task():
-    slave_communicator.send_heartbeat()
-    scheduler.enter(delay=1, priority=1, action=heartbeat_task)  # delay in seconds
-
-
-def balance_task():
-    battery_manager.balance()
-    scheduler.enter(delay=5, priority=1, action=balance_task)  # delay in seconds
-
-
-def check_heartbeats_task():
-    battery_system.check_heartbeats()
-    scheduler.enter(delay=5, priority=1, action=check_heartbeats_task)  # delay in seconds
-
-
-def check_cell_voltage_times_task():
-    battery_manager.check_cell_voltage_times()
-    scheduler.enter(delay=20, priority=1, action=check_cell_voltage_times_task)  # delay in seconds
-
-
-def info_task():
-    slave_communicator.send_battery_system_state()
-    scheduler.enter(delay=2, priority=1, action=info_task)  # delay in seconds
-
-
-def set_limits_task():
-    battery_manager.set_limits()
-    scheduler.enter(delay=2, priority=1, action=set_limits_task)  # delay in seconds
+def add_tasks(scheduler: PeriodicScheduler | AsyncRuntime, battery_system: BatterySystem,
+              slave_communicator: SlaveCommunicator, battery_manager: BatteryManager):
+    # periods and delays in seconds, the ESPs depend on the heartbeat so nothing else shares its lane
+    scheduler.add_task('heartbeat', slave_communicator.send_heartbeat, period=1, lane='heartbeat')
+    scheduler.add_task('balance', battery_manager.balance, period=BatterySystemBalancer.FALLBACK_POLL_INTERVAL,
+                       initial_delay=20)
+    scheduler.add_task('accurate_readings', battery_manager.balancer.send_due_accurate_reading_requests,
+                       period=BatterySystemBalancer.ACCURATE_READINGS_TICK)
+    scheduler.add_task('check_deadlines', battery_system.check_deadlines, period=1, lane='safety')
+    scheduler.add_task('info', slave_communicator.send_battery_system_state, period=2)
+    scheduler.add_task('set_limits', battery_manager.set_limits, period=2, initial_delay=20, lane='safety')
+    scheduler.add_task('flush_log', battery_manager.log_sink.flush, period=1, lane='log')
+    scheduler.add_task('statistics', lambda: log_statistics(scheduler, slave_communicator, battery_manager),
+                       period=300, initial_delay=300)
+
+
+def log_statistics(scheduler: PeriodicScheduler | AsyncRuntime, slave_communicator: SlaveCommunicator,
+                   battery_manager: BatteryManager) -> None:
+    # One line with the task timing, queue, balancing and alarm metrics, written out by flush_log
+    balancer = battery_manager.balancer
+    statistics = {'tasks': scheduler.statistics_dict(),
+                  'ingest': slave_communicator.ingest_statistics(),
+                  'publish': slave_communicator.publish_statistics(),
+                  'balancing': balancer.balancing_statistics_dict(),
+                  'accurate_readings': balancer.accurate_reading_statistics_dict(),
+                  'alarms': battery_manager.alarms.statistics_dict()}
+    battery_manager.log_sink.log(f'statistics {json.dumps(statistics, default=str)}')
 
 
 if __name__ == '__main__':
     config = get_config('config.yaml')
-    scheduler = sched.scheduler()
+    use_asyncio = config.get('runtime', 'threaded') == 'asyncio'
     battery_system = BatterySystem(config['number_of_battery_modules'], config['number_of_serial_cells'])
-    slave_communicator = SlaveCommunicator(config, battery_system)
-    battery_manager = BatteryManager(battery_system, slave_communicator)
-
-    scheduler.enter(delay=0, priority=1, action=heartbeat_task)
-    scheduler.enter(delay=20, priority=1, action=balance_task)
-    scheduler.enter(delay=20, priority=1, action=check_heartbeats_task)
-    scheduler.enter(delay=20, priority=1, action=check_cell_voltage_times_task)
-    scheduler.enter(delay=0, priority=1, action=info_task)
-    scheduler.enter(delay=20, priority=1, action=set_limits_task)
+    slave_communicator = SlaveCommunicator(config, battery_system, threaded=not use_asyncio)
+    battery_manager = BatteryManager(battery_system, slave_communicator, config)
+
     try:
-        scheduler.run()
+        if use_asyncio:
+            runtime = AsyncRuntime(slave_communicator)
+            add_tasks(runtime, battery_system, slave_communicator, battery_manager)
+            asyncio.run(runtime.run())
+        else:
+            scheduler = PeriodicScheduler()
+            add_tasks(scheduler, battery_system, slave_communicator, battery_manager)
+            scheduler.run()
     except KeyboardInterrupt:
         print('exiting by keyboard interrupt.')
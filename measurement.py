@@ -1,13 +1,21 @@
-import time
+from typing import Callable
 
-from events import Events
+from alarm_engine import AlarmEngine
+from alarm_engine import AlarmLevel
+from callback_registry import CallbackRegistry
+from cell_state_store import MeasurementColumns
+from deadline_tracker import DeadlineQueue
+from virtual_clock import wall_clock
 
 
-class MeasurementEvent(Events):
+class MeasurementEvent(CallbackRegistry):
     __events__ = ('on_critical', 'on_warning', 'on_implausible')
 
 
 class MeasurementLimits:
+    __slots__ = ('warning_upper', 'warning_lower', 'critical_upper', 'critical_lower', 'implausible_upper',
+                 'implausible_lower')
+
     def __init__(self):
         self.warning_upper: float | None = None
         self.warning_lower: float | None = None
@@ -18,18 +26,38 @@ class MeasurementLimits:
 
 
 class Measurement:
-    def __init__(self, owner, limits: MeasurementLimits, start_value: float | None = None):
+    __slots__ = ('clock', 'value', 'timestamp', 'init', 'owner', 'limits', 'columns', 'index', 'implausible_counter',
+                 'critical_counter', 'warning_counter', '_event', 'deadlines', 'alarm_engine', 'alarm_slot')
+
+    def __init__(self, owner, limits: MeasurementLimits, start_value: float | None = None,
+                 columns: MeasurementColumns | None = None, index: int = 0, clock: Callable[[], float] = wall_clock):
+        self.clock: Callable[[], float] = clock
         self.value: float | None = start_value
         self.timestamp: float | None = None
         self.init = False
         self.owner = owner
         self.limits = limits
+        self.columns: MeasurementColumns | None = columns
+        self.index: int = index
 
         self.implausible_counter: int = 0
         self.critical_counter: int = 0
         self.warning_counter: int = 0
 
-        self.event = MeasurementEvent()
+        self._event: MeasurementEvent | None = None  # created on first access, most measurements have no handlers
+        self.deadlines: tuple[DeadlineQueue, ...] = ()  # re-armed on every update
+        self.alarm_engine: AlarmEngine | None = None  # set by AlarmEngine.watch
+        self.alarm_slot: int = -1
+
+    @property
+    def event(self) -> MeasurementEvent:
+        if self._event is None:
+            self._event = MeasurementEvent()
+        return self._event
+
+    @event.setter
+    def event(self, event: MeasurementEvent) -> None:
+        self._event = event
 
     def has_implausible_value(self) -> bool:
         return not (self.limits.implausible_lower <= self.value <= self.limits.implausible_upper)
@@ -40,30 +68,65 @@ class Measurement:
     def has_warning_value(self) -> bool:
         return not (self.limits.warning_lower <= self.value <= self.limits.warning_upper)
 
-    def update(self, value: float):
+    def _apply(self, value: float, timestamp: float):
         self.value = value
-        self.timestamp = time.time()
+        self.timestamp = timestamp
         self.init = True
+        for deadline in self.deadlines:
+            deadline.arm(self, timestamp)
 
-        if self.has_implausible_value():
+        # Same checks as the has_*_value methods, inlined since this runs for every sample
+        limits = self.limits
+        events = self._event
+        if not (limits.implausible_lower <= value <= limits.implausible_upper):
             self.implausible_counter += 1
-            self.event.on_implausible(self.owner)
-        elif self.has_critical_value():
+            level = AlarmLevel.IMPLAUSIBLE
+            event = events.on_implausible if events is not None else None
+        elif not (limits.critical_lower <= value <= limits.critical_upper):
             self.critical_counter += 1
             self.implausible_counter = 0
-            self.event.on_critical(self.owner)
-        elif self.has_warning_value():
+            level = AlarmLevel.CRITICAL
+            event = events.on_critical if events is not None else None
+        elif not (limits.warning_lower <= value <= limits.warning_upper):
             self.warning_counter += 1
             self.implausible_counter = 0
             self.critical_counter = 0
-            self.event.on_warning(self.owner)
+            level = AlarmLevel.WARNING
+            event = events.on_warning if events is not None else None
         else:
             self.warning_counter = 0
             self.implausible_counter = 0
             self.critical_counter = 0
+            level = AlarmLevel.NORMAL
+            event = None
+
+        if self.alarm_engine is not None:
+            self.alarm_engine.observe(self.alarm_slot, level, timestamp)
+        return event
+
+    def update(self, value: float):
+        event = self._apply(value, self.clock())
+
+        if self.columns is not None:
+            self.columns.write(self.index, self)
+
+        if event:
+            event(self.owner)
+
+    @staticmethod
+    def update_group(measurements: list['Measurement'], values: list[float], columns: MeasurementColumns,
+                     group_id: int) -> None:
+        timestamp = measurements[0].clock()
+        events = [measurement._apply(value, timestamp) for measurement, value in zip(measurements, values)]
+
+        columns.write_group(group_id, measurements)
+
+        for measurement, event in zip(measurements, events):
+            if event:
+                event(measurement.owner)
 
     def initialized(self) -> bool:
         return self.init
 
     def age_seconds(self) -> float:
-        return time.time() - self.timestamp
+        return self.clock() - self.timestamp
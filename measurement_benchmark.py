@@ -0,0 +1,35 @@
+import timeit
+
+from events import Events
+
+from battery_cell import BatteryCell
+from measurement import Measurement
+from measurement import MeasurementEvent
+
+
+# Dispatch overhead of Measurement.update with the events package (before) and CallbackRegistry (after).
+# Only the event object differs between the two runs. Needs requirements.benchmark.txt.
+
+def measurement(event_factory, subscribers: int) -> Measurement:
+    m = Measurement(None, BatteryCell.limits)
+    m.event = event_factory()
+    for _ in range(subscribers):
+        m.event.on_warning += lambda owner: None
+    return m
+
+
+def bench(event_factory, value: float, subscribers: int, number: int) -> float:
+    m = measurement(event_factory, subscribers)
+    return min(timeit.repeat(lambda: m.update(value), number=number, repeat=5)) / number * 1e9  # ns per update
+
+
+if __name__ == '__main__':
+    factories = {'events.Events': lambda: Events(events=MeasurementEvent.__events__),
+                 'CallbackRegistry': MeasurementEvent}
+    cases = {'in range, no subscribers': (3.7, 0), 'warning, no subscribers': (4.16, 0),
+             'warning, 1 subscriber': (4.16, 1), 'warning, 3 subscribers': (4.16, 3)}
+    number = 200_000
+    print(f'{"case":<28}' + ''.join(f'{name:>20}' for name in factories))
+    for case, (value, subscribers) in cases.items():
+        results = [bench(factory, value, subscribers, number) for factory in factories.values()]
+        print(f'{case:<28}' + ''.join(f'{result:>17.0f} ns' for result in results))
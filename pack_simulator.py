@@ -0,0 +1,255 @@
+import math
+import time
+from typing import Callable
+
+import numpy as np
+
+from battery_manager import BatteryManager
+from battery_system import BatterySystem
+from main import add_tasks
+from periodic_scheduler import PeriodicScheduler
+from slave_communicator_events import SlaveCommunicatorEvents
+from soc_curve import SocCurve
+from virtual_clock import VirtualClock
+
+
+class SimulatedCommunicator:
+    # Stand-in for SlaveCommunicator, hands balance and accurate-reading requests to the simulator instead of MQTT
+    def __init__(self, simulator: 'PackSimulator') -> None:
+        self.events: SlaveCommunicatorEvents = SlaveCommunicatorEvents()
+        self._simulator: PackSimulator = simulator
+        self.disconnect_reasons: list[str] = []
+        self.allow_charge: bool = True
+        self.allow_discharge: bool = True
+
+    def send_heartbeat(self):
+        pass
+
+    def ingest_statistics(self) -> dict[str, float]:
+        return {}
+
+    def publish_statistics(self) -> dict:
+        return {}
+
+    def send_battery_system_state(self):
+        pass
+
+    def send_balancer_cell_diff(self, cell_diff: float):
+        pass
+
+    def send_balancer_cell_min_max(self, min_voltage: float, max_voltage: float):
+        pass
+
+    def send_balancing_enabled_state(self, enabled: bool):
+        pass
+
+    def send_balancing_ignore_slaves_state(self, ignore_slaves: set[int]):
+        pass
+
+    def send_charge_limit(self, allow_charge: bool):
+        self.allow_charge = allow_charge
+
+    def send_discharge_limit(self, allow_discharge: bool):
+        self.allow_discharge = allow_discharge
+
+    def open_battery_relays(self, reason: str = None):
+        self.disconnect_reasons.append(reason)
+        self._simulator.relays_open = True
+
+    def send_accurate_reading_request(self, module_number: int):
+        self._simulator.request_accurate_readings(module_number)
+
+    def send_balance_request(self, module_number: int, cell_number: int, balance_time_s: float):
+        self._simulator.start_balancing(module_number, {cell_number: balance_time_s})
+
+    def send_module_balance_request(self, module_number: int, balance_times: dict[int, float]):
+        self._simulator.start_balancing(module_number, balance_times)
+
+
+class PackSimulator:
+    # Discrete-time pack model on (module, cell) arrays driving the real BatterySystem, BatteryManager and
+    # BatterySystemBalancer on a virtual clock. Cells follow the SocCurve OCV, the terminal voltage drops by the
+    # internal resistance under load (positive current discharges) and the bleed resistor draws OCV / R.
+    DEFAULT_STEP: float = 5.0  # seconds
+    DEFAULT_TELEMETRY_INTERVAL: float = 30.0  # seconds
+    DEFAULT_UPTIME_INTERVAL: float = 10.0  # seconds, has to stay below BatteryModule.ESP_TIMEOUT
+    DEFAULT_ACCURATE_READING_LATENCY: float = 1.0  # seconds
+    CHIP_THERMAL_RESISTANCE: float = 2.5  # K/W of bleed power per module
+    CHIP_THERMAL_TIME_CONSTANT: float = 120.0  # seconds
+
+    def __init__(self, number_of_modules: int, number_of_serial_cells: int, soc: float | np.ndarray = 0.5,
+                 capacity: float | np.ndarray = 10.0, self_discharge: float | np.ndarray = 0.0005,
+                 internal_resistance: float | np.ndarray = 0.000975, bleed_resistance: float | np.ndarray = 33.0,
+                 temperature: float | np.ndarray = 20.0, current: Callable[[float], float] = lambda t: 0.0,
+                 step: float = DEFAULT_STEP, telemetry_interval: float = DEFAULT_TELEMETRY_INTERVAL,
+                 uptime_interval: float = DEFAULT_UPTIME_INTERVAL,
+                 accurate_reading_latency: float = DEFAULT_ACCURATE_READING_LATENCY, config: dict | None = None,
+                 balanced_cell_diff: float = 0.002) -> None:
+        shape = (number_of_modules, number_of_serial_cells)
+        self.soc: np.ndarray = np.array(np.broadcast_to(soc, shape), dtype=np.float64)
+        self.capacity: np.ndarray = np.array(np.broadcast_to(capacity, shape), dtype=np.float64) * 3600.0  # As
+        self.self_discharge: np.ndarray = np.array(np.broadcast_to(self_discharge, shape)) / 86400.0  # soc/s
+        self.internal_resistance: np.ndarray = np.array(np.broadcast_to(internal_resistance, shape))  # Ohm
+        self.bleed_resistance: np.ndarray = np.array(np.broadcast_to(bleed_resistance, shape))  # Ohm
+        self.temperature: np.ndarray = np.array(np.broadcast_to(temperature, shape), dtype=np.float64)  # °C
+        self.chip_temp: np.ndarray = self.temperature.mean(axis=1)
+        self.peak_chip_temp: float = float(self.chip_temp.max())
+        self.current: Callable[[float], float] = current  # A, as a function of the seconds since the start
+        self.step: float = step
+        self.telemetry_interval: float = telemetry_interval
+        self.uptime_interval: float = uptime_interval
+        self.accurate_reading_latency: float = accurate_reading_latency
+        self.balanced_cell_diff: float = balanced_cell_diff
+
+        self.balance_remaining: np.ndarray = np.zeros(shape)  # seconds
+        self.accurate_reading_due: np.ndarray = np.full(number_of_modules, np.inf)
+        self.relays_open: bool = False
+
+        self.clock = VirtualClock()
+        self.start_time: float = self.clock()
+        self._last_step: float = self.start_time
+        self._next_telemetry: float = self.start_time
+
+        self.communicator = SimulatedCommunicator(self)
+        self.battery_system = BatterySystem(number_of_modules, number_of_serial_cells, clock=self.clock)
+        for module in self.battery_system.battery_modules:
+            for cell in module.cells:
+                cell.communication_event.send_balance_request += self.communicator.send_balance_request
+        self.battery_manager = BatteryManager(self.battery_system, self.communicator, config)
+        self.balancer = self.battery_manager.balancer
+        self.scheduler = PeriodicScheduler(self.clock)
+        add_tasks(self.scheduler, self.battery_system, self.communicator, self.battery_manager)
+        # The production periods are sized for the real-time loop, but nothing they look at changes between two
+        # simulation steps, so no task runs more often than once per step
+        for task in self.scheduler.tasks.values():
+            task.period = max(task.period, step)
+        self.scheduler.add_task('simulate', self.simulate_step, period=step)
+
+        self.alarms: dict[str, int] = {'implausible': 0, 'critical': 0, 'warning': 0, 'heartbeat_missed': 0}
+        self._count_alarms()
+        self.energy_bled: float = 0.0  # Wh
+        self.initial_cell_diff: float = self.cell_diff()
+        self.time_to_balance: float | None = 0.0 if self.initial_cell_diff <= balanced_cell_diff else None
+
+    def _count_alarms(self) -> None:
+        def counter(kind: str) -> Callable[..., None]:
+            def count(*_) -> None:
+                self.alarms[kind] += 1
+            return count
+
+        measurements = [self.battery_system.voltage, self.battery_system.current]
+        for module in self.battery_system.battery_modules:
+            measurements += [module.voltage, module.module_temp1, module.module_temp2, module.chip_temp]
+            measurements += [cell.voltage for cell in module.cells]
+            module.heartbeat_event.on_heartbeat_missed += counter('heartbeat_missed')
+        for measurement in measurements:
+            measurement.event.on_implausible += counter('implausible')
+            measurement.event.on_critical += counter('critical')
+            measurement.event.on_warning += counter('warning')
+
+    def ocv(self) -> np.ndarray:
+        return SocCurve.soc_to_voltage_many(np.clip(self.soc, 0.0, 1.0).ravel()).reshape(self.soc.shape)
+
+    def cell_diff(self) -> float:
+        ocv = self.ocv()
+        return float(ocv.max() - ocv.min())
+
+    def request_accurate_readings(self, module_id: int) -> None:
+        self.accurate_reading_due[module_id] = min(self.accurate_reading_due[module_id],
+                                                   self.clock() + self.accurate_reading_latency)
+
+    def start_balancing(self, module_id: int, balance_times: dict[int, float]) -> None:
+        for cell_id, balance_time in balance_times.items():
+            self.balance_remaining[module_id, cell_id] = balance_time
+
+    def _next_event(self) -> float:
+        # Earliest time something observable happens: telemetry or an uptime report is due, an accurate reading
+        # arrives or a cell stops bleeding. Steps before it are skipped and integrated in one go.
+        bleeding = self.balance_remaining[self.balance_remaining > 0]
+        balance_stop = self._last_step + float(bleeding.min()) if bleeding.size else np.inf
+        return min(self._next_telemetry, self._last_step + self.uptime_interval,
+                   float(self.accurate_reading_due.min()), balance_stop)
+
+    def simulate_step(self) -> None:
+        now = self.clock()
+        if now < self._next_event():
+            return
+        dt = now - self._last_step
+        self._last_step = now
+        if dt > 0:
+            self._integrate(now, dt)
+        self._report(now)
+
+    def _integrate(self, now: float, dt: float) -> None:
+        current = 0.0 if self.relays_open else self.current(now - self.start_time)
+        ocv = self.ocv()
+        bleed_time = np.minimum(self.balance_remaining, dt)
+        bleed_current = ocv / self.bleed_resistance
+        bled_charge = bleed_current * bleed_time  # As
+        self.soc -= (current * dt + bled_charge) / self.capacity + self.self_discharge * dt
+        bled_energy = ocv * bled_charge  # Ws
+        self.energy_bled += float(bled_energy.sum()) / 3600.0
+
+        module_power = bled_energy.sum(axis=1) / dt
+        target = self.temperature.mean(axis=1) + self.CHIP_THERMAL_RESISTANCE * module_power
+        self.chip_temp += (1.0 - math.exp(-dt / self.CHIP_THERMAL_TIME_CONSTANT)) * (target - self.chip_temp)
+        self.peak_chip_temp = max(self.peak_chip_temp, float(self.chip_temp.max()))
+
+        bleeding = self.balance_remaining > 0
+        self.balance_remaining = np.maximum(self.balance_remaining - dt, 0.0)
+        stopped = bleeding & (self.balance_remaining == 0)
+        # Like the slave reporting is_balancing=0
+        for module_id, cell_id in np.argwhere(stopped).tolist():
+            self.battery_system.battery_modules[module_id].cells[cell_id].on_balance_discharged_stopped()
+
+        if self.time_to_balance is None and self.cell_diff() <= self.balanced_cell_diff:
+            self.time_to_balance = now - self.start_time
+
+    def _report(self, now: float) -> None:
+        # One batch per step, like the MQTT worker draining a round of messages, so the snapshot is published once
+        with self.battery_system.cell_store.batch():
+            self._report_readings(now)
+
+    def _report_readings(self, now: float) -> None:
+        current = 0.0 if self.relays_open else self.current(now - self.start_time)
+        voltages = self.ocv() - self.internal_resistance * current
+        uptime = int((now - self.start_time) * 1000)
+        modules = self.battery_system.battery_modules
+        for module_id in np.flatnonzero(self.accurate_reading_due <= now).tolist():
+            self.accurate_reading_due[module_id] = np.inf
+            modules[module_id].update_cell_voltages(voltages[module_id].tolist(), accurate=True)
+        for module in modules:
+            module.update_esp_uptime(uptime)
+        if now < self._next_telemetry:
+            return
+        self._next_telemetry = now + self.telemetry_interval
+        # Each module has two temperature sensors, one per half of its cells
+        module_temps = np.stack([half.mean(axis=1) for half in np.array_split(self.temperature, 2, axis=1)], axis=1)
+        readings = zip(modules, voltages.tolist(), module_temps.tolist(), self.chip_temp.tolist())
+        for module, module_voltages, (temp1, temp2), chip_temp in readings:
+            module.update_cell_voltages(module_voltages)
+            module.voltage.update(sum(module_voltages))
+            module.update_module_temps(temp1, temp2)
+            module.chip_temp.update(chip_temp)
+        self.battery_system.voltage.update(float(voltages.sum()))
+        self.battery_system.current.update(current)
+
+    def run(self, duration: float) -> dict:
+        started = time.perf_counter()
+        self.scheduler.run_virtual(duration)
+        return {'simulated_seconds': self.clock() - self.start_time, 'wall_seconds': time.perf_counter() - started,
+                'time_to_balance': self.time_to_balance, 'initial_cell_diff': self.initial_cell_diff,
+                'final_cell_diff': self.cell_diff(), 'energy_bled_wh': self.energy_bled,
+                'safety_disconnects': len(self.communicator.disconnect_reasons), 'alarms': dict(self.alarms),
+                'max_chip_temp': self.peak_chip_temp, 'duty_cycles': self.balancer.duty_cycles()}
+
+
+if __name__ == '__main__':
+    rng = np.random.default_rng(0)
+    modules, cells = 16, 24
+    simulator = PackSimulator(modules, cells, soc=rng.normal(0.6, 0.01, (modules, cells)),
+                              capacity=rng.normal(10.0, 0.2, (modules, cells)),
+                              self_discharge=rng.uniform(0.0002, 0.001, (modules, cells)),
+                              current=lambda t: 2.0 * math.sin(2 * math.pi * t / 86400),
+                              config={'balancing_mode': 'proportional'})
+    print(simulator.run(2 * 86400))
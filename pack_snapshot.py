@@ -0,0 +1,74 @@
+import math
+
+import numpy as np
+
+
+class ColumnSnapshot:
+    # Read-only copy of one measurement column with its extremes taken from the aggregate at publish time
+    def __init__(self, value: np.ndarray, timestamp: np.ndarray, minimum: float | None = None,
+                 maximum: float | None = None) -> None:
+        self.value: np.ndarray = self._frozen(value)
+        self.timestamp: np.ndarray = self._frozen(timestamp)
+        self._min: float | None = minimum
+        self._max: float | None = maximum
+        if len(timestamp) == 0 or np.isnan(timestamp).any():
+            self.oldest_timestamp: float = math.nan
+        else:
+            self.oldest_timestamp: float = float(timestamp.min())
+
+    @classmethod
+    def of(cls, columns) -> 'ColumnSnapshot':
+        aggregate = columns.aggregate
+        if aggregate is not None and aggregate.complete():
+            return cls(columns.value, columns.timestamp, aggregate.total.min(), aggregate.total.max())
+        return cls(columns.value, columns.timestamp)
+
+    @staticmethod
+    def _frozen(values: np.ndarray) -> np.ndarray:
+        values = values.copy()
+        values.setflags(write=False)
+        return values
+
+    def min(self) -> float:
+        if self._min is None:
+            raise TypeError('measurement not initialized')
+        return self._min
+
+    def max(self) -> float:
+        if self._max is None:
+            raise TypeError('measurement not initialized')
+        return self._max
+
+
+class PackSnapshot:
+    # Immutable, versioned view of everything ingested into a CellStateStore. The ingest side builds a new one after
+    # each batch and swaps the store's reference, so a reader holding a snapshot sees one consistent pack state
+    # without taking a lock, however long it keeps it.
+    def __init__(self, version: int, time: float, voltage: ColumnSnapshot, accurate_voltage: ColumnSnapshot,
+                 module_temp: ColumnSnapshot) -> None:
+        self.version: int = version
+        self.time: float = time  # clock at publish
+        self.voltage: ColumnSnapshot = voltage
+        self.accurate_voltage: ColumnSnapshot = accurate_voltage
+        self.module_temp: ColumnSnapshot = module_temp
+        # NaN until every input has been received once
+        oldest = [voltage.oldest_timestamp, accurate_voltage.oldest_timestamp, module_temp.oldest_timestamp]
+        self.oldest_input_time: float = math.nan if any(math.isnan(t) for t in oldest) else min(oldest)
+
+    def age(self, now: float) -> float:
+        # Age of the oldest input in this snapshot, infinite while some input is still missing
+        if math.isnan(self.oldest_input_time):
+            return math.inf
+        return now - self.oldest_input_time
+
+    def lowest_cell_voltage(self) -> float:
+        return self.voltage.min()
+
+    def highest_cell_voltage(self) -> float:
+        return self.voltage.max()
+
+    def lowest_module_temp(self) -> float:
+        return self.module_temp.min()
+
+    def highest_module_temp(self) -> float:
+        return self.module_temp.max()
@@ -0,0 +1,178 @@
+import bisect
+import math
+import threading
+import time
+import traceback
+from typing import Callable
+
+from virtual_clock import VirtualClock
+
+
+class Histogram:
+    DEFAULT_BOUNDS: tuple[float, ...] = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)  # seconds
+
+    def __init__(self, bounds: tuple[float, ...] = DEFAULT_BOUNDS) -> None:
+        self.bounds: tuple[float, ...] = bounds
+        self.counts: list[int] = [0] * (len(bounds) + 1)
+
+    def record(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+
+    def as_dict(self) -> dict[str, int]:
+        buckets = {f'<={bound:g}': count for bound, count in zip(self.bounds, self.counts)}
+        buckets[f'>{self.bounds[-1]:g}'] = self.counts[-1]
+        return buckets
+
+
+class TaskStatistics:
+    def __init__(self) -> None:
+        self.runs: int = 0
+        self.errors: int = 0
+        self.overruns: int = 0
+        self.skipped_runs: int = 0
+        self.last_duration: float = 0.0
+        self.max_duration: float = 0.0
+        self.total_duration: float = 0.0
+        self.max_jitter: float = 0.0
+        self.duration_histogram: Histogram = Histogram()
+        self.jitter_histogram: Histogram = Histogram()
+
+    def record_run(self, duration: float, jitter: float) -> None:
+        self.runs += 1
+        self.last_duration = duration
+        self.total_duration += duration
+        self.max_duration = max(self.max_duration, duration)
+        self.max_jitter = max(self.max_jitter, jitter)
+        self.duration_histogram.record(duration)
+        self.jitter_histogram.record(jitter)
+
+    def record_overrun(self, skipped_runs: int) -> None:
+        self.overruns += 1
+        self.skipped_runs += skipped_runs
+
+    def mean_duration(self) -> float:
+        return self.total_duration / self.runs if self.runs > 0 else 0.0
+
+    def as_dict(self) -> dict:
+        return {'runs': self.runs, 'errors': self.errors, 'overruns': self.overruns,
+                'skipped_runs': self.skipped_runs, 'last_duration': self.last_duration,
+                'max_duration': self.max_duration, 'mean_duration': self.mean_duration(),
+                'max_jitter': self.max_jitter, 'duration_histogram': self.duration_histogram.as_dict(),
+                'jitter_histogram': self.jitter_histogram.as_dict()}
+
+
+class PeriodicTask:
+    MAIN_LANE: str = 'main'
+
+    def __init__(self, name: str, action: Callable[[], None], period: float, initial_delay: float = 0.0,
+                 lane: str = MAIN_LANE) -> None:
+        self.name: str = name
+        self.action: Callable[[], None] = action
+        self.period: float = period  # seconds
+        self.initial_delay: float = initial_delay  # seconds
+        self.lane: str = lane
+        self.next_deadline: float = 0.0
+        self.statistics: TaskStatistics = TaskStatistics()
+
+    def start(self, now: float) -> None:
+        self.next_deadline = now + self.initial_delay
+
+    def run(self) -> None:
+        try:
+            self.action()
+        except Exception as e:
+            self.statistics.errors += 1
+            print(f'{self.name} task Exception', e, traceback.format_exc(), flush=True)
+
+    def schedule_next(self, now: float) -> None:
+        # Deadlines stay on the grid of the first deadline, the task's own runtime never shifts them.
+        # Deadlines that already passed are skipped instead of being caught up in a burst.
+        self.next_deadline += self.period
+        if self.next_deadline <= now:
+            skipped_runs = math.floor((now - self.next_deadline) / self.period) + 1
+            self.next_deadline += skipped_runs * self.period
+            self.statistics.record_overrun(skipped_runs)
+
+
+class PeriodicScheduler:
+    # Runs periodic tasks at fixed absolute deadlines. Every lane has its own thread, so a slow task only delays
+    # the tasks sharing its lane.
+    def __init__(self, clock: Callable[[], float] = time.monotonic) -> None:
+        self._clock: Callable[[], float] = clock
+        self.tasks: dict[str, PeriodicTask] = {}
+        self._stop_event = threading.Event()
+        self._threads: list[threading.Thread] = []
+        self._started: bool = False
+
+    def add_task(self, name: str, action: Callable[[], None], period: float, initial_delay: float = 0.0,
+                 lane: str = PeriodicTask.MAIN_LANE) -> None:
+        self.tasks[name] = PeriodicTask(name, action, period, initial_delay, lane)
+
+    def lanes(self) -> dict[str, list[PeriodicTask]]:
+        lanes: dict[str, list[PeriodicTask]] = {}
+        for task in self.tasks.values():
+            lanes.setdefault(task.lane, []).append(task)
+        return lanes
+
+    def run(self) -> None:
+        # Blocks until stop() is called, the main lane runs on the calling thread
+        lanes = self.lanes()
+        main_lane = lanes.pop(PeriodicTask.MAIN_LANE, [])
+        self._start_tasks()
+        for lane, tasks in lanes.items():
+            thread = threading.Thread(target=self._run_lane, args=(tasks,), name=f'{lane}-lane', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        try:
+            self._run_lane(main_lane)
+        finally:
+            self.stop()
+
+    def run_virtual(self, duration: float) -> None:
+        # Runs every lane on the calling thread in deadline order, jumping the virtual clock from one deadline to
+        # the next instead of waiting, timers started with call_later fire in between
+        assert isinstance(self._clock, VirtualClock)
+        end = self._clock() + duration
+        self._start_tasks()
+        while self.tasks:
+            task = min(self.tasks.values(), key=lambda t: t.next_deadline)
+            if task.next_deadline > end:
+                break
+            self._clock.advance_to(task.next_deadline)
+            start = self._clock()
+            task.run()
+            task.statistics.record_run(0.0, start - task.next_deadline)
+            task.schedule_next(self._clock())
+        self._clock.advance_to(end)
+
+    def _start_tasks(self) -> None:
+        if self._started:
+            return
+        self._started = True
+        now = self._clock()
+        for task in self.tasks.values():
+            task.start(now)
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        for thread in self._threads:
+            if thread is not threading.current_thread():
+                thread.join()
+        self._threads.clear()
+
+    def _run_lane(self, tasks: list[PeriodicTask]) -> None:
+        if not tasks:
+            self._stop_event.wait()
+            return
+        while True:
+            task = min(tasks, key=lambda t: t.next_deadline)
+            if self._stop_event.wait(max(0.0, task.next_deadline - self._clock())):
+                return
+            start = self._clock()
+            task.run()
+            end = self._clock()
+            task.statistics.record_run(end - start, start - task.next_deadline)
+            task.schedule_next(end)
+
+    def statistics_dict(self) -> dict[str, dict]:
+        return {name: task.statistics.as_dict() for name, task in self.tasks.items()}
@@ -0,0 +1,47 @@
+import time
+from typing import Callable
+
+
+class PublishCache:
+    # Remembers the last payload sent per topic and suppresses repeats until max_interval has passed
+    def __init__(self, publish: Callable[..., None], max_interval: float,
+                 clock: Callable[[], float] = time.monotonic) -> None:
+        self._publish: Callable[..., None] = publish
+        self.max_interval: float = max_interval
+        self._clock: Callable[[], float] = clock
+        self._last_sent: dict[str, tuple[str, float]] = {}
+
+        self.sent: int = 0
+        self.suppressed: int = 0
+
+    def _is_suppressed(self, topic: str, payload: str, deadband: float, now: float) -> bool:
+        last_sent = self._last_sent.get(topic)
+        if last_sent is None:
+            return False
+        last_payload, last_time = last_sent
+        if now - last_time >= self.max_interval:
+            return False
+        if payload == last_payload:
+            return True
+        if deadband <= 0.0:
+            return False
+        try:
+            return abs(float(payload) - float(last_payload)) <= deadband
+        except ValueError:
+            return False
+
+    def publish(self, topic: str, payload: str, retain: bool = False, deadband: float = 0.0) -> bool:
+        now = self._clock()
+        if self._is_suppressed(topic, payload, deadband, now):
+            self.suppressed += 1
+            return False
+        self._publish(topic=topic, payload=payload, retain=retain)
+        self._last_sent[topic] = (payload, now)
+        self.sent += 1
+        return True
+
+    def invalidate(self, topic: str | None = None) -> None:
+        if topic is None:
+            self._last_sent.clear()
+        else:
+            self._last_sent.pop(topic, None)
@@ -0,0 +1,138 @@
+import threading
+import time
+from collections import OrderedDict
+from collections import deque
+from enum import IntEnum
+from typing import Callable
+
+import paho.mqtt.client as mqtt
+
+
+class PublishPriority(IntEnum):
+    SAFETY = 0
+    CONTROL = 1
+    TELEMETRY = 2
+
+
+class PublishClassStatistics:
+    def __init__(self) -> None:
+        self.depth: int = 0
+        self.max_depth: int = 0
+        self.published: int = 0
+        self.coalesced: int = 0
+        self.max_time_in_queue: float = 0.0
+        self.total_time_in_queue: float = 0.0
+
+    def record_published(self, time_in_queue: float) -> None:
+        self.published += 1
+        self.total_time_in_queue += time_in_queue
+        self.max_time_in_queue = max(self.max_time_in_queue, time_in_queue)
+
+    def mean_time_in_queue(self) -> float:
+        return self.total_time_in_queue / self.published if self.published > 0 else 0.0
+
+    def as_dict(self) -> dict[str, float]:
+        return {'depth': self.depth, 'max_depth': self.max_depth, 'published': self.published,
+                'coalesced': self.coalesced, 'max_time_in_queue': self.max_time_in_queue,
+                'mean_time_in_queue': self.mean_time_in_queue()}
+
+
+class PublishScheduler:
+    # Safety messages are handed to paho right away from the caller's thread. Control messages are sent in order
+    # ahead of telemetry, telemetry is coalesced per topic and rate limited with a token bucket.
+    def __init__(self, client: mqtt.Client, telemetry_rate: float, telemetry_burst: int,
+                 clock: Callable[[], float] = time.monotonic) -> None:
+        self._client: mqtt.Client = client
+        self.telemetry_rate: float = telemetry_rate  # messages per second
+        self.telemetry_burst: int = telemetry_burst
+        self._clock: Callable[[], float] = clock
+
+        self._condition = threading.Condition()
+        self._control: deque[tuple[str, str, bool, float]] = deque()
+        self._telemetry: OrderedDict[str, tuple[str, bool, float]] = OrderedDict()
+        self._tokens: float = float(telemetry_burst)
+        self._last_refill: float = clock()
+        self._running: bool = False
+        self._thread: threading.Thread | None = None
+        # Called after a message was queued, lets an event loop drain the queues instead of the worker thread
+        self.on_pending: Callable[[], None] | None = None
+
+        self.statistics: dict[PublishPriority, PublishClassStatistics] = {
+            priority: PublishClassStatistics() for priority in PublishPriority}
+
+    def publish(self, topic: str, payload: str, retain: bool = False,
+                priority: PublishPriority = PublishPriority.TELEMETRY) -> None:
+        if priority == PublishPriority.SAFETY:
+            start = self._clock()
+            self._client.publish(topic=topic, payload=payload, retain=retain)
+            self.statistics[priority].record_published(self._clock() - start)
+            return
+
+        with self._condition:
+            statistics = self.statistics[priority]
+            if priority == PublishPriority.CONTROL:
+                self._control.append((topic, payload, retain, self._clock()))
+            elif topic in self._telemetry:
+                # Keep the queue position and enqueue time, only the newest payload gets sent
+                enqueue_time = self._telemetry[topic][2]
+                self._telemetry[topic] = (payload, retain, enqueue_time)
+                statistics.coalesced += 1
+            else:
+                self._telemetry[topic] = (payload, retain, self._clock())
+            statistics.depth = len(self._control) if priority == PublishPriority.CONTROL else len(self._telemetry)
+            statistics.max_depth = max(statistics.max_depth, statistics.depth)
+            self._condition.notify()
+        if self.on_pending is not None:
+            self.on_pending()
+
+    def _refill_tokens(self, now: float) -> None:
+        self._tokens = min(float(self.telemetry_burst), self._tokens + (now - self._last_refill) * self.telemetry_rate)
+        self._last_refill = now
+
+    def process_pending(self) -> float | None:
+        # Publishes everything that is due, returns the seconds until more telemetry may be sent
+        with self._condition:
+            batch: list[tuple[PublishPriority, str, str, bool, float]] = []
+            while self._control:
+                topic, payload, retain, enqueue_time = self._control.popleft()
+                batch.append((PublishPriority.CONTROL, topic, payload, retain, enqueue_time))
+            self._refill_tokens(self._clock())
+            while self._telemetry and self._tokens >= 1.0:
+                topic, (payload, retain, enqueue_time) = self._telemetry.popitem(last=False)
+                batch.append((PublishPriority.TELEMETRY, topic, payload, retain, enqueue_time))
+                self._tokens -= 1.0
+            self.statistics[PublishPriority.CONTROL].depth = 0
+            self.statistics[PublishPriority.TELEMETRY].depth = len(self._telemetry)
+            wait = (1.0 - self._tokens) / self.telemetry_rate if self._telemetry else None
+
+        for priority, topic, payload, retain, enqueue_time in batch:
+            self._client.publish(topic=topic, payload=payload, retain=retain)
+            self.statistics[priority].record_published(self._clock() - enqueue_time)
+        return wait
+
+    def _run(self) -> None:
+        while True:
+            wait = self.process_pending()
+            with self._condition:
+                if not self._running:
+                    return
+                if not self._control and (not self._telemetry or wait is not None):
+                    self._condition.wait(timeout=wait)
+
+    def start(self) -> None:
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name='publish-scheduler', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        with self._condition:
+            self._running = False
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        # Hand over whatever was queued while the worker was shutting down
+        self.process_pending()
+
+    def statistics_dict(self) -> dict[str, dict[str, float]]:
+        return {priority.name.lower(): statistics.as_dict() for priority, statistics in self.statistics.items()}
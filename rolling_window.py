@@ -0,0 +1,79 @@
+import time
+from collections import deque
+from typing import Callable
+
+
+class RollingWindow:
+    # Time-windowed sum/mean/min/max with O(1) amortized updates, timed with a monotonic clock
+    def __init__(self, window_seconds: float, max_samples: int, clock: Callable[[], float] = time.monotonic) -> None:
+        assert max_samples > 0
+        self.window_seconds: float = window_seconds
+        self.max_samples: int = max_samples
+        self._clock: Callable[[], float] = clock
+
+        self._samples: deque[tuple[int, float, float]] = deque()
+        self._min_candidates: deque[tuple[int, float]] = deque()
+        self._max_candidates: deque[tuple[int, float]] = deque()
+        self._sum: float = 0.0
+        self._sequence: int = 0
+        self._evictions_since_resum: int = 0
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def add(self, value: float) -> None:
+        now = self._clock()
+        sequence = self._sequence
+        self._sequence += 1
+
+        self._samples.append((sequence, now, value))
+        self._sum += value
+        while self._min_candidates and self._min_candidates[-1][1] >= value:
+            self._min_candidates.pop()
+        self._min_candidates.append((sequence, value))
+        while self._max_candidates and self._max_candidates[-1][1] <= value:
+            self._max_candidates.pop()
+        self._max_candidates.append((sequence, value))
+
+        while len(self._samples) > self.max_samples:
+            self._evict_oldest()
+        self._evict_expired(now)
+
+    def _evict_oldest(self) -> None:
+        sequence, _, value = self._samples.popleft()
+        self._sum -= value
+        if self._min_candidates[0][0] == sequence:
+            self._min_candidates.popleft()
+        if self._max_candidates[0][0] == sequence:
+            self._max_candidates.popleft()
+
+        # Re-sum now and then so the running sum does not accumulate rounding errors
+        self._evictions_since_resum += 1
+        if self._evictions_since_resum >= self.max_samples:
+            self._evictions_since_resum = 0
+            self._sum = sum(sample[2] for sample in self._samples)
+
+    def _evict_expired(self, now: float) -> None:
+        # Always keep the newest sample, like the window it replaces
+        while len(self._samples) > 1 and self._samples[0][1] + self.window_seconds < now:
+            self._evict_oldest()
+
+    def count(self) -> int:
+        self._evict_expired(self._clock())
+        return len(self._samples)
+
+    def sum(self) -> float:
+        self._evict_expired(self._clock())
+        return self._sum
+
+    def mean(self) -> float:
+        self._evict_expired(self._clock())
+        return self._sum / len(self._samples)
+
+    def min(self) -> float:
+        self._evict_expired(self._clock())
+        return self._min_candidates[0][1]
+
+    def max(self) -> float:
+        self._evict_expired(self._clock())
+        return self._max_candidates[0][1]
@@ -1,32 +1,75 @@
 import time
 import traceback
-from typing import Any
+from functools import partial
+from typing import Any, Callable
 
 import paho.mqtt.client as mqtt
 
 from battery_cell import BatteryCell
 from battery_module import BatteryModule
 from battery_system import BatterySystem
+from cell_voltage_frame import CellVoltageFrame
+from ingest_queue import IngestQueue
+from measurement import Measurement
+from publish_cache import PublishCache
+from publish_scheduler import PublishPriority
+from publish_scheduler import PublishScheduler
 from slave_communicator_events import SlaveCommunicatorEvents
 from utils import get_config
 
 
 class SlaveCommunicator:
-    def __init__(self, master_config: dict, battery_system: BatterySystem):
+    # Deadbands for informational telemetry, master/can topics are only suppressed when unchanged
+    CELL_VOLTAGE_DEADBAND: float = 0.002  # V
+    SYSTEM_VOLTAGE_DEADBAND: float = 0.1  # V
+    SOC_DEADBAND: float = 0.1  # %
+    POWER_DEADBAND: float = 10.0  # W
+
+    DEFAULT_PUBLISH_MAX_INTERVAL: float = 30.0  # seconds
+    DEFAULT_TELEMETRY_RATE: float = 50.0  # messages per second
+    DEFAULT_TELEMETRY_BURST: int = 50
+    # Topics the ingest queue never coalesces or drops: configuration, the is_balancing state the balancer waits for
+    # and the low-rate module and pack measurements behind the safety disconnects and heartbeats. Only the per-cell
+    # voltage streams are shed under overflow.
+    CONTROL_TOPIC_PREFIXES: tuple[str, ...] = ('master/', 'esp-total/')
+    CONTROL_TOPIC_SUFFIXES: tuple[str, ...] = ('/is_balancing', '/uptime', '/module_voltage', '/module_temps',
+                                               '/chip_temp')
+    # An uptime drop beyond reordered delivery means the ESP rebooted and restarted its frame sequence
+    ESP_REBOOT_UPTIME_DROP: int = 10000  # ms
+    DEFAULT_INGEST_QUEUE_SIZE: int = 4096
+    DEFAULT_INGEST_BATCH_SIZE: int = 256
+
+    def __init__(self, master_config: dict, battery_system: BatterySystem, threaded: bool = True):
         credentials = get_config('credentials.yaml')
         self._slave_mapping = get_config('slave_mapping.yaml')
 
         self.events: SlaveCommunicatorEvents = SlaveCommunicatorEvents()
+        self._dispatch: dict[str, Callable[[bytes], None]] = {}
+        self._last_frame_sequence: dict[tuple[int, bool], int] = {}
+        self._wildcard_subscriptions: bool = master_config.get('mqtt_wildcard_subscriptions', True)
+        self._batched_balance_requests: bool = master_config.get('mqtt_batched_balance_requests', False)
 
         self._mqtt_client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
         self._mqtt_client.on_connect = self._mqtt_on_connect
         self._mqtt_client.on_message = self._mqtt_on_message
 
+        self._ingest_queue: IngestQueue = IngestQueue(
+            self._process_message, master_config.get('mqtt_ingest_queue_size', self.DEFAULT_INGEST_QUEUE_SIZE),
+            master_config.get('mqtt_ingest_batch_size', self.DEFAULT_INGEST_BATCH_SIZE),
+            batch_context=battery_system.cell_store.batch)
+        self._publish_scheduler: PublishScheduler = PublishScheduler(
+            self._mqtt_client, master_config.get('mqtt_telemetry_rate', self.DEFAULT_TELEMETRY_RATE),
+            master_config.get('mqtt_telemetry_burst', self.DEFAULT_TELEMETRY_BURST))
+        self._publish_cache: PublishCache = PublishCache(
+            self._publish_scheduler.publish,
+            master_config.get('mqtt_publish_max_interval', self.DEFAULT_PUBLISH_MAX_INTERVAL))
+
         self._mqtt_client.username_pw_set(credentials['username'], credentials['password'])
         self._mqtt_client.will_set('master/core/available', 'offline', retain=True)
         if master_config.get('mqtt_ssl', False):
             self._mqtt_client.tls_set(credentials['mqtt_cert_path'])
-        self._mqtt_client.connect(host=master_config['mqtt_server'], port=master_config['mqtt_port'])
+        self._mqtt_host: str = master_config['mqtt_server']
+        self._mqtt_port: int = master_config['mqtt_port']
 
         self._battery_system = battery_system
         for battery_module in self._battery_system.battery_modules:
@@ -40,160 +83,212 @@ class SlaveCommunicator:
             self._last_time[i + 1] = 0
         #     self._lines_to_write[i + 1] = []
 
-        self._mqtt_client.loop_start()
         self.start_time = time.time()
+        if threaded:
+            # Otherwise the owner of an event loop drives the client, see AsyncRuntime
+            self.connect()
+            self._mqtt_client.loop_start()
+            self._ingest_queue.start()
+            self._publish_scheduler.start()
+
+    def connect(self) -> None:
+        self._mqtt_client.connect(host=self._mqtt_host, port=self._mqtt_port)
+
+    @property
+    def mqtt_client(self) -> mqtt.Client:
+        return self._mqtt_client
+
+    @property
+    def ingest_queue(self) -> IngestQueue:
+        return self._ingest_queue
+
+    @property
+    def publish_scheduler(self) -> PublishScheduler:
+        return self._publish_scheduler
+
+    def ingest_statistics(self) -> dict[str, float]:
+        return self._ingest_queue.statistics.as_dict()
+
+    def publish_statistics(self) -> dict:
+        return {'sent': self._publish_cache.sent, 'suppressed': self._publish_cache.suppressed,
+                'queues': self._publish_scheduler.statistics_dict()}
 
     def uptime_seconds(self) -> float:
         return time.time() - self.start_time
 
     def send_heartbeat(self):
-        self._mqtt_client.publish(topic='master/uptime', payload=f'{self.uptime_seconds() * 1000:.0f}')
+        self._publish_scheduler.publish(topic='master/uptime', payload=f'{self.uptime_seconds() * 1000:.0f}',
+                                        priority=PublishPriority.CONTROL)
 
     def open_battery_relays(self, reason: str = None):
-        print('open_battery_relays called.')
-        self._mqtt_client.publish(topic='master/relays/battery_plus/set', payload='off')
-        self._mqtt_client.publish(topic='master/relays/battery_precharge/set', payload='off')
-        self._mqtt_client.publish(topic='master/relays/battery_minus/set', payload='off')
-        self._mqtt_client.publish(topic='master/can/limits/max_voltage/set', payload='0')
-        self._mqtt_client.publish(topic='master/can/limits/min_voltage/set', payload='0')
-        self._mqtt_client.publish(topic='master/can/limits/max_discharge_current/set', payload='0')
-        self._mqtt_client.publish(topic='master/can/limits/max_charge_current/set', payload='0')
-
-        self._mqtt_client.publish(topic='master/core/safety_disconnect_reason', payload=reason, retain=True)
+        self._log('open_battery_relays called.')
+        for topic in ('master/relays/battery_plus/set',
+                      'master/relays/battery_precharge/set',
+                      'master/relays/battery_minus/set'):
+            self._publish_scheduler.publish(topic=topic, payload='off', priority=PublishPriority.SAFETY)
+        for topic in ('master/can/limits/max_voltage/set',
+                      'master/can/limits/min_voltage/set',
+                      'master/can/limits/max_discharge_current/set',
+                      'master/can/limits/max_charge_current/set'):
+            self._publish_scheduler.publish(topic=topic, payload='0', priority=PublishPriority.SAFETY)
+
+        self._publish_scheduler.publish(topic='master/core/safety_disconnect_reason', payload=reason, retain=True,
+                                        priority=PublishPriority.SAFETY)
 
     def close_battery_perform_precharge(self):
-        self._mqtt_client.publish(topic='master/relays/perform_precharge', payload='on')
+        self._publish_scheduler.publish(topic='master/relays/perform_precharge', payload='on',
+                                        priority=PublishPriority.CONTROL)
 
     def send_balance_request(self, module_number: int, cell_number: int, balance_time_s: float):
-        self._mqtt_client.publish(topic=f'esp-module/{module_number + 1}/cell/{cell_number + 1}/balance_request',
-                                  payload=f'{int(balance_time_s * 1000)}')
+        self._publish_scheduler.publish(topic=f'esp-module/{module_number + 1}/cell/{cell_number + 1}/balance_request',
+                                        payload=f'{int(balance_time_s * 1000)}', priority=PublishPriority.CONTROL)
+
+    def send_module_balance_request(self, module_number: int, balance_times: dict[int, float]):
+        # One message per module, "cell:ms,..." with 1-based cell numbers. The per-cell topic is kept for slaves
+        # without support, see mqtt_batched_balance_requests
+        if not self._batched_balance_requests:
+            for cell_number, balance_time_s in balance_times.items():
+                self.send_balance_request(module_number, cell_number, balance_time_s)
+            return
+        payload = ','.join(f'{cell_number + 1}:{int(balance_time_s * 1000)}'
+                           for cell_number, balance_time_s in sorted(balance_times.items()))
+        self._publish_scheduler.publish(topic=f'esp-module/{module_number + 1}/balance_request', payload=payload,
+                                        priority=PublishPriority.CONTROL)
 
     def send_accurate_reading_request(self, module_number: int):
-        self._mqtt_client.publish(topic=f'esp-module/{module_number + 1}/read_accurate', payload='1')
+        self._publish_scheduler.publish(topic=f'esp-module/{module_number + 1}/read_accurate', payload='1',
+                                        priority=PublishPriority.CONTROL)
 
     def send_balancer_cell_diff(self, cell_diff: float):
-        self._mqtt_client.publish(topic='master/core/balancer_cell_diff', payload=f'{cell_diff:.3f}', retain=True)
+        self._publish_cache.publish(topic='master/core/balancer_cell_diff', payload=f'{cell_diff:.3f}', retain=True)
 
     def send_balancer_cell_min_max(self, min_voltage: float, max_voltage: float):
-        self._mqtt_client.publish(topic='master/core/balancer_min_voltage', payload=f'{min_voltage:.3f}', retain=True)
-        self._mqtt_client.publish(topic='master/core/balancer_max_voltage', payload=f'{max_voltage:.3f}', retain=True)
+        self._publish_cache.publish(topic='master/core/balancer_min_voltage', payload=f'{min_voltage:.3f}', retain=True)
+        self._publish_cache.publish(topic='master/core/balancer_max_voltage', payload=f'{max_voltage:.3f}', retain=True)
 
     def send_limits(self):
         # master/core/limits/system/voltage
-        self._mqtt_client.publish(topic='master/core/limits/system/voltage/upper_implausible', payload=f'{self._battery_system.voltage_limits.implausible_upper:.3f}', retain=True)
-        self._mqtt_client.publish(topic='master/core/limits/system/voltage/lower_implausible', payload=f'{self._battery_system.voltage_limits.implausible_lower:.3f}', retain=True)
-        self._mqtt_client.publish(topic='master/core/limits/system/voltage/upper_critical', payload=f'{self._battery_system.voltage_limits.critical_upper:.3f}', retain=True)
-        self._mqtt_client.publish(topic='master/core/limits/system/voltage/lower_critical', payload=f'{self._battery_system.voltage_limits.critical_lower:.3f}', retain=True)
-        self._mqtt_client.publish(topic='master/core/limits/system/voltage/upper_warning', payload=f'{self._battery_system.voltage_limits.warning_upper:.3f}', retain=True)
-        self._mqtt_client.publish(topic='master/core/limits/system/voltage/lower_warning', payload=f'{self._battery_system.voltage_limits.warning_lower:.3f}', retain=True)
+        self._publish_cache.publish(topic='master/core/limits/system/voltage/upper_implausible', payload=f'{self._battery_system.voltage_limits.implausible_upper:.3f}', retain=True)
+        self._publish_cache.publish(topic='master/core/limits/system/voltage/lower_implausible', payload=f'{self._battery_system.voltage_limits.implausible_lower:.3f}', retain=True)
+        self._publish_cache.publish(topic='master/core/limits/system/voltage/upper_critical', payload=f'{self._battery_system.voltage_limits.critical_upper:.3f}', retain=True)
+        self._publish_cache.publish(topic='master/core/limits/system/voltage/lower_critical', payload=f'{self._battery_system.voltage_limits.critical_lower:.3f}', retain=True)
+        self._publish_cache.publish(topic='master/core/limits/system/voltage/upper_warning', payload=f'{self._battery_system.voltage_limits.warning_upper:.3f}', retain=True)
+        self._publish_cache.publish(topic='master/core/limits/system/voltage/lower_warning', payload=f'{self._battery_system.voltage_limits.warning_lower:.3f}', retain=True)
 
         # master/core/limits/system/current
-        self._mqtt_client.publish(topic='master/core/limits/system/current/upper_implausible', payload=f'{self._battery_system.current_limits.implausible_upper:.3f}', retain=True)
-        self._mqtt_client.publish(topic='master/core/limits/system/current/lower_implausible', payload=f'{self._battery_system.current_limits.implausible_lower:.3f}', retain=True)
-        self._mqtt_client.publish(topic='master/core/limits/system/current/upper_critical', payload=f'{self._battery_system.current_limits.critical_upper:.3f}', retain=True)
-        self._mqtt_client.publish(topic='master/core/limits/system/current/lower_critical', payload=f'{self._battery_system.current_limits.critical_lower:.3f}', retain=True)
-        self._mqtt_client.publish(topic='master/core/limits/system/current/upper_warning', payload=f'{self._battery_system.current_limits.warning_upper:.3f}', retain=True)
-        self._mqtt_client.publish(topic='master/core/limits/system/current/lower_warning', payload=f'{self._battery_system.current_limits.warning_lower:.3f}', retain=True)
+        self._publish_cache.publish(topic='master/core/limits/system/current/upper_implausible', payload=f'{self._battery_system.current_limits.implausible_upper:.3f}', retain=True)
+        self._publish_cache.publish(topic='master/core/limits/system/current/lower_implausible', payload=f'{self._battery_system.current_limits.implausible_lower:.3f}', retain=True)
+        self._publish_cache.publish(topic='master/core/limits/system/current/upper_critical', payload=f'{self._battery_system.current_limits.critical_upper:.3f}', retain=True)
+        self._publish_cache.publish(topic='master/core/limits/system/current/lower_critical', payload=f'{self._battery_system.current_limits.critical_lower:.3f}', retain=True)
+        self._publish_cache.publish(topic='master/core/limits/system/current/upper_warning', payload=f'{self._battery_system.current_limits.warning_upper:.3f}', retain=True)
+        self._publish_cache.publish(topic='master/core/limits/system/current/lower_warning', payload=f'{self._battery_system.current_limits.warning_lower:.3f}', retain=True)
 
         # master/core/limits/module/voltage
         module_voltage_limits = self._battery_system.battery_modules[0].voltage_limits
-        self._mqtt_client.publish(topic='master/core/limits/module/voltage/upper_implausible', payload=f'{module_voltage_limits.implausible_upper:.3f}', retain=True)
-        self._mqtt_client.publish(topic='master/core/limits/module/voltage/lower_implausible', payload=f'{module_voltage_limits.implausible_lower:.3f}', retain=True)
-        self._mqtt_client.publish(topic='master/core/limits/module/voltage/upper_critical', payload=f'{module_voltage_limits.critical_upper:.3f}', retain=True)
-        self._mqtt_client.publish(topic='master/core/limits/module/voltage/lower_critical', payload=f'{module_voltage_limits.critical_lower:.3f}', retain=True)
-        self._mqtt_client.publish(topic='master/core/limits/module/voltage/upper_warning', payload=f'{module_voltage_limits.warning_upper:.3f}', retain=True)
-        self._mqtt_client.publish(topic='master/core/limits/module/voltage/lower_warning', payload=f'{module_voltage_limits.warning_lower:.3f}', retain=True)
+        self._publish_cache.publish(topic='master/core/limits/module/voltage/upper_implausible', payload=f'{module_voltage_limits.implausible_upper:.3f}', retain=True)
+        self._publish_cache.publish(topic='master/core/limits/module/voltage/lower_implausible', payload=f'{module_voltage_limits.implausible_lower:.3f}', retain=True)
+        self._publish_cache.publish(topic='master/core/limits/module/voltage/upper_critical', payload=f'{module_voltage_limits.critical_upper:.3f}', retain=True)
+        self._publish_cache.publish(topic='master/core/limits/module/voltage/lower_critical', payload=f'{module_voltage_limits.critical_lower:.3f}', retain=True)
+        self._publish_cache.publish(topic='master/core/limits/module/voltage/upper_warning', payload=f'{module_voltage_limits.warning_upper:.3f}', retain=True)
+        self._publish_cache.publish(topic='master/core/limits/module/voltage/lower_warning', payload=f'{module_voltage_limits.warning_lower:.3f}', retain=True)
 
         # master/core/limits/module/chip_temp
         chip_temp_limits = self._battery_system.battery_modules[0].chip_temp_limits
-        self._mqtt_client.publish(topic='master/core/limits/module/chip_temp/upper_implausible', payload=f'{chip_temp_limits.implausible_upper:.3f}', retain=True)
-        self._mqtt_client.publish(topic='master/core/limits/module/chip_temp/lower_implausible', payload=f'{chip_temp_limits.implausible_lower:.3f}', retain=True)
-        self._mqtt_client.publish(topic='master/core/limits/module/chip_temp/upper_critical', payload=f'{chip_temp_limits.critical_upper:.3f}', retain=True)
-        self._mqtt_client.publish(topic='master/core/limits/module/chip_temp/lower_critical', payload=f'{chip_temp_limits.critical_lower:.3f}', retain=True)
-        self._mqtt_client.publish(topic='master/core/limits/module/chip_temp/upper_warning', payload=f'{chip_temp_limits.warning_upper:.3f}', retain=True)
-        self._mqtt_client.publish(topic='master/core/limits/module/chip_temp/lower_warning', payload=f'{chip_temp_limits.warning_lower:.3f}', retain=True)
+        self._publish_cache.publish(topic='master/core/limits/module/chip_temp/upper_implausible', payload=f'{chip_temp_limits.implausible_upper:.3f}', retain=True)
+        self._publish_cache.publish(topic='master/core/limits/module/chip_temp/lower_implausible', payload=f'{chip_temp_limits.implausible_lower:.3f}', retain=True)
+        self._publish_cache.publish(topic='master/core/limits/module/chip_temp/upper_critical', payload=f'{chip_temp_limits.critical_upper:.3f}', retain=True)
+        self._publish_cache.publish(topic='master/core/limits/module/chip_temp/lower_critical', payload=f'{chip_temp_limits.critical_lower:.3f}', retain=True)
+        self._publish_cache.publish(topic='master/core/limits/module/chip_temp/upper_warning', payload=f'{chip_temp_limits.warning_upper:.3f}', retain=True)
+        self._publish_cache.publish(topic='master/core/limits/module/chip_temp/lower_warning', payload=f'{chip_temp_limits.warning_lower:.3f}', retain=True)
 
         # master/core/limits/module/module_temp
         module_temp_limits = self._battery_system.battery_modules[0].module_temp_limits
-        self._mqtt_client.publish(topic='master/core/limits/module/module_temp/upper_implausible', payload=f'{module_temp_limits.implausible_upper:.3f}', retain=True)
-        self._mqtt_client.publish(topic='master/core/limits/module/module_temp/lower_implausible', payload=f'{module_temp_limits.implausible_lower:.3f}', retain=True)
-        self._mqtt_client.publish(topic='master/core/limits/module/module_temp/upper_critical', payload=f'{module_temp_limits.critical_upper:.3f}', retain=True)
-        self._mqtt_client.publish(topic='master/core/limits/module/module_temp/lower_critical', payload=f'{module_temp_limits.critical_lower:.3f}', retain=True)
-        self._mqtt_client.publish(topic='master/core/limits/module/module_temp/upper_warning', payload=f'{module_temp_limits.warning_upper:.3f}', retain=True)
-        self._mqtt_client.publish(topic='master/core/limits/module/module_temp/lower_warning', payload=f'{module_temp_limits.warning_lower:.3f}', retain=True)
+        self._publish_cache.publish(topic='master/core/limits/module/module_temp/upper_implausible', payload=f'{module_temp_limits.implausible_upper:.3f}', retain=True)
+        self._publish_cache.publish(topic='master/core/limits/module/module_temp/lower_implausible', payload=f'{module_temp_limits.implausible_lower:.3f}', retain=True)
+        self._publish_cache.publish(topic='master/core/limits/module/module_temp/upper_critical', payload=f'{module_temp_limits.critical_upper:.3f}', retain=True)
+        self._publish_cache.publish(topic='master/core/limits/module/module_temp/lower_critical', payload=f'{module_temp_limits.critical_lower:.3f}', retain=True)
+        self._publish_cache.publish(topic='master/core/limits/module/module_temp/upper_warning', payload=f'{module_temp_limits.warning_upper:.3f}', retain=True)
+        self._publish_cache.publish(topic='master/core/limits/module/module_temp/lower_warning', payload=f'{module_temp_limits.warning_lower:.3f}', retain=True)
 
         # master/core/limits/cell/voltage
         cell_voltage_limits = self._battery_system.battery_modules[0].cells[0].limits
-        self._mqtt_client.publish(topic='master/core/limits/cell/voltage/upper_implausible', payload=f'{cell_voltage_limits.implausible_upper:.3f}', retain=True)
-        self._mqtt_client.publish(topic='master/core/limits/cell/voltage/lower_implausible', payload=f'{cell_voltage_limits.implausible_lower:.3f}', retain=True)
-        self._mqtt_client.publish(topic='master/core/limits/cell/voltage/upper_critical', payload=f'{cell_voltage_limits.critical_upper:.3f}', retain=True)
-        self._mqtt_client.publish(topic='master/core/limits/cell/voltage/lower_critical', payload=f'{cell_voltage_limits.critical_lower:.3f}', retain=True)
-        self._mqtt_client.publish(topic='master/core/limits/cell/voltage/upper_warning', payload=f'{cell_voltage_limits.warning_upper:.3f}', retain=True)
-        self._mqtt_client.publish(topic='master/core/limits/cell/voltage/lower_warning', payload=f'{cell_voltage_limits.warning_lower:.3f}', retain=True)
+        self._publish_cache.publish(topic='master/core/limits/cell/voltage/upper_implausible', payload=f'{cell_voltage_limits.implausible_upper:.3f}', retain=True)
+        self._publish_cache.publish(topic='master/core/limits/cell/voltage/lower_implausible', payload=f'{cell_voltage_limits.implausible_lower:.3f}', retain=True)
+        self._publish_cache.publish(topic='master/core/limits/cell/voltage/upper_critical', payload=f'{cell_voltage_limits.critical_upper:.3f}', retain=True)
+        self._publish_cache.publish(topic='master/core/limits/cell/voltage/lower_critical', payload=f'{cell_voltage_limits.critical_lower:.3f}', retain=True)
+        self._publish_cache.publish(topic='master/core/limits/cell/voltage/upper_warning', payload=f'{cell_voltage_limits.warning_upper:.3f}', retain=True)
+        self._publish_cache.publish(topic='master/core/limits/cell/voltage/lower_warning', payload=f'{cell_voltage_limits.warning_lower:.3f}', retain=True)
 
     def send_battery_system_state(self):
         for battery_module in self._battery_system.battery_modules:
             try:
                 min_cell: BatteryCell = battery_module.min_voltage_cell()
                 max_cell: BatteryCell = battery_module.max_voltage_cell()
-                self._mqtt_client.publish(topic=f'esp-module/{min_cell.module_id + 1}/min_cell_voltage',
-                                          payload=f'{min_cell.voltage.value}')
-                self._mqtt_client.publish(topic=f'esp-module/{max_cell.module_id + 1}/max_cell_voltage',
-                                          payload=f'{max_cell.voltage.value}')
+                self._publish_cache.publish(topic=f'esp-module/{min_cell.module_id + 1}/min_cell_voltage',
+                                            payload=f'{min_cell.voltage.value}', deadband=self.CELL_VOLTAGE_DEADBAND)
+                self._publish_cache.publish(topic=f'esp-module/{max_cell.module_id + 1}/max_cell_voltage',
+                                            payload=f'{max_cell.voltage.value}', deadband=self.CELL_VOLTAGE_DEADBAND)
             except TypeError:
                 pass
         try:
-            self._mqtt_client.publish(topic='master/can/battery/soc/set',
-                                      payload=f'{self._battery_system.sliding_window_soc() * 100.0:.2f}')
-            self._mqtt_client.publish(topic='master/core/load_adjusted_soc',
-                                      payload=f'{self._battery_system.load_adjusted_soc() * 100.0:.2f}')
-            self._mqtt_client.publish(topic='master/core/soc', payload=f'{self._battery_system.soc() * 100.0:.2f}')
+            self._publish_cache.publish(topic='master/can/battery/soc/set',
+                                        payload=f'{self._battery_system.sliding_window_soc() * 100.0:.2f}')
+            self._publish_cache.publish(topic='master/core/load_adjusted_soc',
+                                        payload=f'{self._battery_system.load_adjusted_soc() * 100.0:.2f}',
+                                        deadband=self.SOC_DEADBAND)
+            self._publish_cache.publish(topic='master/core/soc', payload=f'{self._battery_system.soc() * 100.0:.2f}',
+                                        deadband=self.SOC_DEADBAND)
         except (AssertionError, TypeError):
             pass
         try:
             calculated_voltage: float = self._battery_system.calculated_voltage()
-            self._mqtt_client.publish(topic='master/core/calculated_system_voltage',
-                                      payload=f'{calculated_voltage:.2f}')
+            self._publish_cache.publish(topic='master/core/calculated_system_voltage',
+                                        payload=f'{calculated_voltage:.2f}', deadband=self.SYSTEM_VOLTAGE_DEADBAND)
             current_power = self._battery_system.current.value * calculated_voltage
-            self._mqtt_client.publish(topic='master/core/system_power',
-                                      payload=f'{current_power:.2f}')
-            self._mqtt_client.publish(topic='master/core/load_adjusted_calculated_voltage',
-                                      payload=f'{self._battery_system.load_adjusted_calculated_voltage():.2f}')
-            self._mqtt_client.publish(topic='master/can/battery/voltage/set',
-                                      payload=f'{self._battery_system.load_adjusted_calculated_voltage():.2f}')
-            self._mqtt_client.publish(topic='master/core/max_cell_diff',
-                                      payload=f'{self._battery_system.cells().max_diff():.3f}')
-            self._mqtt_client.publish(topic='master/can/battery/current/set',
-                                      payload=f'{self._battery_system.current.value * -1:.2f}')
+            self._publish_cache.publish(topic='master/core/system_power',
+                                        payload=f'{current_power:.2f}', deadband=self.POWER_DEADBAND)
+            self._publish_cache.publish(topic='master/core/load_adjusted_calculated_voltage',
+                                        payload=f'{self._battery_system.load_adjusted_calculated_voltage():.2f}',
+                                        deadband=self.SYSTEM_VOLTAGE_DEADBAND)
+            self._publish_cache.publish(topic='master/can/battery/voltage/set',
+                                        payload=f'{self._battery_system.load_adjusted_calculated_voltage():.2f}')
+            self._publish_cache.publish(topic='master/core/max_cell_diff',
+                                        payload=f'{self._battery_system.max_cell_diff():.3f}')
+            self._publish_cache.publish(topic='master/can/battery/current/set',
+                                        payload=f'{self._battery_system.current.value * -1:.2f}')
         except TypeError:
             pass
         try:
-            self._mqtt_client.publish(topic='master/can/battery/temp/set',
-                                      payload=f'{self._battery_system.temp():.2f}')
-            self._mqtt_client.publish(topic='master/can/battery/max_cell_temp/set',
-                                      payload=f'{self._battery_system.highest_module_temp():.2f}')
-            self._mqtt_client.publish(topic='master/can/battery/min_cell_temp/set',
-                                      payload=f'{self._battery_system.lowest_module_temp():.2f}')
+            self._publish_cache.publish(topic='master/can/battery/temp/set',
+                                        payload=f'{self._battery_system.temp():.2f}')
+            self._publish_cache.publish(topic='master/can/battery/max_cell_temp/set',
+                                        payload=f'{self._battery_system.highest_module_temp():.2f}')
+            self._publish_cache.publish(topic='master/can/battery/min_cell_temp/set',
+                                        payload=f'{self._battery_system.lowest_module_temp():.2f}')
         except TypeError:
             pass
 
     def send_balancing_enabled_state(self, enabled: bool):
-        self._mqtt_client.publish('master/core/config/balancing_enabled', str(enabled).lower(), retain=True)
+        self._publish_scheduler.publish('master/core/config/balancing_enabled', str(enabled).lower(), retain=True,
+                                        priority=PublishPriority.CONTROL)
 
     def send_balancing_ignore_slaves_state(self, ignore_slaves: set[int]):
         if len(ignore_slaves) == 0:
             ignore_slaves_string = 'none'
         else:
             ignore_slaves_string = ','.join(str(i) for i in ignore_slaves)
-        self._mqtt_client.publish('master/core/config/balancing_ignore_slaves', ignore_slaves_string, retain=True)
+        self._publish_scheduler.publish('master/core/config/balancing_ignore_slaves', ignore_slaves_string,
+                                        retain=True, priority=PublishPriority.CONTROL)
 
     def send_charge_limit(self, allow_charge: bool):
         topic: str = 'reset' if allow_charge else 'set'
-        self._mqtt_client.publish(topic=f'master/can/limits/max_charge_current/{topic}', payload='0')
+        self._publish_scheduler.publish(topic=f'master/can/limits/max_charge_current/{topic}', payload='0',
+                                        priority=PublishPriority.SAFETY)
 
     def send_discharge_limit(self, allow_discharge: bool):
         topic: str = 'reset' if allow_discharge else 'set'
-        self._mqtt_client.publish(topic=f'master/can/limits/max_discharge_current/{topic}', payload='0')
+        self._publish_scheduler.publish(topic=f'master/can/limits/max_discharge_current/{topic}', payload='0',
+                                        priority=PublishPriority.SAFETY)
 
     @staticmethod
     def _topic_extract_id(topic: str) -> (str, str,):
@@ -215,24 +310,127 @@ class SlaveCommunicator:
     #                 print(line, file=file)
     #             self._lines_to_write[i].clear()
 
+    def _log(self, line: str) -> None:
+        # Runs on the MQTT and safety paths, the lines are written out by the flush_log task
+        self._battery_system.log_sink.log(line)
+
+    @staticmethod
+    def _payload_text(payload: bytes) -> str:
+        return payload.decode(errors='replace')
+
+    def _dispatch_measurement(self, measurement: Measurement, label: str, payload: bytes) -> None:
+        try:
+            measurement.update(float(payload))
+        except ValueError:
+            self._log(f'{label} >{self._payload_text(payload)}< bad data')
+
+    def _dispatch_accurate_cell_voltage(self, battery_module: BatteryModule, battery_cell: BatteryCell,
+                                        payload: bytes) -> None:
+        try:
+            battery_module.update_accurate_cell_voltage(battery_cell, float(payload))
+        except ValueError:
+            self._log(f'esp {battery_module.id + 1} voltage >{self._payload_text(payload)}< bad data')
+
+    def _dispatch_module_temps(self, battery_module: BatteryModule, payload: bytes) -> None:
+        try:
+            module_temps = payload.split(b',')
+            battery_module.update_module_temps(float(module_temps[0]), float(module_temps[1]))
+        except ValueError:
+            self._log(f'esp {battery_module.id + 1} module_temps >{self._payload_text(payload)}< bad data')
+
+    def _dispatch_uptime(self, battery_module: BatteryModule, payload: bytes) -> None:
+        try:
+            self._handle_uptime_message(payload, battery_module, battery_module.id + 1)
+        except ValueError:
+            self._log(f'esp {battery_module.id + 1} uptime >{self._payload_text(payload)}< bad data')
+
+    @staticmethod
+    def _dispatch_is_balancing(battery_cell: BatteryCell, payload: bytes) -> None:
+        if payload == b'1':
+            battery_cell.balance_pin_state = True
+        else:
+            battery_cell.on_balance_discharged_stopped()
+
+    def _dispatch_cell_voltages(self, battery_module: BatteryModule, accurate: bool,
+                                decode: Callable[[bytes, int], CellVoltageFrame], payload: bytes) -> None:
+        try:
+            frame = decode(payload, len(battery_module.cells))
+        except ValueError:
+            self._log(f'esp {battery_module.id + 1} cell_voltages >{payload!r}< bad data')
+            return
+        if frame.uptime is not None:
+            self._detect_esp_reboot(battery_module, frame.uptime)
+        stream = (battery_module.id, accurate)
+        if not frame.is_newer_than(self._last_frame_sequence.get(stream)):
+            return
+        if frame.sequence is not None:
+            self._last_frame_sequence[stream] = frame.sequence
+        battery_module.update_cell_voltages(frame.voltages.tolist(), accurate)
+        if frame.uptime is not None:
+            battery_module.update_esp_uptime(frame.uptime)
+
+    def _dispatch_slave_uptime(self, slave_id: str, payload: bytes) -> None:
+        self._configure_esp_module(slave_id)
+
+    def _build_dispatch_table(self) -> None:
+        dispatch: dict[str, Callable[[bytes], None]] = {}
+        for battery_module in self._battery_system.battery_modules:
+            esp_number = battery_module.id + 1
+            prefix = f'esp-module/{esp_number}/'
+            dispatch[f'{prefix}uptime'] = partial(self._dispatch_uptime, battery_module)
+            dispatch[f'{prefix}module_voltage'] = partial(self._dispatch_measurement, battery_module.voltage,
+                                                          f'esp {esp_number} module_voltage')
+            dispatch[f'{prefix}module_temps'] = partial(self._dispatch_module_temps, battery_module)
+            dispatch[f'{prefix}chip_temp'] = partial(self._dispatch_measurement, battery_module.chip_temp,
+                                                     f'esp {esp_number} chip_temp')
+            for accurate, stream_prefix in ((False, prefix), (True, f'{prefix}accurate/')):
+                dispatch[f'{stream_prefix}cell_voltages'] = partial(
+                    self._dispatch_cell_voltages, battery_module, accurate, CellVoltageFrame.from_csv)
+                dispatch[f'{stream_prefix}cell_voltages/packed'] = partial(
+                    self._dispatch_cell_voltages, battery_module, accurate, CellVoltageFrame.from_binary)
+            for battery_cell in battery_module.cells:
+                cell_number = battery_cell.id + 1
+                dispatch[f'{prefix}cell/{cell_number}/voltage'] = partial(
+                    self._dispatch_measurement, battery_cell.voltage, f'esp {esp_number} voltage')
+                dispatch[f'{prefix}accurate/cell/{cell_number}/voltage'] = partial(
+                    self._dispatch_accurate_cell_voltage, battery_module, battery_cell)
+                dispatch[f'{prefix}cell/{cell_number}/is_balancing'] = partial(
+                    self._dispatch_is_balancing, battery_cell)
+        for slave_id in self._slave_mapping['slaves']:
+            dispatch[f'esp-module/{slave_id}/uptime'] = partial(self._dispatch_slave_uptime, slave_id)
+        dispatch['esp-total/total_voltage'] = partial(self._dispatch_measurement, self._battery_system.voltage,
+                                                      'esp-total/total_voltage')
+        dispatch['esp-total/total_current'] = partial(self._dispatch_measurement, self._battery_system.current,
+                                                      'esp-total/total_current')
+        self._dispatch = dispatch
+
+    def _subscriptions(self) -> list[tuple[str, int]]:
+        if self._wildcard_subscriptions:
+            topics = ['esp-module/+/uptime',
+                      'esp-module/+/cell/+/voltage',
+                      'esp-module/+/cell/+/is_balancing',
+                      'esp-module/+/accurate/cell/+/voltage',
+                      'esp-module/+/cell_voltages',
+                      'esp-module/+/cell_voltages/packed',
+                      'esp-module/+/accurate/cell_voltages',
+                      'esp-module/+/accurate/cell_voltages/packed',
+                      'esp-module/+/module_voltage',
+                      'esp-module/+/module_temps',
+                      'esp-module/+/chip_temp',
+                      'esp-total/total_voltage',
+                      'esp-total/total_current']
+        else:
+            topics = list(self._dispatch)
+        topics.append('master/core/config/balancing_enabled/set')
+        topics.append('master/core/config/balancing_ignore_slaves/set')
+        return [(topic, 0) for topic in topics]
+
     def _mqtt_on_connect(self, client, userdata, flags, reason_code, properties):
+        self._build_dispatch_table()
         self.events.on_connect()
-        for i in range(len(self._battery_system.battery_modules)):
-            self._mqtt_client.subscribe(f'esp-module/{i + 1}/uptime')
-            for j in range(12):
-                self._mqtt_client.subscribe(f'esp-module/{i + 1}/cell/{j + 1}/voltage')
-                self._mqtt_client.subscribe(f'esp-module/{i + 1}/cell/{j + 1}/is_balancing')
-                self._mqtt_client.subscribe(f'esp-module/{i + 1}/accurate/cell/{j + 1}/voltage')
-            self._mqtt_client.subscribe(f'esp-module/{i + 1}/module_voltage')
-            self._mqtt_client.subscribe(f'esp-module/{i + 1}/module_temps')
-            self._mqtt_client.subscribe(f'esp-module/{i + 1}/chip_temp')
-        self._mqtt_client.subscribe('esp-total/total_voltage')
-        self._mqtt_client.subscribe('esp-total/total_current')
-        for module_id in self._slave_mapping['slaves']:
-            self._mqtt_client.subscribe(f'esp-module/{module_id}/uptime')
-        self._mqtt_client.subscribe('master/core/config/balancing_enabled/set')
-        self._mqtt_client.subscribe('master/core/config/balancing_ignore_slaves/set')
-        self._mqtt_client.publish('master/core/available', 'online', retain=True)
+        self._mqtt_client.subscribe(self._subscriptions())
+        self._publish_scheduler.publish('master/core/available', 'online', retain=True,
+                                        priority=PublishPriority.CONTROL)
         self.send_limits()
 
     def _handle_cell_message(self, topic, battery_module: BatteryModule, payload):
@@ -240,28 +438,37 @@ class SlaveCommunicator:
         if accurate_reading:
             topic = topic[topic.find('/') + 1:]
         cell_number, sub_topic = self._topic_extract_number(topic)
+        if not 1 <= cell_number <= len(battery_module.cells):
+            return
         battery_cell: BatteryCell = battery_module.cells[cell_number - 1]
         if sub_topic == 'voltage':
             try:
                 if accurate_reading:
-                    battery_cell.accurate_voltage.update(float(payload))
+                    battery_module.update_accurate_cell_voltage(battery_cell, float(payload))
                 else:
                     battery_cell.voltage.update(float(payload))
             except ValueError:
-                print(f'esp {battery_module.id + 1} voltage >{payload}< bad data', flush=True)
+                self._log(f'esp {battery_module.id + 1} voltage >{payload}< bad data')
         elif sub_topic == 'is_balancing':
             if payload == '1':
                 battery_cell.balance_pin_state = True
             else:
                 battery_cell.on_balance_discharged_stopped()
 
+    def _detect_esp_reboot(self, battery_module: BatteryModule, uptime: int) -> None:
+        last_uptime = battery_module.last_esp_uptime
+        if last_uptime is not None and uptime < last_uptime - self.ESP_REBOOT_UPTIME_DROP:
+            self._last_frame_sequence.pop((battery_module.id, False), None)
+            self._last_frame_sequence.pop((battery_module.id, True), None)
+
     def _handle_uptime_message(self, payload, battery_module, esp_number):
         current_time = int(payload)
+        self._detect_esp_reboot(battery_module, current_time)
         battery_module.update_esp_uptime(current_time)
 
         if self._last_time[esp_number] != 0:  # log time diffs
             diff = current_time - self._last_time[esp_number] - 1000
-            self._mqtt_client.publish(topic=f'esp-module/{esp_number}/timediff', payload=f'{diff}')
+            self._publish_scheduler.publish(topic=f'esp-module/{esp_number}/timediff', payload=f'{diff}')
         self._last_time[esp_number] = current_time
 
     def _configure_esp_module(self, extracted_id):
@@ -269,66 +476,87 @@ class SlaveCommunicator:
         config = f"{slave['number']},"
         config += f"{slave.get('total_voltage_measurer', False):d},"
         config += f"{slave.get('total_current_measurer', False):d}"
-        self._mqtt_client.publish(f'esp-module/{extracted_id}/set_config', config)
+        self._publish_scheduler.publish(f'esp-module/{extracted_id}/set_config', config,
+                                        priority=PublishPriority.CONTROL)
 
     def _handle_esp_module_message(self, extracted_id, topic, payload):  # noqa: C901
         if extracted_id.isdigit():
             esp_number = int(extracted_id)
+            if not 1 <= esp_number <= len(self._battery_system.battery_modules):
+                return
             battery_module: BatteryModule = self._battery_system.battery_modules[esp_number - 1]
             if topic == 'uptime':
                 try:
                     self._handle_uptime_message(payload, battery_module, esp_number)
                 except ValueError:
-                    print(f'esp {esp_number} {topic} >{payload}< bad data', flush=True)
+                    self._log(f'esp {esp_number} {topic} >{payload}< bad data')
             elif topic.startswith('cell/') or topic.startswith('accurate/cell/'):
                 self._handle_cell_message(topic, battery_module, payload)
             elif topic == 'module_voltage':
                 try:
                     battery_module.voltage.update(float(payload))
                 except ValueError:
-                    print(f'esp {esp_number} {topic} >{payload}< bad data', flush=True)
+                    self._log(f'esp {esp_number} {topic} >{payload}< bad data')
             elif topic == 'module_temps':
                 try:
                     module_temps = payload.split(',')
                     battery_module.module_temp1.update(float(module_temps[0]))
                     battery_module.module_temp2.update(float(module_temps[1]))
                 except ValueError:
-                    print(f'esp {esp_number} {topic} >{payload}< bad data', flush=True)
+                    self._log(f'esp {esp_number} {topic} >{payload}< bad data')
             elif topic == 'chip_temp':
                 try:
                     battery_module.chip_temp.update(float(payload))
                 except ValueError:
-                    print(f'esp {esp_number} {topic} >{payload}< bad data', flush=True)
+                    self._log(f'esp {esp_number} {topic} >{payload}< bad data')
         elif extracted_id in self._slave_mapping['slaves']:
             if topic == 'uptime':
                 self._configure_esp_module(extracted_id)
 
     def _mqtt_on_message(self, client: mqtt.Client, userdata: Any, msg: mqtt.MQTTMessage):
+        # Runs on the paho network thread, only hand the message over so socket reads never wait on processing
+        topic = msg.topic
+        control = topic.startswith(self.CONTROL_TOPIC_PREFIXES) or topic.endswith(self.CONTROL_TOPIC_SUFFIXES)
+        self._ingest_queue.put(topic, msg.payload, control=control)
+
+    def _process_message(self, topic: str, payload: bytes):
+        handler = self._dispatch.get(topic)
+        if handler is None:
+            self._handle_unindexed_message(topic, payload)
+            return
+        try:
+            # Empty payloads only clear retained messages
+            if len(payload) > 0:
+                handler(payload)
+        except Exception as e:
+            self._log(f'_mqtt_on_message Exception {e} {traceback.format_exc()} {topic} {payload!r}')
+
+    def _handle_unindexed_message(self, message_topic: str, raw_payload: bytes):
         try:
-            payload = msg.payload.decode()
-            if msg.topic.startswith('esp-module/') and len(msg.payload) > 0:
-                extracted_id, topic = self._topic_extract_id(msg.topic)
+            payload = raw_payload.decode()
+            if message_topic.startswith('esp-module/') and len(raw_payload) > 0:
+                extracted_id, topic = self._topic_extract_id(message_topic)
                 self._handle_esp_module_message(extracted_id, topic, payload)
-            elif msg.topic == 'master/core/config/balancing_enabled/set':
+            elif message_topic == 'master/core/config/balancing_enabled/set':
                 self.events.on_balancing_enabled_set(payload)
-            elif msg.topic == 'master/core/config/balancing_ignore_slaves/set':
+            elif message_topic == 'master/core/config/balancing_ignore_slaves/set':
                 if payload == '' or payload.lower() == 'none':
                     self.events.on_balancing_ignore_slaves_set(set())
                 else:
-                    values: list[str] = msg.payload.decode().split(',')
+                    values: list[str] = raw_payload.decode().split(',')
                     slaves: set[int] = set(int(value) for value in values)
                     self.events.on_balancing_ignore_slaves_set(slaves)
-            elif msg.topic == 'esp-total/total_voltage':
+            elif message_topic == 'esp-total/total_voltage':
                 try:
                     self._battery_system.voltage.update(float(payload))
                 except ValueError:
-                    print(f'{msg.topic} >{payload}< bad data', flush=True)
-            elif msg.topic == 'esp-total/total_current':
+                    self._log(f'{message_topic} >{payload}< bad data')
+            elif message_topic == 'esp-total/total_current':
                 try:
                     self._battery_system.current.update(float(payload))
                 except ValueError:
-                    print(f'{msg.topic} >{payload}< bad data', flush=True)
+                    self._log(f'{message_topic} >{payload}< bad data')
         except ValueError as e:
-            print('_mqtt_on_message ValueError', e, traceback.format_exc(), msg.topic, msg.payload, flush=True)
+            self._log(f'_mqtt_on_message ValueError {e} {traceback.format_exc()} {message_topic} {raw_payload!r}')
         except Exception as e:
-            print('_mqtt_on_message Exception', e, traceback.format_exc(), msg.topic, msg.payload, flush=True)
+            self._log(f'_mqtt_on_message Exception {e} {traceback.format_exc()} {message_topic} {raw_payload!r}')
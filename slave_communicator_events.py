@@ -1,5 +1,5 @@
-from events import Events
+from callback_registry import CallbackRegistry
 
 
-class SlaveCommunicatorEvents(Events):
+class SlaveCommunicatorEvents(CallbackRegistry):
     __events__ = ('on_connect', 'on_balancing_enabled_set', 'on_balancing_ignore_slaves_set')
@@ -1,3 +1,8 @@
+import bisect
+
+import numpy as np
+
+
 class SocCurve:
     data_points = {
         5.0: 1.2,
@@ -15,26 +20,33 @@ class SocCurve:
         0.0: -0.2
     }
 
+    # Compiled from data_points by compile(), sorted by voltage
+    voltages: tuple[float, ...] = ()
+    socs: tuple[float, ...] = ()
+    _voltage_array: np.ndarray = np.empty(0)
+    _soc_array: np.ndarray = np.empty(0)
+
     def __init__(self) -> None:
         # todo
         pass
 
+    @classmethod
+    def compile(cls) -> None:
+        data_points = sorted(cls.data_points.items())
+        cls.voltages = tuple(voltage for voltage, _ in data_points)
+        cls.socs = tuple(soc for _, soc in data_points)
+        cls._voltage_array = np.array(cls.voltages)
+        cls._soc_array = np.array(cls.socs)
+
     def voltage_to_soc(self, cell_voltage: float) -> float:
         assert 0.0 < cell_voltage < 5.0
 
-        self.data_points = dict(sorted(self.data_points.items()))
-        lower_voltage = min(self.data_points)
-        upper_voltage = max(self.data_points)
+        upper = bisect.bisect_right(self.voltages, cell_voltage)
+        lower_voltage = self.voltages[upper - 1]
+        upper_voltage = self.voltages[upper]
 
-        for table_voltage in self.data_points:
-            if cell_voltage >= table_voltage:
-                lower_voltage = table_voltage
-            else:
-                upper_voltage = table_voltage
-                break
-
-        lower_soc = self.data_points[lower_voltage]
-        upper_soc = self.data_points[upper_voltage]
+        lower_soc = self.socs[upper - 1]
+        upper_soc = self.socs[upper]
 
         d = (upper_voltage - cell_voltage) / (upper_voltage - lower_voltage)
         # wenn d = 1 dann cell_voltage = lower_voltage -> nimm lower_soc
@@ -44,29 +56,56 @@ class SocCurve:
 
         return soc
 
+    @classmethod
+    def voltage_to_soc_many(cls, cell_voltages: np.ndarray) -> np.ndarray:
+        cell_voltages = np.asarray(cell_voltages, dtype=np.float64)
+        assert np.all((0.0 < cell_voltages) & (cell_voltages < 5.0))
+
+        upper = np.searchsorted(cls._voltage_array, cell_voltages, side='right')
+        lower_voltage = cls._voltage_array[upper - 1]
+        upper_voltage = cls._voltage_array[upper]
+
+        d = (upper_voltage - cell_voltages) / (upper_voltage - lower_voltage)
+        return (1 - d) * cls._soc_array[upper] + d * cls._soc_array[upper - 1]
+
+    @staticmethod
+    def _soc_segment(upper: int) -> tuple[int, int]:
+        if upper == 0:
+            return 0, 1
+        if upper == len(SocCurve.socs):
+            return upper - 2, upper - 1
+        return upper - 1, upper
+
     @staticmethod
     def soc_to_voltage(soc: float):
         assert 0.0 <= soc <= 1.0
 
-        data_points = dict(sorted(SocCurve.data_points.items()))
-        lower_voltage = min(data_points)
-        upper_voltage = max(data_points)
+        lower, upper = SocCurve._soc_segment(bisect.bisect_right(SocCurve.socs, soc))
+        lower_voltage = SocCurve.voltages[lower]
+        upper_voltage = SocCurve.voltages[upper]
+
+        m = (upper_voltage - lower_voltage) / (SocCurve.socs[upper] - SocCurve.socs[lower])
+        b = upper_voltage - (m * SocCurve.socs[upper])
+        return m * soc + b
+
+    @staticmethod
+    def soc_to_voltage_many(socs: np.ndarray) -> np.ndarray:
+        socs = np.asarray(socs, dtype=np.float64)
+        assert np.all((0.0 <= socs) & (socs <= 1.0))
+
+        upper = np.searchsorted(SocCurve._soc_array, socs, side='right')
+        upper = np.clip(upper, 1, len(SocCurve.socs) - 1)
+        lower_voltage = SocCurve._voltage_array[upper - 1]
+        upper_voltage = SocCurve._voltage_array[upper]
+        lower_soc = SocCurve._soc_array[upper - 1]
+        upper_soc = SocCurve._soc_array[upper]
 
-        for table_voltage in data_points:
-            if soc >= data_points[table_voltage]:
-                lower_voltage = table_voltage
-            else:
-                upper_voltage = table_voltage
-                break
+        m = (upper_voltage - lower_voltage) / (upper_soc - lower_soc)
+        b = upper_voltage - (m * upper_soc)
+        return m * socs + b
 
-        if upper_voltage == lower_voltage == 0:
-            upper_voltage = list(data_points.keys())[1]
-        elif upper_voltage == lower_voltage == max(data_points):
-            lower_voltage = list(data_points.keys())[-2]
 
-        m = (upper_voltage - lower_voltage) / (data_points[upper_voltage] - data_points[lower_voltage])
-        b = upper_voltage - (m * data_points[upper_voltage])
-        return m * soc + b
+SocCurve.compile()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,46 @@
+import unittest
+
+import numpy as np
+
+from accurate_reading_scheduler import AccurateReadingScheduler
+
+
+class AccurateReadingSchedulerTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.scheduler = AccurateReadingScheduler([0, 1, 2, 3], min_interval=10.0, max_interval=120.0,
+                                                  stagger_window=4.0)
+
+    def test_requests_are_staggered(self):
+        self.scheduler.stagger([0, 1, 2, 3], now=1000.0)
+        self.assertEqual(self.scheduler.pop_due(1000.0), [0])
+        self.assertEqual(self.scheduler.pop_due(1001.5), [1])
+        self.assertEqual(self.scheduler.next_request_time(), 1002.0)
+        self.assertEqual(self.scheduler.pop_due(1005.0), [2, 3])
+        self.assertIsNone(self.scheduler.next_request_time())
+
+    def test_interval_follows_rate_of_change(self):
+        self.scheduler.stagger([0], now=1000.0)
+        self.scheduler.pop_due(1000.0)
+        self.scheduler.on_readings_complete(0, np.array([3.70, 3.70]), 1000.5)
+        self.assertFalse(self.scheduler.wants_request(0, 1050.0, balancing=False))
+        self.assertTrue(self.scheduler.wants_request(0, 1050.0, balancing=True))
+
+        self.scheduler.stagger([0], now=1050.0)
+        self.assertFalse(self.scheduler.wants_request(0, 1100.0, balancing=True))
+        self.scheduler.pop_due(1050.0)
+        # 4 mV in 50 s: a 2 mV change every 25 s
+        self.scheduler.on_readings_complete(0, np.array([3.70, 3.704]), 1050.5)
+        self.assertAlmostEqual(self.scheduler.modules[0].interval, 25.0)
+        self.assertTrue(self.scheduler.wants_request(0, 1076.0, balancing=False))
+
+    def test_round_trip_statistics(self):
+        self.scheduler.stagger([1], now=1000.0)
+        self.scheduler.pop_due(1000.0)
+        self.scheduler.on_readings_complete(1, np.array([3.7]), 1000.8)
+        statistics = self.scheduler.statistics_dict()[1]
+        self.assertEqual(statistics['round_trips'], 1)
+        self.assertAlmostEqual(statistics['max_round_trip'], 0.8)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import random
+import unittest
+
+from aggregate_tree import AggregateTree
+from aggregate_tree import HierarchicalAggregate
+from battery_system import BatterySystem
+
+
+class AggregateTreeTest(unittest.TestCase):
+    def test_single_tree(self):
+        tree = AggregateTree(5)
+        values = [3.1, 3.5, 2.9, 3.3, 3.4]
+        for leaf, value in enumerate(values):
+            tree.set_leaf(leaf, value, value, leaf, value, leaf)
+        self.assertAlmostEqual(tree.sum(), sum(values))
+        self.assertEqual(tree.min(), 2.9)
+        self.assertEqual(tree.min_index(), 2)
+        self.assertEqual(tree.max(), 3.5)
+        self.assertEqual(tree.max_index(), 1)
+
+    def test_hierarchical_matches_full_scan(self):
+        random.seed(1)
+        aggregate = HierarchicalAggregate(4, 6)
+        values = [0.0] * 24
+        for index in range(24):
+            values[index] = random.uniform(3.0, 4.2)
+            aggregate.update(index, values[index])
+        self.assertTrue(aggregate.complete())
+        for _ in range(200):
+            index = random.randrange(24)
+            values[index] = random.uniform(3.0, 4.2)
+            aggregate.update(index, values[index])
+            self.assertAlmostEqual(aggregate.total.sum(), sum(values))
+            self.assertEqual(aggregate.total.min(), min(values))
+            self.assertEqual(aggregate.total.max(), max(values))
+            self.assertEqual(values[aggregate.total.min_index()], min(values))
+            group = aggregate.groups[2]
+            self.assertEqual(group.max(), max(values[12:18]))
+
+    def test_completeness(self):
+        aggregate = HierarchicalAggregate(2, 2)
+        aggregate.update(0, 1.0)
+        aggregate.update(1, 1.0)
+        self.assertTrue(aggregate.group_complete(0))
+        self.assertFalse(aggregate.group_complete(1))
+        self.assertFalse(aggregate.complete())
+
+
+class BatterySystemAggregateTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.battery_system = BatterySystem(3, 4)
+
+    def test_uninitialized_raises_type_error(self):
+        with self.assertRaises(TypeError):
+            self.battery_system.calculated_voltage()
+        with self.assertRaises(TypeError):
+            self.battery_system.battery_modules[0].min_voltage_cell()
+        with self.assertRaises(TypeError):
+            self.battery_system.highest_module_temp()
+
+    def test_queries_match_cell_scan(self):
+        for module in self.battery_system.battery_modules:
+            module.module_temp1.update(20.0 + module.id)
+            module.module_temp2.update(25.0 - module.id)
+            for cell in module.cells:
+                cell.voltage.update(3.6 + ((module.id * 7 + cell.id * 3) % 5) * 0.01)
+        cells = self.battery_system.cells()
+        self.assertAlmostEqual(self.battery_system.calculated_voltage(), sum(cell.voltage.value for cell in cells))
+        self.assertAlmostEqual(self.battery_system.max_cell_diff(), cells.max_diff())
+        self.assertEqual(self.battery_system.highest_module_temp(), 25.0)
+        self.assertEqual(self.battery_system.lowest_module_temp(), 20.0)
+        self.assertAlmostEqual(self.battery_system.temp(), 22.5)
+        for module in self.battery_system.battery_modules:
+            self.assertEqual(module.min_voltage_cell().voltage.value, min(cell.voltage.value for cell in module.cells))
+            self.assertEqual(module.max_voltage_cell().voltage.value, max(cell.voltage.value for cell in module.cells))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+import unittest
+from unittest.mock import MagicMock, patch
+
+from alarm_engine import AlarmEngine
+from alarm_engine import AlarmLevel
+from alarm_engine import LogSink
+from battery_manager import BatteryManager
+from battery_system import BatterySystem
+from slave_communicator_events import SlaveCommunicatorEvents
+from virtual_clock import VirtualClock
+
+
+class AlarmEngineTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.sink = LogSink()
+        self.engine = AlarmEngine(self.sink, debounce=2, hold_off=10.0)
+        self.slot = self.engine.watch(MagicMock(), lambda: 'cell 0')
+
+    def observe(self, levels: list[AlarmLevel], start: float = 0.0) -> None:
+        for i, level in enumerate(levels):
+            self.engine.observe(self.slot, level, start + i)
+
+    def test_debounced_transitions(self):
+        self.observe([AlarmLevel.WARNING, AlarmLevel.NORMAL, AlarmLevel.WARNING])
+        self.assertEqual(self.engine.levels[self.slot], AlarmLevel.NORMAL)
+        self.observe([AlarmLevel.WARNING, AlarmLevel.CRITICAL, AlarmLevel.CRITICAL], start=3.0)
+        self.assertEqual(self.engine.levels[self.slot], AlarmLevel.CRITICAL)
+        self.assertEqual(self.engine.transitions['enter'], 1)
+
+    def test_clear_waits_for_hold_off(self):
+        self.observe([AlarmLevel.WARNING] * 20)
+        self.observe([AlarmLevel.NORMAL] * 5, start=1.0)
+        self.assertEqual(self.engine.levels[self.slot], AlarmLevel.WARNING)
+        self.observe([AlarmLevel.NORMAL] * 5, start=11.0)
+        self.assertEqual(self.engine.levels[self.slot], AlarmLevel.NORMAL)
+        self.assertEqual(self.engine.transitions, {'enter': 1, 'escalate': 0, 'deescalate': 0, 'clear': 1})
+
+        with patch('builtins.print') as mock_print:
+            self.assertEqual(self.sink.flush(), 2)
+        mock_print.assert_called_once()
+        self.assertEqual(mock_print.call_args.args[0], '[WARNING] cell 0\n[CLEARED WARNING] cell 0')
+
+    def test_sink_drops_oldest_lines(self):
+        sink = LogSink(max_lines=2)
+        for line in ('a', 'b', 'c'):
+            sink.log(line)
+        self.assertEqual(sink.dropped, 1)
+        with patch('builtins.print') as mock_print:
+            sink.flush()
+        self.assertEqual(mock_print.call_args.args[0], 'b\nc')
+
+
+class BatteryManagerAlarmTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.clock = VirtualClock(1000.0)
+        self.battery_system = BatterySystem(1, 2, clock=self.clock)
+        self.communicator = MagicMock()
+        self.communicator.events = SlaveCommunicatorEvents()
+        self.battery_manager = BatteryManager(self.battery_system, self.communicator)
+
+    def test_steady_warning_logs_once(self):
+        module = self.battery_system.battery_modules[0]
+        with patch('builtins.print') as mock_print:
+            for _ in range(50):
+                module.update_cell_voltages([4.16, 3.7])
+                self.clock.advance(1.0)
+            mock_print.assert_not_called()
+            self.battery_manager.log_sink.flush()
+        self.assertEqual(mock_print.call_count, 1)
+        self.assertIn('[WARNING] cell voltage on module 0, cell 0', mock_print.call_args.args[0])
+
+    def test_safety_disconnect_keeps_threshold(self):
+        cell = self.battery_system.battery_modules[0].cells[1]
+        for _ in range(4):
+            cell.voltage.update(4.5)
+        self.communicator.open_battery_relays.assert_not_called()
+        cell.voltage.update(4.5)
+        self.communicator.open_battery_relays.assert_called_once()
+
+
+if __name__ == '__main__':
+    unittest.main()
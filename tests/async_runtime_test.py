@@ -0,0 +1,69 @@
+import asyncio
+import threading
+import unittest
+from unittest.mock import MagicMock, patch
+
+import paho.mqtt.client as mqtt
+
+from async_runtime import AsyncRuntime
+
+
+class AsyncRuntimeTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        self.communicator = MagicMock()
+        self.communicator.mqtt_client.loop_misc.return_value = mqtt.MQTT_ERR_SUCCESS
+        self.communicator.publish_scheduler.process_pending.return_value = None
+        self.runtime = AsyncRuntime(self.communicator)
+
+    async def run_for(self, seconds: float) -> None:
+        run = asyncio.create_task(self.runtime.run())
+        await asyncio.sleep(seconds)
+        self.runtime.stop()
+        await run
+
+    async def test_periodic_tasks_share_the_loop(self):
+        threads = []
+        self.runtime.add_task('fast', lambda: threads.append(threading.get_ident()), period=0.01)
+        self.runtime.add_task('late', lambda: threads.append(None), period=0.01, initial_delay=10)
+        await self.run_for(0.055)
+        self.communicator.connect.assert_called_once()
+        statistics = self.runtime.statistics_dict()
+        self.assertGreaterEqual(statistics['fast']['runs'], 4)
+        self.assertEqual(statistics['late']['runs'], 0)
+        self.assertEqual(set(threads), {threading.get_ident()})
+
+    async def test_safety_tasks_run_on_executor(self):
+        threads = []
+        self.runtime.add_task('safety', lambda: threads.append(threading.get_ident()), period=10, lane='safety')
+        await self.run_for(0.02)
+        self.assertEqual(len(threads), 1)
+        self.assertNotEqual(threads[0], threading.get_ident())
+
+    async def test_other_lanes_run_on_the_loop(self):
+        threads = []
+        self.runtime.add_task('flush_log', lambda: threads.append(threading.get_ident()), period=10, lane='log')
+        await self.run_for(0.02)
+        self.assertEqual(threads, [threading.get_ident()])
+
+    async def test_failing_task_keeps_running(self):
+        self.runtime.add_task('failing', MagicMock(side_effect=ValueError('boom')), period=0.01)
+        with patch('builtins.print'):
+            await self.run_for(0.035)
+        statistics = self.runtime.statistics_dict()['failing']
+        self.assertGreaterEqual(statistics['errors'], 2)
+        self.assertEqual(statistics['errors'], statistics['runs'])
+
+    async def test_cancel_single_task(self):
+        action = MagicMock()
+        self.runtime.add_task('cancelled', action, period=0.01, initial_delay=0.02)
+        run = asyncio.create_task(self.runtime.run())
+        await asyncio.sleep(0)
+        self.runtime.cancel('cancelled')
+        await asyncio.sleep(0.04)
+        self.runtime.stop()
+        await run
+        action.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
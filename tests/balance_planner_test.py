@@ -0,0 +1,39 @@
+import unittest
+
+import numpy as np
+
+from balance_planner import ProportionalBalancePlanner
+from battery_cell import BatteryCell
+
+
+class ProportionalBalancePlannerTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.cells = [BatteryCell(i, 0) for i in range(4)]
+        # 1 % soc is 36 As, bled in 36 s
+        self.planner = ProportionalBalancePlanner(cell_capacity=1.0, bleed_current=1.0, max_balance_time=1000.0)
+
+    def test_balance_time_proportional_to_excess_charge(self):
+        # 3.678 V is 50 % soc, 3.6936 V is 52 % and 3.7092 V is 54 % on the curve
+        voltages = np.array([3.678, 3.6936, 3.7092, 3.678])
+        plan = self.planner.plan(self.cells, voltages, target_voltage=3.678)
+        self.assertEqual(plan.cells, [self.cells[1], self.cells[2]])
+        np.testing.assert_allclose(plan.balance_times, [72.0, 144.0])
+        np.testing.assert_allclose(plan.planned_voltages, [3.678, 3.678], atol=1e-3)
+
+    def test_balance_time_is_limited(self):
+        planner = ProportionalBalancePlanner(cell_capacity=1.0, bleed_current=1.0, max_balance_time=100.0)
+        plan = planner.plan(self.cells[:1], np.array([3.756]), target_voltage=3.678)
+        np.testing.assert_allclose(plan.balance_times, [100.0])
+        self.assertGreater(plan.planned_voltages[0], 3.678)
+
+    def test_report(self):
+        plan = self.planner.plan(self.cells, np.array([3.678, 3.7092, 3.678, 3.678]), target_voltage=3.678)
+        report = plan.report(np.array([3.6936]), cell_diff=0.0156)
+        self.assertEqual(report['cells'], 1)
+        self.assertAlmostEqual(report['planned_delta'], 0.0312, places=3)
+        self.assertAlmostEqual(report['achieved_delta'], 0.0156, places=4)
+        self.assertAlmostEqual(report['max_error'], 0.0156, places=3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+import unittest
+import unittest.mock
+from unittest.mock import MagicMock
+
+from battery_cell import BatteryCell
+from battery_cell_list import BatteryCellList
+from battery_system import BatterySystem
+
+
+class BatteryCellListTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.battery_system = BatterySystem(3, 4)
+        for module in self.battery_system.battery_modules:
+            for cell in module.cells:
+                cell.voltage.update(3.6 + module.id * 0.01 + cell.id * 0.001)
+                cell.accurate_voltage.update(3.7 + module.id * 0.01 + cell.id * 0.001)
+
+    def test_store_mirrors_measurements(self):
+        for cell in self.battery_system.cells():
+            self.assertEqual(self.battery_system.cell_store.voltage.value[cell.index], cell.voltage.value)
+            self.assertEqual(self.battery_system.cell_store.voltage.timestamp[cell.index], cell.voltage.timestamp)
+
+    def test_aggregates(self):
+        cells = self.battery_system.cells()
+        self.assertAlmostEqual(cells.highest_voltage(), 3.623)
+        self.assertAlmostEqual(cells.lowest_voltage(), 3.6)
+        self.assertAlmostEqual(cells.highest_accurate_voltage(), 3.723)
+        self.assertAlmostEqual(cells.lowest_accurate_voltage(), 3.7)
+        self.assertAlmostEqual(cells.max_diff(), 0.023)
+        self.assertEqual(cells.with_voltage_above(3.621), [self.battery_system.battery_modules[2].cells[2],
+                                                           self.battery_system.battery_modules[2].cells[3]])
+
+    def test_uninitialized_voltage_raises_type_error(self):
+        cells = BatterySystem(1, 2).cells()
+        cells[0].voltage.update(3.6)
+        with self.assertRaises(TypeError):
+            cells.highest_voltage()
+        with self.assertRaises(TypeError):
+            cells.with_accurate_voltage_above(3.5)
+
+    def test_with_voltage_older_than(self):
+        cells = BatterySystem(1, 3).cells()
+        with unittest.mock.patch('time.time', return_value=100.0):
+            cells[0].voltage.update(3.6)
+        with unittest.mock.patch('time.time', return_value=150.0):
+            cells[1].voltage.update(3.6)
+        with unittest.mock.patch('time.time', return_value=170.0):
+            self.assertEqual(cells.with_voltage_older_than(60.0), [cells[0], cells[2]])
+            self.assertTrue(cells.has_voltage_older_than(60.0))
+
+    @unittest.mock.patch('time.time', return_value=120.0)
+    def test_relax_and_balancing(self, mock_time: MagicMock):
+        cells = self.battery_system.cells()
+        self.assertFalse(cells.currently_balancing())
+        cells[5].balance_pin_state = True
+        self.assertTrue(cells.currently_balancing())
+
+        cells.set_relax_time(seconds=10.0)
+        self.assertTrue(all(cell.relax_time == 10.0 for cell in cells))
+        self.assertFalse(cells.in_relax_time())
+        cells[5].on_balance_discharged_stopped()
+        self.assertTrue(cells.in_relax_time())
+        mock_time.assert_called()
+
+    def test_cached_view_is_read_only(self):
+        cells = self.battery_system.cells()
+        cell = cells[0]
+        for mutate in (lambda: cells.append(cell), lambda: cells.extend([cell]), lambda: cells.insert(0, cell),
+                       lambda: cells.remove(cell), cells.pop, cells.clear, cells.sort, cells.reverse,
+                       lambda: cells.__setitem__(0, cell), lambda: cells.__delitem__(0),
+                       lambda: cells.__iadd__([cell]), lambda: cells.__imul__(2)):
+            with self.assertRaises(TypeError):
+                mutate()
+        with self.assertRaises(AttributeError):
+            cells.snapshot = self.battery_system.cell_store.snapshot
+        self.assertEqual(len(cells), 12)
+        self.assertIs(cells[0], cell)
+
+    def test_mixed_stores(self):
+        cells = BatteryCellList([BatteryCell(0, 0), BatteryCell(1, 0)])
+        cells[0].voltage.update(3.6)
+        cells[1].voltage.update(3.7)
+        self.assertAlmostEqual(cells.max_diff(), 0.1)
+        self.assertEqual(cells.with_voltage_above(3.65), [cells[1]])
+
+
+if __name__ == '__main__':
+    unittest.main()
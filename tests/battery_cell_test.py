@@ -1,8 +1,10 @@
+import tracemalloc
 import unittest
 import unittest.mock
 from unittest.mock import MagicMock
 
 from battery_cell import BatteryCell
+from battery_system import BatterySystem
 
 
 class BatteryCellTest(unittest.TestCase):
@@ -181,5 +183,33 @@ class BatteryCellTest(unittest.TestCase):
         self.assertEqual(self.cell.is_balance_discharging(), True)
 
 
+class BatteryCellMemoryTest(unittest.TestCase):
+    MAX_BYTES_PER_CELL: int = 1200
+
+    def test_full_pack_memory_per_cell(self):
+        BatterySystem(1, 1)  # imports and class-level caches are not part of the per-cell cost
+        tracemalloc.start()
+        try:
+            battery_system = BatterySystem(16, 24)
+            allocated, _ = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        self.assertLess(allocated / len(battery_system.cell_store), self.MAX_BYTES_PER_CELL)
+
+    def test_events_are_created_on_first_use(self):
+        cell = BatteryCell(0, 0)
+        self.assertIsNone(cell._balance_event)
+        cell.balance_pin_state = True
+        cell.on_balance_discharged_stopped()
+        self.assertIsNone(cell._balance_event)
+
+        on_balance_stopped = MagicMock()
+        cell.balance_event.on_balance_stopped += on_balance_stopped
+        cell.balance_pin_state = True
+        cell.on_balance_discharged_stopped()
+        on_balance_stopped.assert_called_once_with(cell)
+        self.assertIs(cell.soc_curve, BatteryCell(1, 0).soc_curve)
+
+
 if __name__ == '__main__':
     unittest.main()
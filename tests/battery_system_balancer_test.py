@@ -0,0 +1,135 @@
+import time
+import unittest
+from unittest.mock import MagicMock, patch
+
+from battery_system import BatterySystem
+from battery_system_balancer import BatterySystemBalancer
+from slave_communicator_events import SlaveCommunicatorEvents
+
+
+class BatterySystemBalancerEventTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.battery_system = BatterySystem(2, 3)
+        self.communicator = MagicMock()
+        self.communicator.events = SlaveCommunicatorEvents()
+        self.balancer = BatterySystemBalancer(self.battery_system, self.communicator)
+        for module in self.battery_system.battery_modules:
+            module.chip_temp.update(30.0)
+            module.update_cell_voltages([3.7] * 3)
+
+    def test_balances_when_last_module_delivered_accurate_readings(self):
+        self.balancer.request_accurate_readings()
+        self.communicator.send_accurate_reading_request.assert_called_once_with(0)
+        with patch.object(self.balancer, 'balance') as balance:
+            first, second = self.battery_system.battery_modules
+            first.update_cell_voltages([3.7, 3.8, 3.7], accurate=True)
+            balance.assert_not_called()
+            with patch('time.time', return_value=time.time() + BatterySystemBalancer.ACCURATE_READINGS_STAGGER_WINDOW):
+                self.balancer.send_due_accurate_reading_requests()
+                self.communicator.send_accurate_reading_request.assert_called_with(1)
+                self.balancer.request_accurate_readings()
+                self.assertEqual(self.communicator.send_accurate_reading_request.call_count, 2)
+                for cell, voltage in zip(second.cells, [3.7, 3.7, 3.7]):
+                    second.update_accurate_cell_voltage(cell, voltage)
+            balance.assert_called_once()
+        statistics = self.balancer.reading_scheduler.statistics_dict()
+        self.assertEqual(statistics[0]['round_trips'], 1)
+        self.assertEqual(statistics[1]['round_trips'], 1)
+
+    def test_unrequested_accurate_readings_do_not_balance(self):
+        with patch.object(self.balancer, 'balance') as balance:
+            for module in self.battery_system.battery_modules:
+                module.update_cell_voltages([3.7] * 3, accurate=True)
+            balance.assert_not_called()
+
+    def test_balances_after_last_cell_relaxed(self):
+        cells = self.balancer.cells()
+        cells.set_relax_time(0.01)
+        cells[0].balance_pin_state = True
+        cells[1].balance_pin_state = True
+        with patch.object(self.balancer, 'balance') as balance:
+            cells[0].on_balance_discharged_stopped()
+            self.assertIsNone(self.balancer._relax_timer)
+            cells[1].on_balance_discharged_stopped()
+            time.sleep(0.05)
+            balance.assert_called_once()
+
+    def test_views_are_cached_until_ignore_slaves_changes(self):
+        cells = self.balancer.cells()
+        self.assertIs(self.balancer.cells(), cells)
+        self.assertIs(self.battery_system.cells(), self.battery_system.cells())
+        with patch.object(self.balancer, '_balance') as balance:
+            self.balancer.balance()
+        # The round's snapshot is passed along, the shared view is left untouched
+        balance.assert_called_once_with(cells, self.battery_system.cell_store.snapshot)
+        self.assertIsNone(cells.snapshot)
+        with self.assertRaises(TypeError):
+            cells.append(cells[0])
+
+        self.balancer.set_ignore_slaves({0})
+        self.assertEqual([module.id for module in self.balancer.modules()], [1])
+        self.assertEqual(self.balancer.cells(), self.battery_system.battery_modules[1].cells)
+        self.assertIs(self.balancer.cells(), self.balancer.cells())
+
+
+class BatterySystemBalancerProportionalTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.battery_system = BatterySystem(1, 3)
+        self.communicator = MagicMock()
+        self.communicator.events = SlaveCommunicatorEvents()
+        config = {'balancing_mode': 'proportional', 'balancing_cell_capacity': 1.0, 'balancing_bleed_current': 1.0}
+        self.balancer = BatterySystemBalancer(self.battery_system, self.communicator, config)
+        self.module = self.battery_system.battery_modules[0]
+        self.module.chip_temp.update(30.0)
+
+    def test_one_round_with_individual_balance_times(self):
+        self.module.update_cell_voltages([3.678, 3.6936, 3.7092])
+        self.module.update_cell_voltages([3.678, 3.6936, 3.7092], accurate=True)
+        self.balancer.balance()
+        self.communicator.send_module_balance_request.assert_called_once_with(0, {1: 72.0, 2: 144.0})
+        self.assertEqual([cell.balance_pin_state for cell in self.module.cells], [False, True, True])
+
+        for cell in self.module.cells:
+            cell.on_balance_discharged_stopped()
+            cell.last_discharge_time = 0.0
+        self.balancer._relax_timer.cancel()
+        self.module.update_cell_voltages([3.678, 3.679, 3.679], accurate=True)
+        with patch('builtins.print'):
+            self.balancer.balance()
+        self.assertEqual(self.balancer.last_cycle_report['cells'], 2)
+        self.assertEqual(self.balancer.last_cycle_report['round'], 1)
+        self.assertTrue(self.balancer.idle)
+
+
+class BatterySystemBalancerThrottleTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.battery_system = BatterySystem(2, 4)
+        self.communicator = MagicMock()
+        self.communicator.events = SlaveCommunicatorEvents()
+        self.balancer = BatterySystemBalancer(self.battery_system, self.communicator)
+        for module in self.battery_system.battery_modules:
+            module.update_cell_voltages([3.70, 3.75, 3.76, 3.77])
+            module.update_cell_voltages([3.70, 3.75, 3.76, 3.77], accurate=True)
+
+    def test_module_balance_limit(self):
+        module = self.battery_system.battery_modules[0]
+        for chip_temp, limit in ((30.0, 4), (45.0, 4), (52.5, 2), (60.0, 0), (70.0, 0)):
+            module.chip_temp.update(chip_temp)
+            self.assertEqual(self.balancer.module_balance_limit(module), limit)
+
+    def test_hot_module_is_throttled(self):
+        cool, hot = self.battery_system.battery_modules
+        cool.chip_temp.update(30.0)
+        hot.chip_temp.update(56.0)
+        with patch('time.time', return_value=time.time() - 10):
+            self.balancer.balance()
+        requested = {call.args[0]: set(call.args[1])
+                     for call in self.communicator.send_module_balance_request.call_args_list}
+        self.assertEqual(requested, {0: {1, 2, 3}, 1: {3}})
+        self.assertEqual(self.balancer.module_balance_limits, {0: 4, 1: 1})
+        duty_cycles = self.balancer.duty_cycles()
+        self.assertGreater(duty_cycles[0], duty_cycles[1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,4 +1,6 @@
+import time
 import unittest
+from unittest.mock import patch
 
 from battery_system import BatterySystem
 
@@ -169,6 +171,14 @@ class BatterySystemTest(unittest.TestCase):
         self.assertTrue(self.battery_system.has_warning_current())
         self.assertTrue(self.battery_system.has_critical_current())
 
+    def test_sliding_window_ignores_wall_clock_steps(self):
+        window = self.battery_system.sliding_window_soc_values
+        window.add(0.4)
+        with patch('time.time', return_value=time.time() + 3600):
+            window.add(0.6)
+        self.assertEqual(len(window), 2)
+        self.assertAlmostEqual(window.mean(), 0.5)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,40 @@
+import unittest
+from unittest.mock import MagicMock
+
+from callback_registry import CallbackRegistry
+from measurement import Measurement
+from measurement import MeasurementEvent
+
+
+class CallbackRegistryTest(unittest.TestCase):
+    def test_register_fire_unregister(self):
+        event = MeasurementEvent()
+        first, second = MagicMock(), MagicMock()
+        self.assertFalse(event.on_warning)
+        event.on_warning += first
+        event.on_warning += second
+        self.assertEqual(len(event.on_warning), 2)
+
+        event.on_warning('owner')
+        first.assert_called_once_with('owner')
+        second.assert_called_once_with('owner')
+
+        event.on_warning -= first
+        self.assertEqual(list(event.on_warning), [second])
+        self.assertFalse(event.on_critical)
+
+    def test_undeclared_event_raises(self):
+        event = CallbackRegistry(events=('on_balance_stopped',))
+        event.on_balance_stopped += MagicMock()
+        with self.assertRaises(AttributeError):
+            event.on_balance_started += MagicMock()
+
+    def test_measurement_event_can_be_replaced(self):
+        measurement = Measurement(None, None)
+        event = MeasurementEvent()
+        measurement.event = event
+        self.assertIs(measurement.event, event)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+import struct
+import unittest
+
+from battery_module import BatteryModule
+from cell_voltage_frame import CellVoltageFrame
+
+
+class CellVoltageFrameTest(unittest.TestCase):
+    def test_csv(self):
+        frame = CellVoltageFrame.from_csv(b'3.701,3.702,3.703', 3)
+        self.assertEqual(frame.voltages.tolist(), [3.701, 3.702, 3.703])
+        self.assertIsNone(frame.sequence)
+        self.assertIsNone(frame.uptime)
+
+        frame = CellVoltageFrame.from_csv(b'7,123456,3.701,3.702,3.703', 3)
+        self.assertEqual(frame.voltages.tolist(), [3.701, 3.702, 3.703])
+        self.assertEqual(frame.sequence, 7)
+        self.assertEqual(frame.uptime, 123456)
+
+    def test_binary(self):
+        frame = CellVoltageFrame.from_binary(struct.pack('<3H', 37010, 37020, 42000), 3)
+        self.assertEqual([round(voltage, 4) for voltage in frame.voltages.tolist()], [3.701, 3.702, 4.2])
+
+        frame = CellVoltageFrame.from_binary(struct.pack('<HI3H', 65535, 99, 37010, 37020, 37030), 3)
+        self.assertEqual(frame.sequence, 65535)
+        self.assertEqual(frame.uptime, 99)
+        self.assertAlmostEqual(frame.voltages[2], 3.703)
+
+    def test_wrong_size(self):
+        with self.assertRaises(ValueError):
+            CellVoltageFrame.from_csv(b'3.7,3.7', 3)
+        with self.assertRaises(ValueError):
+            CellVoltageFrame.from_csv(b'3.7,x,3.7', 3)
+        with self.assertRaises(ValueError):
+            CellVoltageFrame.from_binary(b'\x00' * 5, 3)
+
+    def test_sequence_wraps_around(self):
+        frame = CellVoltageFrame.from_binary(struct.pack('<HI1H', 2, 0, 37000), 1)
+        self.assertTrue(frame.is_newer_than(None))
+        self.assertTrue(frame.is_newer_than(65530))
+        self.assertTrue(frame.is_newer_than(1))
+        self.assertFalse(frame.is_newer_than(2))
+        self.assertFalse(frame.is_newer_than(3))
+
+    def test_module_batch_update(self):
+        module = BatteryModule(0, 3)
+        module.update_cell_voltages([3.7, 3.6, 3.8])
+        self.assertEqual([cell.voltage.value for cell in module.cells], [3.7, 3.6, 3.8])
+        self.assertEqual(module.min_voltage_cell(), module.cells[1])
+        self.assertEqual(module.max_voltage_cell(), module.cells[2])
+        self.assertAlmostEqual(module.cell_voltage_sum(), 11.1)
+
+        module.update_cell_voltages([3.71, 3.72, 3.73], accurate=True)
+        self.assertEqual(module.store.accurate_voltage.value.tolist(), [3.71, 3.72, 3.73])
+        self.assertTrue(all(cell.accurate_voltage.initialized() for cell in module.cells))
+
+
+if __name__ == '__main__':
+    unittest.main()
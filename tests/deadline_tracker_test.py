@@ -0,0 +1,91 @@
+import time
+import unittest
+from unittest.mock import MagicMock, patch
+
+from battery_manager import BatteryManager
+from battery_module import BatteryModule
+from battery_system import BatterySystem
+from deadline_tracker import DeadlineTracker
+
+
+class DeadlineTrackerTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tracker = DeadlineTracker(clock=lambda: 0.0)
+        self.on_expired = MagicMock()
+        self.queue = self.tracker.add_queue(10.0, self.on_expired)
+
+    def test_rearm_postpones_expiry(self):
+        self.queue.arm('a', 0.0)
+        self.queue.arm('b', 1.0)
+        self.queue.arm('a', 5.0)
+        self.assertEqual(self.tracker.next_deadline(), 11.0)
+        self.assertEqual(self.tracker.poll(11.0), 1)
+        self.on_expired.assert_called_once_with(['b'])
+        self.assertEqual(self.tracker.poll(15.0), 1)
+        self.on_expired.assert_called_with(['a'])
+
+    def test_expired_source_fires_once_until_rearmed(self):
+        self.queue.arm('a', 0.0)
+        self.assertEqual(self.tracker.poll(20.0), 1)
+        self.assertEqual(self.tracker.poll(40.0), 0)
+        self.assertIsNone(self.tracker.next_deadline())
+        self.queue.arm('a', 40.0)
+        self.assertEqual(self.tracker.poll(50.0), 1)
+
+    def test_initial_deadline_does_not_override_arm(self):
+        self.queue.arm('a', 0.0)
+        self.queue.arm_initial('a', 1.0)
+        self.queue.arm_initial('b', 2.0)
+        self.assertEqual(self.tracker.poll(2.0), 0)
+        self.queue.disarm('b')
+        self.assertEqual(len(self.queue), 1)
+
+
+class BatteryDeadlinesTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.battery_system = BatterySystem(2, 3)
+        self.communicator = MagicMock()
+        self.battery_manager = BatteryManager(self.battery_system, self.communicator)
+        self.now = time.time()
+        for module in self.battery_system.battery_modules:
+            module.update_esp_uptime(0)
+            module.update_cell_voltages([3.7] * 3)
+
+    def test_stale_cell_voltage(self):
+        tracker = self.battery_system.deadline_tracker
+        cell = self.battery_system.battery_modules[1].cells[2]
+        self.battery_system.battery_modules[0].update_cell_voltages([3.7] * 3)
+        with patch('builtins.print') as mock_print:
+            tracker.poll(self.now + BatteryManager.ESP_TIMEOUT_WARNING_SECONDS + 1)
+            self.battery_manager.log_sink.flush()
+        self.assertIn(f'Module{cell.module_id} Cell{cell.id}', mock_print.call_args_list[-1].args[0])
+        self.communicator.open_battery_relays.assert_not_called()
+
+        with patch('builtins.print'):
+            tracker.poll(self.now + BatteryManager.ESP_TIMEOUT_CRITICAL_SECONDS + 1)
+        self.communicator.open_battery_relays.assert_called_once()
+
+    def test_missed_heartbeat(self):
+        on_heartbeat_missed = MagicMock()
+        for module in self.battery_system.battery_modules:
+            module.heartbeat_event.on_heartbeat_missed += on_heartbeat_missed
+        tracker = self.battery_system.deadline_tracker
+        tracker.poll(self.now + BatteryModule.ESP_TIMEOUT - 1)
+        on_heartbeat_missed.assert_not_called()
+        with patch('time.time', return_value=self.now + 10):
+            self.battery_system.battery_modules[1].update_esp_uptime(1)
+        tracker.poll(self.now + BatteryModule.ESP_TIMEOUT + 1)
+        on_heartbeat_missed.assert_called_once_with(self.battery_system.battery_modules[0])
+
+    def test_module_that_never_reported_is_logged(self):
+        battery_system = BatterySystem(1, 3)
+        tracker = battery_system.deadline_tracker
+        with patch('builtins.print') as mock_print:
+            tracker.poll(tracker.clock() + BatteryModule.ESP_TIMEOUT + 1)
+            mock_print.assert_not_called()
+            battery_system.log_sink.flush()
+        mock_print.assert_called_once_with('ESP-Module 0 last uptime not initialized!', file=None, flush=True)
+
+
+if __name__ == '__main__':
+    unittest.main()
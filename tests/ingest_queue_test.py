@@ -0,0 +1,102 @@
+import time
+import unittest
+from contextlib import contextmanager
+from unittest.mock import MagicMock, call
+
+from ingest_queue import IngestQueue
+
+
+class IngestQueueTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.now = 0.0
+        self.process = MagicMock()
+        self.queue = IngestQueue(self.process, max_size=3, max_batch=2, clock=lambda: self.now)
+
+    def test_telemetry_is_kept_until_the_queue_is_full(self):
+        self.queue.put('a', b'1')
+        self.queue.put('a', b'2')
+        self.assertEqual(self.queue.process_pending(), 2)
+        self.assertEqual(self.process.call_args_list, [call('a', b'1'), call('a', b'2')])
+        self.assertEqual(self.queue.statistics.coalesced, 0)
+
+    def test_full_queue_coalesces_per_topic(self):
+        self.queue.put('a', b'1')
+        self.queue.put('b', b'1')
+        self.queue.put('a', b'2')
+        self.queue.put('a', b'3')
+        self.assertEqual(self.queue.process_pending(), 3)
+        self.assertEqual(self.process.call_args_list, [call('a', b'1'), call('b', b'1'), call('a', b'3')])
+        self.assertEqual(self.queue.statistics.coalesced, 1)
+        self.assertEqual(self.queue.statistics.dropped, 0)
+
+    def test_overflow_drops_oldest_telemetry(self):
+        for topic in 'abcd':
+            self.queue.put(topic, b'1')
+        self.queue.put('control', b'1', control=True)
+        self.queue.process_pending()
+        self.assertEqual(self.process.call_args_list, [call('control', b'1'), call('b', b'1'),
+                                                       call('c', b'1'), call('d', b'1')])
+        self.assertEqual(self.queue.statistics.dropped, 1)
+
+    def test_control_messages_are_kept_in_order(self):
+        self.queue.put('control', b'1', control=True)
+        self.queue.put('control', b'2', control=True)
+        self.queue.process_pending()
+        self.assertEqual(self.process.call_args_list, [call('control', b'1'), call('control', b'2')])
+
+    def test_control_messages_survive_overflow(self):
+        for _ in range(10):
+            self.queue.put('control', b'1', control=True)
+        for topic in 'abcd':
+            self.queue.put(topic, b'1')
+        self.assertEqual(self.queue.process_pending(), 13)
+        self.assertEqual(self.process.call_args_list[:10], [call('control', b'1')] * 10)
+        self.assertEqual(self.queue.statistics.dropped, 1)
+
+    def test_each_batch_runs_in_the_batch_context(self):
+        events = []
+
+        @contextmanager
+        def batch_context():
+            events.append('enter')
+            yield
+            events.append('exit')
+
+        queue = IngestQueue(lambda topic, payload: events.append(topic), max_size=3, max_batch=2,
+                            batch_context=batch_context)
+        for topic in 'abc':
+            queue.put(topic, b'1')
+        queue.process_pending()
+        self.assertEqual(events, ['enter', 'a', 'b', 'exit', 'enter', 'c', 'exit'])
+
+    def test_statistics(self):
+        self.queue.put('a', b'1')
+        self.now = 0.25
+        self.queue.put('b', b'1')
+        self.queue.put('c', b'1')
+        self.now = 0.5
+        self.queue.process_pending()
+        statistics = self.queue.statistics.as_dict()
+        self.assertEqual(statistics['max_depth'], 3)
+        self.assertEqual(statistics['depth'], 0)
+        self.assertEqual(statistics['batches'], 2)
+        self.assertEqual(statistics['max_batch_size'], 2)
+        self.assertAlmostEqual(statistics['mean_batch_size'], 1.5)
+        self.assertAlmostEqual(statistics['max_latency'], 0.5)
+        self.assertAlmostEqual(statistics['mean_latency'], 1 / 3)
+
+    def test_worker_thread_processes_messages(self):
+        queue = IngestQueue(self.process, max_size=10, max_batch=10)
+        queue.start()
+        queue.put('a', b'1')
+        queue.put('control', b'1', control=True)
+        for _ in range(100):
+            if self.process.call_count == 2:
+                break
+            time.sleep(0.01)
+        queue.stop()
+        self.assertEqual(self.process.call_count, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+import math
+import time
+import unittest
+from unittest.mock import patch
+
+import numpy as np
+
+from pack_simulator import PackSimulator
+
+
+class PackSimulatorTest(unittest.TestCase):
+    def test_full_pack_balances_without_alarms(self):
+        rng = np.random.default_rng(1)
+        simulator = PackSimulator(16, 24, soc=rng.normal(0.6, 0.005, (16, 24)),
+                                  config={'balancing_mode': 'proportional'})
+        started = time.perf_counter()
+        with patch('builtins.print'):
+            report = simulator.run(12 * 3600)
+        self.assertLess(time.perf_counter() - started, 30.0)
+
+        self.assertEqual(report['simulated_seconds'], 12 * 3600)
+        self.assertIsNotNone(report['time_to_balance'])
+        self.assertLess(report['final_cell_diff'], report['initial_cell_diff'])
+        self.assertGreater(report['energy_bled_wh'], 0.0)
+        self.assertGreater(report['max_chip_temp'], 20.0)
+        self.assertEqual(report['safety_disconnects'], 0)
+        self.assertEqual(report['alarms'], {'implausible': 0, 'critical': 0, 'warning': 0, 'heartbeat_missed': 0})
+
+    def test_two_days_with_load(self):
+        rng = np.random.default_rng(0)
+        simulator = PackSimulator(16, 24, soc=rng.normal(0.6, 0.01, (16, 24)),
+                                  current=lambda t: 2.0 * math.sin(2 * math.pi * t / 86400),
+                                  config={'balancing_mode': 'proportional'})
+        duration = 2 * 86400
+        started = time.perf_counter()
+        with patch('builtins.print'):
+            report = simulator.run(duration)
+        self.assertLess(time.perf_counter() - started, 60.0)
+
+        # No production task is ticked more often than the simulation steps
+        for task in simulator.scheduler.tasks.values():
+            self.assertLessEqual(task.statistics.runs, duration / simulator.step + 1)
+        self.assertEqual(report['simulated_seconds'], duration)
+        self.assertIsNotNone(report['time_to_balance'])
+        self.assertLess(report['final_cell_diff'], report['initial_cell_diff'])
+        self.assertEqual(report['safety_disconnects'], 0)
+        self.assertEqual(report['alarms'], {'implausible': 0, 'critical': 0, 'warning': 0, 'heartbeat_missed': 0})
+
+    def test_balanced_pack_only_self_discharges(self):
+        simulator = PackSimulator(2, 4, soc=0.5, self_discharge=0.01)
+        with patch('builtins.print'):
+            report = simulator.run(86400)
+        self.assertEqual(report['time_to_balance'], 0.0)
+        self.assertEqual(report['energy_bled_wh'], 0.0)
+        np.testing.assert_allclose(simulator.soc, 0.49)
+
+    def test_odd_cell_count(self):
+        simulator = PackSimulator(2, 13, temperature=np.linspace(20.0, 32.0, 13))
+        with patch('builtins.print') as mock_print:
+            report = simulator.run(120)
+        mock_print.assert_not_called()
+        self.assertEqual(report['safety_disconnects'], 0)
+        module = simulator.battery_system.battery_modules[1]
+        self.assertEqual(module.module_temp1.value, 23.0)
+        self.assertEqual(module.module_temp2.value, 29.5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import math
+import unittest
+from unittest.mock import patch
+
+from battery_cell_list import BatteryCellList
+from battery_system import BatterySystem
+from virtual_clock import VirtualClock
+
+
+class PackSnapshotTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.clock = VirtualClock(1000.0)
+        self.battery_system = BatterySystem(2, 3, clock=self.clock)
+        self.store = self.battery_system.cell_store
+
+    def test_one_version_per_batch(self):
+        module = self.battery_system.battery_modules[0]
+        version = self.store.snapshot.version
+        module.update_cell_voltages([3.6, 3.7, 3.8])
+        self.assertEqual(self.store.snapshot.version, version + 1)
+        module.update_module_temps(20.0, 21.0)
+        self.assertEqual(self.store.snapshot.version, version + 2)
+        self.assertEqual(self.store.snapshot.voltage.value[:3].tolist(), [3.6, 3.7, 3.8])
+
+    def test_unbatched_writes_publish_on_next_read(self):
+        cell = self.battery_system.battery_modules[0].cells[0]
+        version = self.store.snapshot.version
+        with patch.object(self.store, 'publish', wraps=self.store.publish) as publish:
+            for voltage in (3.6, 3.7, 3.8):
+                cell.voltage.update(voltage)
+            publish.assert_not_called()
+            self.assertEqual(self.store.snapshot.voltage.value[0], 3.8)
+            self.assertEqual(self.store.snapshot.version, version + 1)
+        publish.assert_called_once()
+
+    def test_after_publish_waits_for_the_batch(self):
+        module = self.battery_system.battery_modules[0]
+        versions = []
+        with self.store.batch():
+            module.update_cell_voltages([3.6, 3.7, 3.8])
+            self.store.after_publish(lambda: versions.append(self.store.snapshot.version))
+            module.update_cell_voltages([3.6, 3.7, 3.9])
+            self.assertEqual(versions, [])
+        self.assertEqual(versions, [self.store.snapshot.version])
+        self.assertEqual(self.store.snapshot.voltage.value[2], 3.9)
+
+    def test_held_snapshot_stays_consistent(self):
+        module = self.battery_system.battery_modules[1]
+        module.update_cell_voltages([3.6, 3.6, 3.6], accurate=True)
+        cells = BatteryCellList(self.battery_system.cells(), snapshot=self.store.snapshot)
+        module.update_cell_voltages([3.9, 3.9, 3.9], accurate=True)
+
+        self.assertEqual(cells.snapshot.accurate_voltage.value[3:].tolist(), [3.6, 3.6, 3.6])
+        self.assertEqual(self.store.snapshot.accurate_voltage.value[3:].tolist(), [3.9, 3.9, 3.9])
+        with self.assertRaises(ValueError):
+            cells.snapshot.accurate_voltage.value[3] = 4.0
+
+    def test_age_of_oldest_input(self):
+        with self.assertRaises(TypeError):
+            self.store.snapshot.lowest_cell_voltage()
+        self.assertEqual(self.store.snapshot.age(self.clock()), math.inf)
+
+        for module in self.battery_system.battery_modules:
+            module.update_cell_voltages([3.6, 3.7, 3.8], accurate=True)
+            module.update_module_temps(20.0, 25.0)
+        self.clock.advance(10.0)
+        for module in self.battery_system.battery_modules:
+            module.update_cell_voltages([3.6, 3.7, 3.8])
+
+        snapshot = self.store.snapshot
+        self.assertEqual(snapshot.oldest_input_time, 1000.0)
+        self.assertEqual(snapshot.age(1015.0), 15.0)
+        self.assertEqual(snapshot.lowest_cell_voltage(), 3.6)
+        self.assertEqual(snapshot.highest_cell_voltage(), 3.8)
+        self.assertEqual(snapshot.lowest_module_temp(), 20.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+import threading
+import time
+import unittest
+from unittest.mock import MagicMock, patch
+
+from periodic_scheduler import Histogram
+from periodic_scheduler import PeriodicScheduler
+from periodic_scheduler import PeriodicTask
+
+
+class PeriodicTaskTest(unittest.TestCase):
+    def test_deadlines_do_not_drift(self):
+        task = PeriodicTask('task', MagicMock(), period=1.0, initial_delay=20.0)
+        task.start(100.0)
+        self.assertEqual(task.next_deadline, 120.0)
+        task.schedule_next(120.4)
+        self.assertEqual(task.next_deadline, 121.0)
+        task.schedule_next(121.9)
+        self.assertEqual(task.next_deadline, 122.0)
+        self.assertEqual(task.statistics.overruns, 0)
+
+    def test_overrun_skips_missed_deadlines(self):
+        task = PeriodicTask('task', MagicMock(), period=1.0)
+        task.start(0.0)
+        task.schedule_next(2.5)
+        self.assertEqual(task.next_deadline, 3.0)
+        self.assertEqual(task.statistics.overruns, 1)
+        self.assertEqual(task.statistics.skipped_runs, 2)
+
+    def test_exceptions_are_counted(self):
+        task = PeriodicTask('task', MagicMock(side_effect=ValueError('boom')), period=1.0)
+        with patch('builtins.print'):
+            task.run()
+        self.assertEqual(task.statistics.errors, 1)
+
+
+class HistogramTest(unittest.TestCase):
+    def test_buckets(self):
+        histogram = Histogram((0.01, 0.1))
+        for value in (0.0, 0.01, 0.05, 0.5):
+            histogram.record(value)
+        self.assertEqual(histogram.as_dict(), {'<=0.01': 2, '<=0.1': 1, '>0.1': 1})
+
+
+class PeriodicSchedulerTest(unittest.TestCase):
+    def test_slow_task_does_not_delay_other_lanes(self):
+        scheduler = PeriodicScheduler()
+        scheduler.add_task('heartbeat', MagicMock(), period=0.01, lane='heartbeat')
+        scheduler.add_task('slow', lambda: time.sleep(0.1), period=0.01)
+        thread = threading.Thread(target=scheduler.run)
+        thread.start()
+        time.sleep(0.15)
+        scheduler.stop()
+        thread.join()
+
+        statistics = scheduler.statistics_dict()
+        self.assertGreaterEqual(statistics['heartbeat']['runs'], 8)
+        self.assertEqual(statistics['heartbeat']['overruns'], 0)
+        self.assertLessEqual(statistics['slow']['runs'], 2)
+        self.assertGreaterEqual(statistics['slow']['overruns'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
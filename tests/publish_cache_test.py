@@ -0,0 +1,50 @@
+import unittest
+from unittest.mock import MagicMock, call
+
+from publish_cache import PublishCache
+
+
+class PublishCacheTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.now = 0.0
+        self.client = MagicMock()
+        self.cache = PublishCache(self.client.publish, max_interval=30.0, clock=lambda: self.now)
+
+    def test_unchanged_payload_is_suppressed(self):
+        self.assertTrue(self.cache.publish('a', '1.00'))
+        self.assertFalse(self.cache.publish('a', '1.00'))
+        self.assertTrue(self.cache.publish('a', '1.01'))
+        self.assertTrue(self.cache.publish('b', '1.01'))
+        self.assertEqual(self.cache.sent, 3)
+        self.assertEqual(self.cache.suppressed, 1)
+        self.client.publish.assert_has_calls([call(topic='a', payload='1.00', retain=False),
+                                              call(topic='a', payload='1.01', retain=False),
+                                              call(topic='b', payload='1.01', retain=False)])
+
+    def test_deadband_compares_against_last_sent_value(self):
+        self.cache.publish('a', '3.700', deadband=0.002)
+        self.assertFalse(self.cache.publish('a', '3.701', deadband=0.002))
+        self.assertFalse(self.cache.publish('a', '3.702', deadband=0.002))
+        self.assertTrue(self.cache.publish('a', '3.703', deadband=0.002))
+        self.assertTrue(self.cache.publish('a', 'n/a', deadband=0.002))
+
+    def test_refresh_after_max_interval(self):
+        self.cache.publish('a', '1', retain=True)
+        self.now = 29.9
+        self.assertFalse(self.cache.publish('a', '1', retain=True))
+        self.now = 30.0
+        self.assertTrue(self.cache.publish('a', '1', retain=True))
+        self.assertEqual(self.client.publish.call_count, 2)
+
+    def test_invalidate(self):
+        self.cache.publish('a', '1')
+        self.cache.publish('b', '1')
+        self.cache.invalidate('a')
+        self.assertTrue(self.cache.publish('a', '1'))
+        self.assertFalse(self.cache.publish('b', '1'))
+        self.cache.invalidate()
+        self.assertTrue(self.cache.publish('b', '1'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+import unittest
+from unittest.mock import MagicMock, call
+
+from publish_scheduler import PublishPriority
+from publish_scheduler import PublishScheduler
+
+
+class PublishSchedulerTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.now = 0.0
+        self.client = MagicMock()
+        self.scheduler = PublishScheduler(self.client, telemetry_rate=10.0, telemetry_burst=2, clock=lambda: self.now)
+
+    def test_safety_is_published_immediately(self):
+        self.scheduler.publish('a', '1', priority=PublishPriority.TELEMETRY)
+        self.scheduler.publish('relay', 'off', priority=PublishPriority.SAFETY)
+        self.client.publish.assert_called_once_with(topic='relay', payload='off', retain=False)
+        self.assertEqual(self.scheduler.statistics[PublishPriority.SAFETY].published, 1)
+
+    def test_control_is_sent_before_telemetry(self):
+        self.scheduler.publish('telemetry', '1')
+        self.scheduler.publish('control1', '1', priority=PublishPriority.CONTROL)
+        self.scheduler.publish('control2', '2', retain=True, priority=PublishPriority.CONTROL)
+        self.scheduler.process_pending()
+        self.assertEqual(self.client.publish.call_args_list, [call(topic='control1', payload='1', retain=False),
+                                                              call(topic='control2', payload='2', retain=True),
+                                                              call(topic='telemetry', payload='1', retain=False)])
+
+    def test_telemetry_is_coalesced_per_topic(self):
+        self.scheduler.publish('a', '1')
+        self.scheduler.publish('b', '1')
+        self.scheduler.publish('a', '2')
+        self.scheduler.process_pending()
+        self.assertEqual(self.client.publish.call_args_list, [call(topic='a', payload='2', retain=False),
+                                                              call(topic='b', payload='1', retain=False)])
+        self.assertEqual(self.scheduler.statistics[PublishPriority.TELEMETRY].coalesced, 1)
+
+    def test_telemetry_is_rate_limited(self):
+        for topic in 'abc':
+            self.scheduler.publish(topic, '1')
+        self.assertAlmostEqual(self.scheduler.process_pending(), 0.1)
+        self.assertEqual(self.client.publish.call_count, 2)
+
+        # Control messages are not held back by the telemetry budget
+        self.scheduler.publish('control', '1', priority=PublishPriority.CONTROL)
+        self.scheduler.process_pending()
+        self.assertEqual(self.client.publish.call_count, 3)
+
+        self.now = 0.1
+        self.assertIsNone(self.scheduler.process_pending())
+        self.client.publish.assert_called_with(topic='c', payload='1', retain=False)
+
+    def test_statistics(self):
+        self.scheduler.publish('a', '1')
+        self.scheduler.publish('b', '1')
+        self.scheduler.publish('c', '1')
+        self.now = 0.5
+        self.scheduler.process_pending()
+        statistics = self.scheduler.statistics_dict()['telemetry']
+        self.assertEqual(statistics['max_depth'], 3)
+        self.assertEqual(statistics['depth'], 1)
+        self.assertEqual(statistics['published'], 2)
+        self.assertAlmostEqual(statistics['mean_time_in_queue'], 0.5)
+
+    def test_worker_thread_publishes(self):
+        scheduler = PublishScheduler(self.client, telemetry_rate=100.0, telemetry_burst=10)
+        scheduler.start()
+        scheduler.publish('a', '1')
+        scheduler.publish('b', '1', priority=PublishPriority.CONTROL)
+        scheduler.stop()
+        self.assertEqual(self.client.publish.call_count, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+import random
+import unittest
+
+from rolling_window import RollingWindow
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now: float = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class RollingWindowTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.clock = FakeClock()
+        self.window = RollingWindow(window_seconds=10.0, max_samples=100, clock=self.clock)
+
+    def test_statistics(self):
+        for value in [3.0, 1.0, 4.0, 1.0, 5.0]:
+            self.window.add(value)
+        self.assertEqual(self.window.count(), 5)
+        self.assertAlmostEqual(self.window.sum(), 14.0)
+        self.assertAlmostEqual(self.window.mean(), 2.8)
+        self.assertEqual(self.window.min(), 1.0)
+        self.assertEqual(self.window.max(), 5.0)
+
+    def test_time_eviction(self):
+        self.window.add(10.0)
+        self.clock.now += 6.0
+        self.window.add(1.0)
+        self.clock.now += 6.0
+        self.window.add(2.0)
+        self.assertEqual(self.window.count(), 2)
+        self.assertEqual(self.window.max(), 2.0)
+        self.assertAlmostEqual(self.window.mean(), 1.5)
+
+        # The newest sample stays even when it is older than the window
+        self.clock.now += 100.0
+        self.assertEqual(self.window.count(), 1)
+        self.assertEqual(self.window.mean(), 2.0)
+
+    def test_max_samples(self):
+        window = RollingWindow(window_seconds=10.0, max_samples=3, clock=self.clock)
+        for value in [9.0, 1.0, 2.0, 3.0]:
+            window.add(value)
+        self.assertEqual(window.count(), 3)
+        self.assertEqual(window.max(), 3.0)
+        self.assertEqual(window.min(), 1.0)
+
+    def test_matches_full_scan(self):
+        random.seed(4)
+        window = RollingWindow(window_seconds=30.0, max_samples=20, clock=self.clock)
+        samples = []
+        for _ in range(1000):
+            self.clock.now += random.uniform(0.0, 4.0)
+            value = random.uniform(-1.0, 1.0)
+            window.add(value)
+            samples.append((self.clock.now, value))
+            samples = [sample for sample in samples[-20:] if sample[0] + 30.0 >= self.clock.now]
+            values = [sample[1] for sample in samples]
+            self.assertEqual(window.count(), len(values))
+            self.assertAlmostEqual(window.mean(), sum(values) / len(values))
+            self.assertEqual(window.min(), min(values))
+            self.assertEqual(window.max(), max(values))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,237 @@
+import re
+import struct
+import unittest
+import unittest.mock
+from unittest.mock import MagicMock
+
+from paho.mqtt.client import MQTTMessage
+
+from battery_system import BatterySystem
+from slave_communicator import SlaveCommunicator
+
+CONFIGS = {
+    'credentials.yaml': {'username': 'user', 'password': 'secret'},
+    'slave_mapping.yaml': {'slaves': {'aabbccddeeff': {'number': 1, 'total_voltage_measurer': True}}},
+}
+
+
+def message(topic: str, payload: bytes) -> MQTTMessage:
+    msg = MQTTMessage(topic=topic.encode())
+    msg.payload = payload
+    return msg
+
+
+class SlaveCommunicatorTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.battery_system = BatterySystem(2, 3)
+        self.communicator, self.client = self.create_communicator({})
+        self.communicator._mqtt_on_connect(self.client, None, None, 0, None)
+        self.flush()
+        self.client.reset_mock()
+
+    def create_communicator(self, config: dict) -> tuple[SlaveCommunicator, MagicMock]:
+        with unittest.mock.patch('slave_communicator.mqtt.Client') as client_class, \
+                unittest.mock.patch('slave_communicator.get_config', side_effect=CONFIGS.get), \
+                unittest.mock.patch('slave_communicator.PublishScheduler.start'), \
+                unittest.mock.patch('slave_communicator.IngestQueue.start'):
+            communicator = SlaveCommunicator({'mqtt_server': 'localhost', 'mqtt_port': 1883, **config},
+                                             self.battery_system)
+        return communicator, client_class.return_value
+
+    def receive(self, topic: str, payload: bytes) -> None:
+        self.communicator._mqtt_on_message(self.client, None, message(topic, payload))
+        self.communicator._ingest_queue.process_pending()
+
+    def flush(self) -> None:
+        self.communicator._publish_scheduler.process_pending()
+
+    def test_cell_messages(self):
+        self.receive('esp-module/2/cell/3/voltage', b'3.712')
+        self.receive('esp-module/2/accurate/cell/1/voltage', b'3.701')
+        cells = self.battery_system.battery_modules[1].cells
+        self.assertEqual(cells[2].voltage.value, 3.712)
+        self.assertEqual(cells[0].accurate_voltage.value, 3.701)
+
+        self.receive('esp-module/2/cell/3/is_balancing', b'1')
+        self.assertTrue(cells[2].balance_pin_state)
+        self.receive('esp-module/2/cell/3/is_balancing', b'0')
+        self.assertFalse(cells[2].balance_pin_state)
+
+    def test_packed_cell_voltages(self):
+        module = self.battery_system.battery_modules[1]
+        self.receive('esp-module/2/cell_voltages', b'3.701,3.702,3.703')
+        self.assertEqual([cell.voltage.value for cell in module.cells], [3.701, 3.702, 3.703])
+
+        self.receive('esp-module/2/accurate/cell_voltages/packed', struct.pack('<HI3H', 5, 4000, 37100, 37200, 37300))
+        self.assertEqual([round(cell.accurate_voltage.value, 4) for cell in module.cells], [3.71, 3.72, 3.73])
+        self.assertEqual(module.last_esp_uptime, 4000)
+
+        # Stale frames are dropped
+        self.receive('esp-module/2/accurate/cell_voltages/packed', struct.pack('<HI3H', 4, 3000, 1, 1, 1))
+        self.assertAlmostEqual(module.cells[0].accurate_voltage.value, 3.71)
+
+    def test_packed_cell_voltages_after_esp_reboot(self):
+        module = self.battery_system.battery_modules[1]
+        self.receive('esp-module/2/cell_voltages/packed', struct.pack('<HI3H', 30000, 3600000, 37100, 37100, 37100))
+
+        # The rebooted ESP starts over at sequence 0
+        self.receive('esp-module/2/cell_voltages/packed', struct.pack('<HI3H', 0, 2000, 37200, 37200, 37200))
+        self.assertAlmostEqual(module.cells[0].voltage.value, 3.72)
+        self.assertEqual(module.last_esp_uptime, 2000)
+        self.receive('esp-module/2/cell_voltages/packed', struct.pack('<HI3H', 1, 3000, 37300, 37300, 37300))
+        self.assertAlmostEqual(module.cells[0].voltage.value, 3.73)
+
+    def test_uptime_message_after_esp_reboot_resets_frame_sequence(self):
+        module = self.battery_system.battery_modules[1]
+        self.receive('esp-module/2/accurate/cell_voltages/packed', struct.pack('<HI3H', 30000, 3600000, 1, 1, 1))
+        self.receive('esp-module/2/uptime', b'1500')
+        self.receive('esp-module/2/accurate/cell_voltages/packed', struct.pack('<HI3H', 0, 2000, 37200, 37200, 37200))
+        self.assertAlmostEqual(module.cells[0].accurate_voltage.value, 3.72)
+
+    def test_module_messages(self):
+        module = self.battery_system.battery_modules[0]
+        self.receive('esp-module/1/module_voltage', b'44.5')
+        self.receive('esp-module/1/module_temps', b'21.5,22.5')
+        self.receive('esp-module/1/chip_temp', b'35.0')
+        self.receive('esp-module/1/uptime', b'1000')
+        self.receive('esp-module/1/uptime', b'2005')
+        self.assertEqual(module.voltage.value, 44.5)
+        self.assertEqual(module.module_temp1.value, 21.5)
+        self.assertEqual(module.module_temp2.value, 22.5)
+        self.assertEqual(module.chip_temp.value, 35.0)
+        self.assertEqual(module.last_esp_uptime, 2005)
+        self.flush()
+        self.client.publish.assert_called_once_with(topic='esp-module/1/timediff', payload='5', retain=False)
+
+    def test_total_messages(self):
+        self.receive('esp-total/total_voltage', b'530.1')
+        self.receive('esp-total/total_current', b'-12.5')
+        self.assertEqual(self.battery_system.voltage.value, 530.1)
+        self.assertEqual(self.battery_system.current.value, -12.5)
+
+    def test_bad_data_does_not_update(self):
+        with unittest.mock.patch('builtins.print') as mock_print:
+            self.receive('esp-module/1/cell/1/voltage', b'abc')
+            # Nothing is written from the MQTT path, the line waits in the log sink
+            mock_print.assert_not_called()
+            self.battery_system.log_sink.flush()
+        self.assertFalse(self.battery_system.battery_modules[0].cells[0].voltage.initialized())
+        mock_print.assert_called_once_with('esp 1 voltage >abc< bad data', file=None, flush=True)
+
+    def test_slave_and_config_messages(self):
+        self.receive('esp-module/aabbccddeeff/uptime', b'1')
+        self.flush()
+        self.client.publish.assert_called_once_with(topic='esp-module/aabbccddeeff/set_config', payload='1,1,0',
+                                                    retain=False)
+
+        handler = MagicMock()
+        self.communicator.events.on_balancing_ignore_slaves_set += handler
+        self.receive('master/core/config/balancing_ignore_slaves/set', b'1,3')
+        handler.assert_called_once_with({1, 3})
+
+    def test_module_balance_request(self):
+        self.communicator.send_module_balance_request(1, {2: 30.0, 0: 1.5})
+        self.flush()
+        topics = [call.kwargs['topic'] for call in self.client.publish.call_args_list]
+        self.assertEqual(topics, ['esp-module/2/cell/3/balance_request', 'esp-module/2/cell/1/balance_request'])
+
+        communicator, client = self.create_communicator({'mqtt_batched_balance_requests': True})
+        communicator.send_module_balance_request(1, {2: 30.0, 0: 1.5})
+        communicator._publish_scheduler.process_pending()
+        client.publish.assert_called_once_with(topic='esp-module/2/balance_request', payload='1:1500,3:30000',
+                                               retain=False)
+
+    def test_legacy_slave_ignores_batched_balance_request(self):
+        # Older firmware only knows the per-cell topic and reports is_balancing=0 once that discharge is over
+        def run_legacy_slave(communicator: SlaveCommunicator, client: MagicMock) -> None:
+            communicator._publish_scheduler.process_pending()
+            for call in client.publish.call_args_list:
+                request = re.fullmatch(r'esp-module/(\d+)/cell/(\d+)/balance_request', call.kwargs['topic'])
+                if request is not None:
+                    communicator._mqtt_on_message(client, None, message(
+                        f'esp-module/{request[1]}/cell/{request[2]}/is_balancing', b'0'))
+            communicator._ingest_queue.process_pending()
+
+        module = self.battery_system.battery_modules[1]
+        module.set_balance_pin_states([0, 2], True)
+        self.communicator.send_module_balance_request(1, {0: 1.5, 2: 30.0})
+        run_legacy_slave(self.communicator, self.client)
+        self.assertEqual([cell.balance_pin_state for cell in module.cells], [False, False, False])
+
+        communicator, client = self.create_communicator({'mqtt_batched_balance_requests': True})
+        module.set_balance_pin_states([0, 2], True)
+        communicator.send_module_balance_request(1, {0: 1.5, 2: 30.0})
+        run_legacy_slave(communicator, client)
+        self.assertEqual([cell.balance_pin_state for cell in module.cells], [True, False, True])
+
+    def test_wildcard_subscriptions(self):
+        self.communicator._mqtt_on_connect(self.client, None, None, 0, None)
+        self.client.subscribe.assert_called_once()
+        topics = [topic for topic, _ in self.client.subscribe.call_args.args[0]]
+        self.assertIn('esp-module/+/cell/+/voltage', topics)
+        self.assertIn('master/core/config/balancing_enabled/set', topics)
+
+    def test_explicit_subscriptions_follow_cell_count(self):
+        communicator, client = self.create_communicator({'mqtt_wildcard_subscriptions': False})
+        communicator._mqtt_on_connect(client, None, None, 0, None)
+        client.subscribe.assert_called_once()
+        topics = [topic for topic, _ in client.subscribe.call_args.args[0]]
+        self.assertIn('esp-module/2/cell/3/voltage', topics)
+        self.assertNotIn('esp-module/2/cell/4/voltage', topics)
+        self.assertIn('esp-module/aabbccddeeff/uptime', topics)
+
+    def test_unconfigured_modules_and_cells_are_ignored(self):
+        with unittest.mock.patch('builtins.print') as mock_print:
+            self.receive('esp-module/3/cell/1/voltage', b'3.7')
+            self.receive('esp-module/0/chip_temp', b'30.0')
+            self.receive('esp-module/1/cell/4/voltage', b'3.7')
+            self.battery_system.log_sink.flush()
+        mock_print.assert_not_called()
+        self.assertFalse(self.battery_system.battery_modules[1].chip_temp.initialized())
+
+    def test_messages_are_applied_by_the_worker(self):
+        self.communicator._mqtt_on_message(self.client, None, message('esp-module/1/cell/1/voltage', b'3.6'))
+        self.communicator._mqtt_on_message(self.client, None, message('esp-module/1/cell/1/voltage', b'3.7'))
+        cell = self.battery_system.battery_modules[0].cells[0]
+        self.assertFalse(cell.voltage.initialized())
+        self.communicator._ingest_queue.process_pending()
+        self.assertEqual(cell.voltage.value, 3.7)
+        statistics = self.communicator.ingest_statistics()
+        self.assertEqual(statistics['received'], 2)
+        self.assertEqual(statistics['coalesced'], 0)
+
+    def test_overflow_keeps_safety_and_balancing_messages(self):
+        communicator, client = self.create_communicator({'mqtt_ingest_queue_size': 2})
+        cell = self.battery_system.battery_modules[0].cells[1]
+        cell.balance_pin_state = True
+        for topic, payload in (('esp-module/1/cell/2/is_balancing', b'0'), ('esp-total/total_current', b'40'),
+                               ('esp-module/1/cell/1/voltage', b'3.6'), ('esp-module/1/cell/2/voltage', b'3.6'),
+                               ('esp-module/1/cell/3/voltage', b'3.6'), ('esp-total/total_current', b'41')):
+            communicator._mqtt_on_message(client, None, message(topic, payload))
+        communicator._ingest_queue.process_pending()
+
+        self.assertFalse(cell.balance_pin_state)
+        # Both critical samples count towards the disconnect threshold
+        self.assertEqual(self.battery_system.current.critical_counter, 2)
+        self.assertEqual(communicator.ingest_statistics()['dropped'], 1)
+
+    def test_ingest_batch_publishes_one_snapshot(self):
+        module = self.battery_system.battery_modules[1]
+        store = self.battery_system.cell_store
+        seen = []
+        module.accurate_readings_event.on_accurate_readings_complete += \
+            lambda _: seen.append(store.snapshot.accurate_voltage.value[module.cell_indices].tolist())
+        module.accurate_readings_requested()
+        version = store.snapshot.version
+        for cell_number in range(1, 4):
+            self.communicator._mqtt_on_message(self.client, None, message(
+                f'esp-module/2/accurate/cell/{cell_number}/voltage', f'3.70{cell_number}'.encode()))
+        self.communicator._ingest_queue.process_pending()
+
+        self.assertEqual(store.snapshot.version, version + 1)
+        # The handler runs after the batch is published and sees all of its readings
+        self.assertEqual(seen, [[3.701, 3.702, 3.703]])
+
+
+if __name__ == '__main__':
+    unittest.main()
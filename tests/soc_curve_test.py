@@ -1,5 +1,7 @@
 import unittest
 
+import numpy as np
+
 from soc_curve import SocCurve
 
 
@@ -63,6 +65,22 @@ class SocCurveTest(unittest.TestCase):
         self.assertAlmostEqual(SocCurve.soc_to_voltage(0.35), 3.628, delta=0.01)
         self.assertAlmostEqual(SocCurve.soc_to_voltage(0.7), 3.825, delta=0.01)
 
+    def test_voltage_to_soc_many(self):
+        voltages = np.array([3.3, 3.42, 3.628, 3.825, 3.869, 4.136, 4.2])
+        socs = SocCurve.voltage_to_soc_many(voltages)
+        for voltage, soc in zip(voltages.tolist(), socs.tolist()):
+            self.assertEqual(soc, self.soc_curve.voltage_to_soc(voltage))
+        with self.assertRaises(AssertionError):
+            SocCurve.voltage_to_soc_many(np.array([3.6, 6.0]))
+
+    def test_soc_to_voltage_many(self):
+        socs = np.array([0.0, 0.15, 0.35, 0.7, 0.75, 0.93, 1.0])
+        voltages = SocCurve.soc_to_voltage_many(socs)
+        for soc, voltage in zip(socs.tolist(), voltages.tolist()):
+            self.assertEqual(voltage, SocCurve.soc_to_voltage(soc))
+        with self.assertRaises(AssertionError):
+            SocCurve.soc_to_voltage_many(np.array([0.5, 1.1]))
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,94 @@
+import asyncio
+import json
+import threading
+import time
+import unittest
+from unittest.mock import MagicMock, patch
+
+from battery_manager import BatteryManager
+from battery_system import BatterySystem
+from main import add_tasks
+from periodic_scheduler import PeriodicScheduler
+from slave_communicator_events import SlaveCommunicatorEvents
+from virtual_clock import VirtualClock
+from virtual_clock import call_later
+from virtual_clock import wall_clock
+
+
+class VirtualClockTest(unittest.TestCase):
+    def test_timers_fire_in_order_at_their_deadline(self):
+        clock = VirtualClock(100.0)
+        fired = []
+        clock.call_later(5.0, lambda: fired.append(('b', clock())))
+        clock.call_later(2.0, lambda: fired.append(('a', clock())))
+        cancelled = clock.call_later(3.0, lambda: fired.append(('c', clock())))
+        cancelled.cancel()
+        clock.advance(4.0)
+        self.assertEqual(fired, [('a', 102.0)])
+        self.assertEqual(clock(), 104.0)
+        clock.advance_to(110.0)
+        self.assertEqual(fired, [('a', 102.0), ('b', 105.0)])
+        self.assertIsNone(clock.next_timer())
+
+    def test_wall_clock_timer_runs_on_the_running_loop(self):
+        async def run() -> tuple[int, object]:
+            fired = asyncio.get_running_loop().create_future()
+            timer = call_later(wall_clock, 0.01, lambda: fired.set_result(threading.get_ident()))
+            return await fired, timer
+
+        thread_id, timer = asyncio.run(run())
+        self.assertEqual(thread_id, threading.get_ident())
+        self.assertIsInstance(timer, asyncio.TimerHandle)
+
+    def test_wall_clock_timer_without_loop_uses_a_thread(self):
+        fired = threading.Event()
+        timer = call_later(wall_clock, 0.01, fired.set)
+        self.assertIsInstance(timer, threading.Timer)
+        self.assertTrue(fired.wait(5.0))
+
+
+class VirtualPackTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.clock = VirtualClock(1_000_000.0)
+        self.battery_system = BatterySystem(2, 3, clock=self.clock)
+        self.communicator = MagicMock()
+        self.communicator.events = SlaveCommunicatorEvents()
+        self.battery_manager = BatteryManager(self.battery_system, self.communicator)
+        self.scheduler = PeriodicScheduler(self.clock)
+        add_tasks(self.scheduler, self.battery_system, self.communicator, self.battery_manager)
+
+    def test_hours_run_in_seconds(self):
+        for module in self.battery_system.battery_modules:
+            module.chip_temp.update(30.0)
+            module.module_temp1.update(20.0)
+            module.module_temp2.update(20.0)
+            module.update_esp_uptime(0)
+            module.update_cell_voltages([3.7] * 3)
+
+        started = time.perf_counter()
+        with patch('builtins.print'):
+            self.scheduler.run_virtual(BatteryManager.ESP_TIMEOUT_CRITICAL_SECONDS - 10)
+            self.communicator.open_battery_relays.assert_not_called()
+            self.scheduler.run_virtual(20)
+        self.assertLess(time.perf_counter() - started, 30.0)
+
+        self.communicator.open_battery_relays.assert_called_once()
+        self.assertEqual(self.communicator.send_heartbeat.call_count, BatteryManager.ESP_TIMEOUT_CRITICAL_SECONDS + 11)
+        self.assertTrue(self.battery_system.battery_modules[0].cells[0].voltage.age_seconds() > 7200)
+
+    def test_statistics_are_logged(self):
+        self.communicator.ingest_statistics.return_value = {'received': 0}
+        self.communicator.publish_statistics.return_value = {'sent': 0}
+        with patch('builtins.print') as mock_print:
+            self.scheduler.run_virtual(301)
+        lines = [line for call in mock_print.call_args_list for line in str(call.args[0]).split('\n')
+                 if line.startswith('statistics ')]
+        self.assertEqual(len(lines), 1)
+        statistics = json.loads(lines[0].removeprefix('statistics '))
+        self.assertEqual(set(statistics), {'tasks', 'ingest', 'publish', 'balancing', 'accurate_readings', 'alarms'})
+        self.assertIn('balance', statistics['tasks'])
+        self.assertIn('duty_cycle', statistics['balancing']['0'])
+
+
+if __name__ == '__main__':
+    unittest.main()
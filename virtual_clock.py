@@ -0,0 +1,72 @@
+import asyncio
+import heapq
+import itertools
+import threading
+import time
+from typing import Callable
+
+
+def wall_clock() -> float:
+    # Default clock, looks time.time up on every call so patching it keeps working
+    return time.time()
+
+
+class VirtualTimer:
+    def __init__(self, when: float, callback: Callable[[], None]) -> None:
+        self.when: float = when
+        self.callback: Callable[[], None] = callback
+        self.cancelled: bool = False
+
+    def cancel(self) -> None:
+        self.cancelled = True
+
+
+class VirtualClock:
+    # Drop-in for time.time that only moves when advanced, so hours of pack behaviour run as fast as the work allows.
+    # Timers started with call_later fire from advance_to in deadline order, with the clock set to their deadline.
+    def __init__(self, start: float = 0.0) -> None:
+        self._now: float = start
+        self._timers: list[tuple[float, int, VirtualTimer]] = []
+        self._sequence = itertools.count()
+
+    def __call__(self) -> float:
+        return self._now
+
+    def call_later(self, delay: float, callback: Callable[[], None]) -> VirtualTimer:
+        timer = VirtualTimer(self._now + max(0.0, delay), callback)
+        heapq.heappush(self._timers, (timer.when, next(self._sequence), timer))
+        return timer
+
+    def next_timer(self) -> float | None:
+        while self._timers and self._timers[0][2].cancelled:
+            heapq.heappop(self._timers)
+        return self._timers[0][0] if self._timers else None
+
+    def advance_to(self, when: float) -> None:
+        while True:
+            next_timer = self.next_timer()
+            if next_timer is None or next_timer > when:
+                break
+            _, _, timer = heapq.heappop(self._timers)
+            self._now = max(self._now, timer.when)
+            timer.callback()
+        self._now = max(self._now, when)
+
+    def advance(self, seconds: float) -> None:
+        self.advance_to(self._now + seconds)
+
+
+def call_later(clock: Callable[[], float], delay: float,
+               callback: Callable[[], None]) -> VirtualTimer | asyncio.TimerHandle | threading.Timer:
+    # One-shot timer on the given clock. For wall-clock time it runs on the calling thread's event loop in the
+    # asyncio runtime, so the callback shares the loop with everything else, and on a daemon thread otherwise.
+    if isinstance(clock, VirtualClock):
+        return clock.call_later(delay, callback)
+    try:
+        return asyncio.get_running_loop().call_later(max(0.0, delay), callback)
+    except RuntimeError:
+        pass
+    timer = threading.Timer(max(0.0, delay), callback)
+    timer.daemon = True
+    timer.start()
+    return timer